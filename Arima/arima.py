@@ -1,14 +1,15 @@
 # 使用arima预测时间序列
+import os
 import numpy as np
 import sys
-from pmdarima.arima import auto_arima
 import json
 import argparse
-import sqlite3
-import pymysql as mysql
 
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db
+
 log_file_path = 'arima.log'
 # 日志配置
 logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -40,14 +41,8 @@ class ARIMA:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database'] 
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port, user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         table_name = self.config['db']['in']['values']
@@ -63,7 +58,7 @@ class ARIMA:
 
         # 关闭数据库连接
         cursor.close()
-        conn.close()
+        db.release(conn)
     
     # 写入数据到数据库
     def write_data_to_db(self):
@@ -75,14 +70,8 @@ class ARIMA:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database'] 
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port, user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         table_name = self.config['db']['out']['values']
@@ -100,11 +89,12 @@ class ARIMA:
 
         # 关闭数据库连接
         cursor.close()
-        conn.close()
+        db.release(conn)
     
     def read_data_from_sqlite(self):
         # 从sqlite中读取数据
         # 连接数据库文件
+        import sqlite3
         conn = sqlite3.connect(self.config['sqlite']['values']['path'])
 
         table_name = self.config['sqlite']['in']['values']
@@ -129,6 +119,7 @@ class ARIMA:
     def write_data_to_sqlite(self):
         # 将数据写入sqlite
         # 连接数据库文件
+        import sqlite3
         conn = sqlite3.connect(self.config['sqlite']['values']['path'])
         cursor = conn.cursor()
 
@@ -161,6 +152,9 @@ class ARIMA:
     
 
     def arima_predict(self, data, output_length=1):
+        # pmdarima 导入较慢，只在预测时导入
+        from pmdarima.arima import auto_arima
+
         # data 为一维数组
         # input_length 为输入数据长度
         # output_length 为输出数据长度
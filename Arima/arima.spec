@@ -1,4 +1,5 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
 
 block_cipher = None
@@ -6,7 +7,7 @@ block_cipher = None
 
 a = Analysis(
     ['arima.py'],
-    pathex=[],
+    pathex=[os.path.abspath(os.path.join(SPECPATH, '..'))],
     binaries=[],
     datas=[],
     hiddenimports=[],
@@ -0,0 +1,215 @@
+# 下泄流量优化: 在泄水建筑物的流量分级(董铺 43/130/311，大房郢 63/144/888)之内搜索泄量上限
+# 或分时段的泄量过程，使最高库水位(level)或最大下泄流量(outflow)最小
+# 候选方案用蓄量指示曲线批量演算，差分进化按种群并行评价
+#
+# 候选方案演算时泄量超过上限按上限下泄，库容由水量平衡求得; FloodControlStatic 按上限下泄后由泄流曲线反推水位，
+# 不满足水量平衡，两者的水位可能相差很大(后者偏低)。最优方案再用 FloodControlStatic 的调洪演算校核，两种结果一并输出
+# level 目标下最高水位随泄量上限单调递减，最优解即为所选建筑物分级的上限 q_high; 需要权衡下游时用 outflow 目标并给出 z_limit
+import os
+import sys
+import copy
+import json
+import argparse
+import logging
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import evolution, zv_table
+
+import routing
+from water_control_static import FloodControlStatic
+
+log_file_path = 'release_optimizer.log'
+# 日志配置
+logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 水库类型 -> 配置中的起调参数
+RESERVOIRS = {"0": "dongpu", "1": "dafangying"}
+
+# 泄水建筑物开启的流量分级, 与 FloodControlStatic.run 中的判断一致
+BUILDING_THRESHOLDS = {"0": [43, 130, 311], "1": [63, 144, 888]}
+
+
+# 优化目标: 对 (N, K) 的候选泄量过程批量演算，返回 (N,) 的目标值(越小越好)
+# 超过水位上限的部分按 penalty 倍计入目标
+class ReleaseObjective():
+    def __init__(self, table, Q, tguo, z0, objective="level", z_limit=None, penalty=1000000) -> None:
+        self.table = table
+        self.Q = np.asarray(Q, dtype=float)
+        self.tguo = np.asarray(tguo, dtype=float)
+        self.z0 = z0
+        self.objective = objective
+        self.z_limit = z_limit
+        self.penalty = penalty
+
+    # 把 K 段的泄量过程展开到每个时刻
+    def caps_of(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        block = np.arange(len(self.Q)) * X.shape[1] // len(self.Q)
+        return X[:, block]
+
+    def route(self, X):
+        return self.table.route_batch(self.Q, self.tguo, self.z0, self.caps_of(X))
+
+    def __call__(self, X):
+        z, v, q = self.route(X)
+        z_peak = z.max(axis=1)
+
+        scores = z_peak if self.objective == "level" else q.max(axis=1)
+        if self.z_limit is not None:
+            scores = scores + self.penalty * np.maximum(z_peak - self.z_limit, 0)
+        return scores
+
+
+class ReleaseOptimizer():
+    def __init__(self, args) -> None:
+        self.args = args
+        self.flood = FloodControlStatic(args)
+        self.config = self.flood.config
+        self.setting = self.config["setting"]["release_optimizer"]["values"]
+
+        self.table = None
+        self.result = {}
+
+    def load_data(self):
+        self.flood.load_data_from_monitor_db()
+        self.flood.read_data_from_db()
+
+        if len(self.flood.flood_value) == 0:
+            print("flood of scene {} is empty".format(self.args.scene))
+            logging.error("flood of scene {} is empty".format(self.args.scene))
+            exit(1)
+
+        reservoir = RESERVOIRS[self.args.type]
+        z_qz = self.config['setting']['QZ_table']["values"][reservoir]["Z"]
+        q_qz = self.config['setting']['QZ_table']["values"][reservoir]["Q"]
+
+        zv = zv_table.ZVTable(self.flood.z_table, self.flood.v_table)
+        self.table = routing.get_indicator_table(
+            self.args.type, getattr(self.flood, "zv_type", None), zv, z_qz, q_qz)
+
+    def run(self):
+        # 泄量上限不超过所选的建筑物流量分级
+        thresholds = BUILDING_THRESHOLDS[self.args.type]
+        q_high = thresholds[self.args.building] if self.args.building is not None else thresholds[-1]
+        q_low = float(self.setting["min_release"])
+
+        z0 = float(self.args.z) if self.args.z is not None else \
+            float(self.config["setting"][RESERVOIRS[self.args.type]]["values"]["z"])
+        z_limit = self.args.z_limit if self.args.z_limit is not None else self.setting["z_limit"].get(self.args.type)
+
+        objective = ReleaseObjective(self.table, self.flood.flood_value, self.flood.flood_time, z0,
+                                     self.args.objective, z_limit)
+
+        de = evolution.DifferentialEvolution(
+            objective, [(q_low, q_high)] * self.args.blocks,
+            pop_size=self.setting["pop_size"] if self.setting["pop_size"] > 0 else None,
+            max_iter=self.args.max_iter if self.args.max_iter is not None else self.setting["max_iter"],
+            seed=self.args.seed,
+            workers=self.args.workers if self.args.workers is not None else self.setting["workers"])
+
+        best_x, best_score = de.run()
+        z, v, q = objective.route(best_x)
+
+        self.result["caps"] = objective.caps_of(best_x)[0].tolist()
+        self.result["schedule"] = best_x.tolist()
+        self.result["score"] = best_score
+        self.result["z"] = z[0].tolist()
+        self.result["v"] = v[0].tolist()
+        self.result["q"] = q[0].tolist()
+        self.result["z_peak"] = float(z[0].max())
+        self.result["q_peak"] = float(q[0].max())
+        self.result["iteration"] = de.iteration
+
+        print("z peak: {}, q peak: {}, schedule: {}".format(
+            self.result["z_peak"], self.result["q_peak"], self.result["schedule"]))
+        logging.info("z peak: {}, q peak: {}, schedule: {}".format(
+            self.result["z_peak"], self.result["q_peak"], self.result["schedule"]))
+
+        # 用 FloodControlStatic 的调洪演算校核最优方案
+        z_static, v_static, q_static = self.validate(self.result["caps"], z0)
+        self.result["static"] = {
+            "z": z_static,
+            "v": v_static,
+            "q": q_static,
+            "z_peak": float(max(z_static)),
+            "q_peak": float(max(q_static)),
+        }
+
+        print("static z peak: {}, q peak: {}".format(self.result["static"]["z_peak"], self.result["static"]["q_peak"]))
+        logging.info("static z peak: {}, q peak: {}".format(
+            self.result["static"]["z_peak"], self.result["static"]["q_peak"]))
+
+        if abs(self.result["static"]["z_peak"] - self.result["z_peak"]) > self.setting["static_tolerance"]:
+            print("z peak {} differs from FloodControlStatic {}".format(
+                self.result["z_peak"], self.result["static"]["z_peak"]))
+            logging.warning("z peak {} differs from FloodControlStatic {}".format(
+                self.result["z_peak"], self.result["static"]["z_peak"]))
+
+        if z_limit is not None and self.result["z_peak"] > z_limit:
+            print("z peak {} above limit {}".format(self.result["z_peak"], z_limit))
+            logging.warning("z peak {} above limit {}".format(self.result["z_peak"], z_limit))
+
+        return self.result
+
+    # FloodControlStatic 的调洪演算, caps 为各时刻的泄量上限，返回 (z, v, q)
+    def validate(self, caps, z0):
+        args = copy.copy(self.args)
+        args.z = z0
+        args.max_out_users = [float(x) for x in caps]
+
+        self.flood.args = args
+        self.flood.z = [z0]
+        try:
+            if self.args.type == "0":
+                z, v, q = self.flood.cal_flood_dongpu(self.flood.z_table, self.flood.v_table, None, None, None,
+                                                      self.flood.flood_value, self.flood.flood_time)
+            else:
+                z, v, q = self.flood.cal_flood_dafangying(self.flood.z_table, self.flood.v_table, None, None, None,
+                                                          self.flood.flood_value, self.flood.flood_time)
+        finally:
+            self.flood.args = self.args
+
+        return z, v, q
+
+    def write_result(self):
+        with open(self.args.output, 'w', encoding="utf-8") as f:
+            json.dump(self.result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    # 打包为exe后进程池需要
+    multiprocessing.freeze_support()
+    try:
+        parser = argparse.ArgumentParser("Flood release optimizer")
+        parser.add_argument('--config', type=str, default='./water_control_config.json', help='config file')
+        parser.add_argument("--type", type=str, default="0", help="0: dongpu, 1: dafangying", choices=["0", "1"])
+        parser.add_argument("--scene", type=str, required=True, help="design scene, e.g. 100")
+        parser.add_argument("--z", type=float, default=None, help="start water level, default from config")
+        parser.add_argument("--objective", type=str, default="level", choices=["level", "outflow"],
+                            help="minimize peak water level (optimum is the building threshold) or peak outflow")
+        parser.add_argument("--building", type=int, default=None, choices=[0, 1, 2],
+                            help="highest building threshold of the release, default the last one")
+        parser.add_argument("--blocks", type=int, default=1, help="blocks of the release schedule, 1 for a constant cap")
+        parser.add_argument("--z_limit", type=float, default=None, help="max water level, default from config")
+        parser.add_argument("--max_iter", type=int, default=None, help="max iteration")
+        parser.add_argument("--workers", type=int, default=None, help="process count, 0 for all cores")
+        parser.add_argument("--seed", type=int, default=None, help="random seed")
+        parser.add_argument("--output", type=str, default="./release_optimized.json", help="output file")
+
+        args = parser.parse_args()
+
+        print(args.__dict__)
+        logging.info(args.__dict__)
+
+        optimizer = ReleaseOptimizer(args)
+        optimizer.load_data()
+        optimizer.run()
+        optimizer.write_result()
+
+        print("{\"complete\":true}")
+        logging.info("{\"complete\":true}")
+    except Exception as e:
+        print(e)
+        logging.error(e)
@@ -0,0 +1,361 @@
+# 调洪演算求解: 时段末下泄流量 q2 满足水量平衡
+#   (Q1 + Q2) + 2 * 100000000 * (v1 - V(q2)) / (t * 3600) - q1 - q2 = 0
+# V(q2) 为由泄流曲线(q -> Z)和水位库容曲线(Z -> V)得到的库容，在泄流曲线泄量相同的点(如董铺 43m³/s)之间单调增加，
+# 方程左侧在这些点之间单调递减; 泄量相同的点处 q -> Z 插值不连续，残差在该处可能回升
+#
+# 求解方法(配置文件 setting.routing.method):
+#   grid  在试算的网格(起点逐次加 step)上按单调段二分，得到与原逐步试算(每次加 step，直到残差不大于 step)相同的结果
+#   brent 用 Brent 法求方程的根，精度为 tolerance
+#   table 查蓄量指示曲线(2V/Δt + q)，每个时段一次插值，结果为方程的精确解
+import numpy as np
+
+# 默认求解方法
+DEFAULT_METHOD = "grid"
+# 默认试算步长(m³/s)，与原试算方法相同
+DEFAULT_STEP = 0.01
+# 默认求根精度(m³/s)
+DEFAULT_TOLERANCE = 0.001
+
+
+# 配置文件 setting.routing 中的求解方法、试算步长和求根精度, 返回 (method, step, tol)
+def settings(config):
+    if "routing" not in config["setting"].keys():
+        return DEFAULT_METHOD, DEFAULT_STEP, DEFAULT_TOLERANCE
+
+    values = config["setting"]["routing"]["values"]
+    method = values.get("method", DEFAULT_METHOD)
+    if method not in ["grid", "brent", "table"]:
+        raise ValueError("unknown routing method {}".format(method))
+
+    return method, float(values.get("step", DEFAULT_STEP)), float(values.get("tolerance", DEFAULT_TOLERANCE))
+
+
+# 水量平衡残差
+def balance(q2, Q1, Q2, v1, q1, t, v_of_q):
+    return (Q1 + Q2) + 2 * 100000000 * (v1 - v_of_q(q2)) / (t * 3600) - q1 - q2
+
+
+# 求时段末下泄流量, Q1、Q2 为时段初、末入库流量，v1、q1 为时段初库容和下泄流量，t 为时段长(小时)
+# v_of_q 为下泄流量对应的库容; q_start 为试算起点，起点已满足水量平衡(退水段)时取起点值
+# q_max 为泄流曲线的最大流量(不外延时), 为 None 时泄流曲线外延，向上扩大求解区间; step 为 0 时用 Brent 法
+# breaks 为泄流曲线中重复出现的泄量(见 flat_flows)，残差只在这些点之间单调
+def solve_outflow(Q1, Q2, v1, q1, t, v_of_q, q_start, q_max=None, tol=DEFAULT_TOLERANCE, step=DEFAULT_STEP,
+                  breaks=()):
+    def f(q2):
+        return balance(q2, Q1, Q2, v1, q1, t, v_of_q)
+
+    if step > 0:
+        return grid_outflow(f, q_start, q_max, step, breaks)
+
+    if f(q_start) <= 0:
+        return q_start
+
+    if q_max is not None:
+        if f(q_max) > 0:
+            raise ValueError("outflow above the maximum {} of the QZ table".format(q_max))
+        upper = q_max
+    else:
+        upper = max(2 * q_start, Q1 + Q2, 1)
+        for i in range(64):
+            if f(upper) <= 0:
+                break
+            upper *= 2
+        else:
+            raise ValueError("outflow is not bracketed")
+
+    if f(upper) == 0:
+        return upper
+
+    from scipy import optimize
+    return optimize.brentq(f, q_start, upper, xtol=tol)
+
+
+# 泄流曲线中重复出现的泄量(水平段), 按从小到大排列
+def flat_flows(q_qz):
+    q_qz = [float(x) for x in q_qz]
+    return sorted(set(x for x in q_qz if q_qz.count(x) > 1))
+
+
+# 试算网格: 与原试算相同，第 k 个点由起点逐次累加 k 次 step 得到(与 q_start + k * step 有舍入差别，
+# 在泄流曲线不连续处会落在不同一侧)，按需延长
+class TrialGrid():
+    def __init__(self, q_start, step) -> None:
+        self.q_start = q_start
+        self.step = step
+        self.points = np.array([float(q_start)])
+
+    def __call__(self, k):
+        if k >= len(self.points):
+            n = max(k + 1, 2 * len(self.points))
+            self.points = np.cumsum(np.concatenate(([float(self.q_start)], np.full(n - 1, float(self.step)))))
+        return float(self.points[k])
+
+
+# 试算网格上第一个残差不大于 step 的点
+# 残差在 breaks 之间单调递减: 逐段检查段末的点，在第一个包含解的段内二分; 紧邻 break 的点单独判断
+def grid_outflow(f, q_start, q_max, step, breaks=()):
+    if f(q_start) <= step:
+        return q_start
+
+    grid = TrialGrid(q_start, step)
+
+    # 残差在 lo 处大于 step
+    lo = 0
+    for b in breaks:
+        # 与 b 相差在舍入误差内的网格点也作为紧邻 break 的点
+        kb = int(np.floor((b - q_start) / step + 1e-6))
+        if kb <= lo or (q_max is not None and b >= q_max):
+            continue
+
+        # lo ~ kb - 1 在同一单调段内
+        if kb - 1 > lo and f(grid(kb - 1)) <= step:
+            return grid(bisect_grid(f, grid, step, lo, kb - 1))
+        if f(grid(kb)) <= step:
+            return grid(kb)
+        lo = kb
+
+    # 残差在 hi 处不大于 step
+    if q_max is not None:
+        hi = int((q_max - q_start) / step)
+        if hi <= lo or f(grid(hi)) > step:
+            raise ValueError("outflow above the maximum {} of the QZ table".format(q_max))
+    else:
+        hi = lo + 1
+        for i in range(64):
+            if f(grid(hi)) <= step:
+                break
+            lo = hi
+            hi = 2 * hi
+        else:
+            raise ValueError("outflow is not bracketed")
+
+    return grid(bisect_grid(f, grid, step, lo, hi))
+
+
+# 单调段内二分, 残差在 lo 处大于 step，在 hi 处不大于 step，返回第一个不大于 step 的网格序号
+def bisect_grid(f, grid, step, lo, hi):
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if f(grid(mid)) <= step:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+# 一维线性插值, 两端按首末段外延
+def interp_linear(x, xp, fp):
+    y = np.interp(x, xp, fp)
+    y = np.where(x < xp[0], fp[0] + (x - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0]), y)
+    y = np.where(x > xp[-1], fp[-1] + (x - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2]), y)
+    return y
+
+
+# 蓄量指示曲线 N(z) = 2 * 100000000 * V(z) / (t * 3600) + q(z)，随水位单调增加，水量平衡改写为
+#   N(z2) = (Q1 + Q2) + 2 * 100000000 * v1 / (t * 3600) - q1
+# 水位网格取泄流曲线和水位库容曲线的全部节点，q(z)、V(z) 在网格上均为分段线性，查表结果即为方程的精确解;
+# 以水位为自变量，泄流曲线中泄量相同的水平段(如董铺 43m³/s)也能正确处理
+class IndicatorTable():
+    def __init__(self, zv, z_qz, q_qz, extrapolate=False) -> None:
+        z_qz = np.asarray(z_qz, dtype=float)
+        q_qz = np.asarray(q_qz, dtype=float)
+        order = np.argsort(z_qz, kind="mergesort")
+        z_qz, q_qz = z_qz[order], q_qz[order]
+
+        # 外延时取两条曲线的并集范围, 否则取交集
+        if extrapolate:
+            low, high = min(z_qz[0], zv.z_min), max(z_qz[-1], zv.z_max)
+        else:
+            low, high = max(z_qz[0], zv.z_min), min(z_qz[-1], zv.z_max)
+
+        z = np.unique(np.concatenate([z_qz, zv.z]))
+        self.z = z[(z >= low) & (z <= high)]
+        if len(self.z) < 2:
+            raise ValueError("QZ table and ZV table do not overlap")
+
+        self.q = interp_linear(self.z, z_qz, q_qz)
+        self.v = np.asarray(zv.v_of_z(self.z), dtype=float)
+        self.extrapolate = extrapolate
+
+        # 时段长 -> 指示曲线
+        self._indicator = {}
+
+    # 时段长 t(小时) 的指示曲线
+    def indicator(self, t):
+        t = float(t)
+        if t not in self._indicator.keys():
+            self._indicator[t] = 2 * 100000000 * self.v / (t * 3600) + self.q
+        return self._indicator[t]
+
+    # 由指示值查时段末水位
+    def z_of_indicator(self, n, t):
+        curve = self.indicator(t)
+        if not self.extrapolate and np.any(np.asarray(n) > curve[-1]):
+            raise ValueError("outflow above the maximum {} of the QZ table".format(self.q[-1]))
+        if self.extrapolate:
+            return interp_linear(n, curve, self.z)
+        return np.interp(n, curve, self.z)
+
+    # 求时段末下泄流量和水位，参数与 solve_outflow 相同，返回 (q2, z2)
+    # 下泄流量小于 q_start 时取 q_start，水位取其对应的值
+    def outflow(self, Q1, Q2, v1, q1, t, q_start):
+        n = (Q1 + Q2) + 2 * 100000000 * v1 / (t * 3600) - q1
+        z2 = float(self.z_of_indicator(n, t))
+        q2 = float(interp_linear(z2, self.z, self.q)) if self.extrapolate else float(np.interp(z2, self.z, self.q))
+        if q2 < q_start:
+            return q_start, float(np.interp(q_start, self.q, self.z))
+        return q2, z2
+
+    # 整个入库过程的调洪演算, Q 为入库流量，tguo 为时刻(小时)，z0 为起调水位; 返回 (z, v, q)
+    def route(self, Q, tguo, z0):
+        Q = np.asarray(Q, dtype=float)
+        t = np.diff(np.asarray(tguo, dtype=float))
+
+        z = np.empty(len(Q))
+        z[0] = z0
+        for i in range(len(Q) - 1):
+            v1 = float(interp_linear(z[i], self.z, self.v))
+            q1 = float(interp_linear(z[i], self.z, self.q))
+            n = (Q[i] + Q[i + 1]) + 2 * 100000000 * v1 / (t[i] * 3600) - q1
+            z[i + 1] = float(self.z_of_indicator(n, t[i]))
+
+        return z, interp_linear(z, self.z, self.v), interp_linear(z, self.z, self.q)
+
+    # 多组泄量上限同时演算, caps 为 (N, n) 的各时刻泄量上限; 自由泄流超过上限时按上限下泄，由水量平衡求库容
+    # 超出曲线范围时按首末段外延; 返回 (z, v, q)，均为 (N, n)
+    def route_batch(self, Q, tguo, z0, caps):
+        Q = np.asarray(Q, dtype=float)
+        t = np.diff(np.asarray(tguo, dtype=float))
+        caps = np.asarray(caps, dtype=float)
+
+        z = np.empty(caps.shape)
+        v = np.empty(caps.shape)
+        q = np.empty(caps.shape)
+        z[:, 0] = z0
+        v[:, 0] = interp_linear(z0, self.z, self.v)
+        q[:, 0] = np.minimum(interp_linear(z0, self.z, self.q), caps[:, 0])
+
+        for i in range(len(Q) - 1):
+            n = (Q[i] + Q[i + 1]) + 2 * 100000000 * v[:, i] / (t[i] * 3600) - q[:, i]
+            z_free = interp_linear(n, self.indicator(t[i]), self.z)
+            q_free = interp_linear(z_free, self.z, self.q)
+
+            over = q_free > caps[:, i + 1]
+            q[:, i + 1] = np.where(over, caps[:, i + 1], q_free)
+            v_cap = v[:, i] + ((Q[i] + Q[i + 1]) - (q[:, i] + q[:, i + 1])) * t[i] * 3600 / 2 / 100000000
+            v[:, i + 1] = np.where(over, v_cap, interp_linear(z_free, self.z, self.v))
+            z[:, i + 1] = np.where(over, interp_linear(v[:, i + 1], self.v, self.z), z_free)
+
+        return z, v, q
+
+
+# 进程内缓存, 键为 (WATER_TYPE, ZV_TYPE, 泄流曲线, 是否外延)
+_indicator_tables = {}
+
+
+def get_indicator_table(water_type, zv_type, zv, z_qz, q_qz, extrapolate=False):
+    # 水位库容表版本未知时不缓存
+    if zv_type is None:
+        return IndicatorTable(zv, z_qz, q_qz, extrapolate)
+
+    key = (str(water_type), str(zv_type), tuple(z_qz), tuple(q_qz), extrapolate)
+    if key not in _indicator_tables.keys():
+        _indicator_tables[key] = IndicatorTable(zv, z_qz, q_qz, extrapolate)
+    return _indicator_tables[key]
+
+
+def clear_indicator_tables():
+    _indicator_tables.clear()
+
+
+# 按配置的求解方法返回时段末下泄流量和水位的求解函数 solve(Q1, Q2, v1, q1, t, q_start) -> (q2, z2)
+# zv 为水位库容表，z_qz、q_qz 为泄流曲线，v_of_q 为下泄流量对应的库容，extrapolate 为泄流曲线是否外延
+# z_of_q 为泄量对应的水位(grid、brent 由 q2 求 z2)，table 的水位为查表得到的时段末水位
+def outflow_solver(config, zv, z_qz, q_qz, v_of_q, extrapolate=False, water_type=None, zv_type=None, z_of_q=None):
+    method, step, tol = settings(config)
+
+    if method == "table":
+        return get_indicator_table(water_type, zv_type, zv, z_qz, q_qz, extrapolate).outflow
+
+    q_max = None if extrapolate else max(q_qz)
+    step = step if method == "grid" else 0
+    breaks = flat_flows(q_qz)
+
+    def solve(Q1, Q2, v1, q1, t, q_start):
+        q2 = solve_outflow(Q1, Q2, v1, q1, t, v_of_q, q_start, q_max, tol, step, breaks)
+        return q2, float(z_of_q(q2))
+
+    return solve
+
+
+# 动态调度逐小时更新水位、库容: 泄流曲线取 z = 2.4411 * ln(q) + 16.996，试算起点 q_start，时段长 1 小时
+# 与原试算相同，第一次判断时库容取时段初泄量对应的值; 已满足水量平衡时返回时段初泄量对应的水位、库容和起点泄量
+class RoutingStep():
+    def __init__(self, zv, step=DEFAULT_STEP, q_start=10, t=1) -> None:
+        # zv 为当前 ZV_TYPE 的水位库容表(外延)
+        self.zv = zv
+        self.step = step
+        self.q_start = q_start
+        self.k = 2 * 100000000 / (t * 3600)
+
+    def z_of_q(self, q):
+        return 2.4411 * np.log(q) + 16.996
+
+    # 单个时段, 返回 (z_next, v_next, q_next)
+    def __call__(self, q_now, z_now, Q_now, Q_next):
+        v_now = float(self.zv.v_of_z(z_now))
+        z_next = float(self.z_of_q(q_now))
+        v_next = float(self.zv.v_of_z(z_next))
+
+        if (Q_now + Q_next) + self.k * (v_now - v_next) - q_now - self.q_start <= self.step:
+            return z_next, v_next, self.q_start
+
+        def f(q):
+            return (Q_now + Q_next) + self.k * (v_now - float(self.zv.v_of_z(float(self.z_of_q(q))))) - q_now - q
+
+        # 起点已判断，从起点加一个步长开始
+        q_next = grid_outflow(f, self.q_start + self.step, None, self.step)
+        z_next = float(self.z_of_q(q_next))
+        return z_next, float(self.zv.v_of_z(z_next)), q_next
+
+    # 多个相互独立的时段, 参数为等长数组，返回 (z_next, v_next, q_next) 数组
+    def route(self, q_now, z_now, Q_now, Q_next):
+        q_now = np.asarray(q_now, dtype=float)
+        inflow = np.asarray(Q_now, dtype=float) + np.asarray(Q_next, dtype=float)
+        v_now = np.asarray(self.zv.v_of_z(np.asarray(z_now, dtype=float)), dtype=float)
+
+        # 试算网格上第 k 个点的残差
+        def f(k):
+            q = self.q_start + k * self.step
+            return inflow + self.k * (v_now - self.zv.v_of_z(self.z_of_q(q))) - q_now - q
+
+        # 残差在 lo 处大于 step, 在 hi 处不大于 step; lo = 0 只作为下界, 从 k = 1 开始试算
+        lo = np.zeros(len(q_now), dtype=np.int64)
+        hi = np.ones(len(q_now), dtype=np.int64)
+        for i in range(64):
+            above = f(hi) > self.step
+            if not np.any(above):
+                break
+            lo = np.where(above, hi, lo)
+            hi = np.where(above, hi * 2, hi)
+        else:
+            raise ValueError("outflow is not bracketed")
+
+        while np.any(hi - lo > 1):
+            mid = (lo + hi) // 2
+            below = f(mid) <= self.step
+            active = hi - lo > 1
+            hi = np.where(active & below, mid, hi)
+            lo = np.where(active & ~below, mid, lo)
+
+        q_next = self.q_start + hi * self.step
+        z_next = self.z_of_q(q_next)
+
+        # 起点已满足水量平衡的时段
+        z_first = self.z_of_q(q_now)
+        v_first = self.zv.v_of_z(z_first)
+        first = inflow + self.k * (v_now - v_first) - q_now - self.q_start <= self.step
+
+        z_next = np.where(first, z_first, z_next)
+        q_next = np.where(first, self.q_start, q_next)
+        return z_next, np.asarray(self.zv.v_of_z(z_next), dtype=float), q_next
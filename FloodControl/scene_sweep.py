@@ -0,0 +1,202 @@
+# 设计洪水全场次调洪演算: 一次查询读取两库全部场次的洪水过程，按场次(以及起调水位、最大下泄流量的组合)
+# 多进程并行计算，结果一次批量写入 reservoir_flood_output
+import os
+import sys
+import json
+import argparse
+import logging
+import multiprocessing
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db
+
+from water_control_static import FloodControlStatic
+
+log_file_path = 'scene_sweep.log'
+# 日志配置
+logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 水库类型 -> 配置中的起调参数
+RESERVOIRS = {"0": "dongpu", "1": "dafangying"}
+
+
+# 计算一个场次, case 为 (参数, 水位表, 库容表, 洪水过程, 洪水过程时间), 返回 (结果, 错误信息)
+def route_case(case):
+    args, z_table, v_table, flood_value, flood_time = case
+    try:
+        flood = FloodControlStatic(args)
+        flood.update(args)
+        flood.z_table = z_table
+        flood.v_table = v_table
+        flood.flood_value = list(flood_value)
+        flood.flood_time = list(flood_time)
+        flood.run()
+        return flood.result, None
+    except SystemExit as e:
+        return None, "exit {}".format(e.code)
+    except Exception as e:
+        return None, str(e)
+
+
+# 逗号分隔的数值列表
+def float_list(text):
+    return [float(x) for x in str(text).split(",") if x.strip() != ""]
+
+
+class SceneSweep():
+    def __init__(self, args) -> None:
+        self.args = args
+        self.config = None
+        self.types = args.type if args.type else list(RESERVOIRS.keys())
+
+        self.zv = {}      # 水库类型 -> (ZV_TYPE, 水位表, 库容表)
+        self.floods = {}  # (水库类型, 场次) -> (洪水过程, 洪水过程时间)
+        self.cases = []   # [(参数, 批次)]
+        self.results = []
+
+        self.load_config()
+
+    def load_config(self):
+        # 从配置文件中读取配置
+        with open(self.args.config, 'r', encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        if "db" not in self.config.keys():
+            print("config db is error")
+            logging.error("config db is error")
+            exit(1)
+
+    # 各水库当前版本的水位库容表
+    def load_data_from_monitor_db(self):
+        for _type in self.types:
+            flood = FloodControlStatic(argparse.Namespace(config=self.args.config, type=_type))
+            flood.load_data_from_monitor_db()
+            self.zv[_type] = (flood.zv_type, flood.z_table, flood.v_table)
+
+    # 一次查询读取全部场次的洪水过程
+    def read_data_from_db(self):
+        conn = db.connect(self.config['db']['values'], "database")
+        cursor = conn.cursor()
+
+        tablename_flood = self.config['db']['in']['values']['rdfh']
+
+        sql = "SELECT * FROM {} WHERE TYPE IN ({})".format(
+            tablename_flood, ", ".join("'{}'".format(x) for x in self.types))
+        cursor.execute(sql)
+
+        columns = [x[0].upper() for x in cursor.description]
+        type_index = columns.index("TYPE")
+        scene_index = columns.index("SCENE")
+
+        self.floods = {}
+        for row in cursor.fetchall():
+            key = (str(row[type_index]), str(row[scene_index]))
+            if self.args.scene and key[1] not in self.args.scene:
+                continue
+            if key not in self.floods.keys():
+                self.floods[key] = ([], [])
+            self.floods[key][0].append(float(row[3]))
+            self.floods[key][1].append(float(row[2]))
+
+        cursor.close()
+        db.release(conn)
+
+        print("load {} scenes".format(len(self.floods)))
+        logging.info("load {} scenes".format(len(self.floods)))
+
+    # 场次与起调水位、最大下泄流量的组合; 组合多于一个时批次号为 批次_起调水位_最大下泄流量
+    def make_cases(self):
+        self.cases = []
+        for (_type, scene) in self.floods.keys():
+            setting = self.config["setting"][RESERVOIRS[_type]]["values"]
+
+            z_list = float_list(self.args.z) if self.args.z else [setting["z"]]
+            max_out_list = float_list(self.args.max_out_users)
+            grid = len(z_list) * len(max_out_list) > 1
+
+            for z in z_list:
+                for max_out_users in max_out_list:
+                    batch = "{}_{}_{}".format(self.args.batch, z, max_out_users) if grid else self.args.batch
+                    args = argparse.Namespace(config=self.args.config, type=_type, scene=scene, batch=batch,
+                                              z=z, v=setting["v"], q=setting["q"], max_out_users=max_out_users,
+                                              max_out_culvert=setting["max_out_culvert"])
+                    self.cases.append(args)
+
+    def run(self):
+        self.make_cases()
+
+        cases = [(args,) + tuple(self.zv[args.type][1:]) + self.floods[(args.type, args.scene)]
+                 for args in self.cases]
+
+        workers = self.args.workers if self.args.workers and self.args.workers > 0 else multiprocessing.cpu_count()
+        workers = min(workers, max(len(cases), 1))
+
+        if workers > 1:
+            with multiprocessing.Pool(workers) as pool:
+                self.results = pool.map(route_case, cases, chunksize=max(len(cases) // (workers * 4), 1))
+        else:
+            self.results = [route_case(case) for case in cases]
+
+        for args, (result, error) in zip(self.cases, self.results):
+            if error is not None:
+                print("type {} scene {} batch {} error: {}".format(args.type, args.scene, args.batch, error))
+                logging.error("type {} scene {} batch {} error: {}".format(args.type, args.scene, args.batch, error))
+
+        print("route {} cases with {} workers".format(len(cases), workers))
+        logging.info("route {} cases with {} workers".format(len(cases), workers))
+
+    # 全部场次的结果一次批量写入
+    def write_data_to_db(self):
+        values = []
+        for args, (result, error) in zip(self.cases, self.results):
+            if result is None:
+                continue
+
+            _zv_type = str(self.zv[args.type][0])
+            for i in range(len(result['z'])):
+                values.append((round(result['z'][i], 3), round(result['v'][i], 3), round(result['q1'][i], 3),
+                               round(result['q2'][i], 3), args.batch, args.scene, args.type, (i + 1),
+                               str(result['out_water_building'][i]), _zv_type))
+
+        table_name = self.config['db']['out']['values']['static']
+
+        conn = db.connect(self.config['db']['values'], "database")
+        db.bulk_upsert(conn, table_name,
+                       ["Z", "V", "Q1", "Q2", "BATCH", "SCENE", "TYPE", "TIME_SERIES", "BUILDING", "ZV_TYPE"],
+                       values, ["Z", "V", "Q1", "Q2"], db.write_chunk_size(self.config))
+        db.release(conn)
+
+        print("write {} rows to {}".format(len(values), table_name))
+        logging.info("write {} rows to {}".format(len(values), table_name))
+
+
+if __name__ == "__main__":
+    # 打包为exe后进程池需要
+    multiprocessing.freeze_support()
+    try:
+        parser = argparse.ArgumentParser("Flood control design scene sweep")
+        parser.add_argument('--config', type=str, default='./water_control_config.json', help='config file')
+        parser.add_argument("--type", type=str, action="append", default=None,
+                            help="0: dongpu, 1: dafangying, repeatable, default both", choices=["0", "1"])
+        parser.add_argument("--scene", type=str, action="append", default=None, help="scene, repeatable, default all")
+        parser.add_argument("--batch", type=str, default="10000", help="batch id")
+        parser.add_argument("--z", type=str, default=None, help="start water levels, comma separated, default from config")
+        parser.add_argument("--max_out_users", type=str, default="100000", help="max outflows, comma separated")
+        parser.add_argument("--workers", type=int, default=0, help="process count, 0 for all cores")
+
+        args = parser.parse_args()
+
+        print(args.__dict__)
+        logging.info(args.__dict__)
+
+        sweep = SceneSweep(args)
+        sweep.load_data_from_monitor_db()
+        sweep.read_data_from_db()
+        sweep.run()
+        sweep.write_data_to_db()
+
+        print("{\"complete\":true}")
+        logging.info("{\"complete\":true}")
+    except Exception as e:
+        print(e)
+        logging.error(e)
@@ -2,14 +2,15 @@
 import os
 import argparse
 import json
-import sqlite3
-import math
-from scipy import interpolate
-import pymysql as mysql
 import datetime
 import logging
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db, zv_table
+
+import routing
+
 log_file_path = 'water_control_dynamic.log'
 # 日志配置
 logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -53,20 +54,13 @@ class FloodControlStatic:
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database_monitor']
-
             tablename_zv = self.config['db']['in']['values']['zv']
             tablename_version_zv = self.config['db']['in']['values']['zv_version']
 
             tablename_info = self.config['db']['in']['values']['reservoir_info']
 
             try:
-                conn = mysql.connect(
-                    host=address, port=port, user=user, password=password, database=database)
+                conn = db.connect(self.db_config, "database_monitor")
             except BaseException as e:
                 print("connect to mysql error: {}".format(e))
                 logging.error("connect to mysql error: {}".format(e))
@@ -90,41 +84,34 @@ class FloodControlStatic:
                     break
 
             print("zv type: {}".format(self.zv_type))
-            # 获取z和v
-            sql = "SELECT (RZ) FROM {} WHERE WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
-                tablename_zv, self.args.type, self.zv_type)
-            cursor.execute(sql)
-
-            self.z_table = [float(row[0]) for row in cursor.fetchall()]
+            # 获取z和v, 同一版本的水位库容表只查询一次
+            self.zv = zv_table.get_zv_table(self.args.type, self.zv_type)
+            if self.zv is None:
+                zv = db.select_columns(cursor, tablename_zv, ["RZ", "W"], "WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
+                    self.args.type, self.zv_type))
 
-            sql = "SELECT (W) FROM {} WHERE WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
-                tablename_zv, self.args.type, self.zv_type)
-            cursor.execute(sql)
+                self.z_table = [float(x) for x in zv["RZ"]]
+                self.v_table = [float(x) for x in zv["W"]]
 
-            self.v_table = [float(row[0]) for row in cursor.fetchall()]
+                self.zv = zv_table.set_zv_table(
+                    self.args.type, self.zv_type, self.z_table, self.v_table)
+            else:
+                self.z_table = self.zv.z.tolist()
+                self.v_table = self.zv.v.tolist()
 
             # 将库容从立方米转换为万立方米
             self.v_table = [i/10000 for i in self.v_table]
 
-            # 获取汛线水位
-            sql = "SELECT (LIMIT_LEVEL) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, self.args.type)
-
-            cursor.execute(sql)
-
-            self.limit_level_dataset = float(cursor.fetchall()[0][0])
+            # 获取汛线水位和汛线库容
+            info = db.select_by_water_type(
+                cursor, tablename_info, ["LIMIT_LEVEL", "LIMIT_CAPACITY"], [self.args.type])[str(self.args.type)]
 
-            # 获取汛线库容
-            sql = "SELECT (LIMIT_CAPACITY) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, self.args.type)
-            
-            cursor.execute(sql)
-
-            self.limit_capacity_dataset = float(cursor.fetchall()[0][0])/10000
+            self.limit_level_dataset = float(info["LIMIT_LEVEL"])
+            self.limit_capacity_dataset = float(info["LIMIT_CAPACITY"])/10000
 
             # 关闭数据库
             cursor.close()
-            conn.close()
+            db.release(conn)
 
         except Exception as e:
             print("load data from db error")
@@ -145,15 +132,8 @@ class FloodControlStatic:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database']
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port,
-                             user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         # 读取设计表的对于洪水过程
@@ -231,7 +211,7 @@ class FloodControlStatic:
         # print("supply_value: ", self.supply_value)
 
         cursor.close()
-        conn.close()
+        db.release(conn)
 
     def write_data_to_db(self):
         if "db" not in self.config.keys():
@@ -242,16 +222,8 @@ class FloodControlStatic:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database']
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port,
-                             user=user, password=password, database=database)
-        cursor = conn.cursor()
+        conn = db.connect(self.db_config, "database")
 
         table_name = self.config['db']['out']['values']['dynamic']
 
@@ -271,6 +243,7 @@ class FloodControlStatic:
         flow = self.args.flow
 
         # 插入数据
+        values = []
         for i in range(len(self.result['z'])):
             zi = self.result['z'][i]
             vi = self.result['v'][i]
@@ -289,33 +262,23 @@ class FloodControlStatic:
             # out water building
             building_i = str(self.result['out_water_building'][i])
 
-            # sql = "INSERT INTO {} VALUES ({}, {}, {}, {})".format(table_name, zi, vi, qi)
-            sql = "INSERT INTO {} (STCD, UNITNAME, PLCD, FYMDH, IYMDH, YMDH, Z, W, OTQ1, OTQ2, TYPE, FLAG, SCENE, UUID, BUILDING, ZV_TYPE, FLOW) VALUES ('{}', '{}', '{}', '{}', '{}', '{}', {}, {}, {}, {}, {}, {}, '{}', '{}', '{}', '{}', '{}') ON DUPLICATE KEY UPDATE Z = {}, W = {}, OTQ1 = {}, OTQ2 = {}, FLAG={}, SCENE='{}'".format(
-                table_name, stcd, unitname, batch, fymdh, iymdh, timex, zi, vi, qi1, qi2, _type, 0, scene, uuid, building_i, _zv_type, flow, zi, vi, qi1, qi2, 0, scene)
-            # print(sql)
-            cursor.execute(sql)
+            values.append((stcd, unitname, batch, fymdh, iymdh, str(timex), zi, vi, qi1, qi2,
+                           _type, 0, scene, uuid, building_i, _zv_type, flow))
 
+            # 调整后的出库过程以FLAG=1另存一份(出库流量与FLAG=0相同)
             if flag == 1:
-                qi1_new = self.result['q1_new'][i]
-                qi2_new = self.result['q2_new'][i]
-
-                # 保留三位小数
-                qi1_new = round(qi1_new, 3)
-                qi2_new = round(qi2_new, 3)
-
-                sql = "INSERT INTO {} (STCD, UNITNAME, PLCD, FYMDH, IYMDH, YMDH, Z, W, OTQ1, OTQ2, TYPE, FLAG, SCENE, UUID, BUILDING, ZV_TYPE, FLOW) VALUES ('{}', '{}', '{}', '{}', '{}', '{}', {}, {}, {}, {}, {}, {}, '{}', '{}', '{}', '{}', '{}') ON DUPLICATE KEY UPDATE Z = {}, W = {}, OTQ1 = {}, OTQ2 = {}, FLAG={}, SCENE='{}'".format(
-                    table_name, stcd, unitname, batch, fymdh, iymdh, timex, zi, vi, qi1, qi2, _type, 1, scene, uuid, building_i, _zv_type, flow, zi, vi, qi1, qi2, 1, scene)
+                values.append((stcd, unitname, batch, fymdh, iymdh, str(timex), zi, vi, qi1, qi2,
+                               _type, 1, scene, uuid, building_i, _zv_type, flow))
 
-                # sql = "INSERT INTO {} (STCD, UNITNAME, PLCD, FYMDH, IYMDH, YMDH, Z, W, OTQ1, OTQ2, TYPE, FLAG, SCENE, UUID) VALUES ('{}', '{}', '{}', '{}', '{}', '{}', {}, {}, {}, {}, {}, {}, '{}', '{}') ON DUPLICATE KEY UPDATE Z = {}, W = {}, OTQ1 = {}, OTQ2 = {}, FLAG={}, SCENE='{}'".format(table_name, stcd, unitname, batch, fymdh, iymdh, timex, zi, vi, qi1_new, qi2_new, _type, 1, scene, uuid, zi, vi, qi1_new, qi2_new, 1, scene)
-
-                cursor.execute(sql)
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        db.bulk_upsert(conn, table_name,
+                       ["STCD", "UNITNAME", "PLCD", "FYMDH", "IYMDH", "YMDH", "Z", "W", "OTQ1", "OTQ2",
+                        "TYPE", "FLAG", "SCENE", "UUID", "BUILDING", "ZV_TYPE", "FLOW"],
+                       values, ["Z", "W", "OTQ1", "OTQ2", "FLAG", "SCENE"], db.write_chunk_size(self.config))
+        db.release(conn)
 
     def read_data_from_sqlite(self):
         # 读取数据
+        import sqlite3
         conn = sqlite3.connect(self.config['sqlite']['path']['values'])
         cursor = conn.cursor()
 
@@ -370,6 +333,7 @@ class FloodControlStatic:
         self.sqlite_config = self.config['sqlite']['path']['values']
 
         # 连接数据库
+        import sqlite3
         conn = sqlite3.connect(self.sqlite_config)
         cursor = conn.cursor()
 
@@ -397,9 +361,10 @@ class FloodControlStatic:
 
     # 小洪水dongpu
     def cal_flood_dongpu_minor(self, z11, v11, Q, tguo):
-        v_inter = interpolate.interp1d(z11, v11, kind='linear', fill_value="extrapolate")  # 插值函数
+        zv = zv_table.ZVTable(z11, v11, extrapolate=True)
+        v_inter = zv.v_of_z  # 插值函数
         # 不同库容下的水位插值,zi=z_inter(v[i]),一维线性插值
-        z_inter = interpolate.interp1d(v11, z11, kind='linear', fill_value="extrapolate")
+        z_inter = zv.z_of_v
         z = self.z
         v = [float(v_inter(z[i])) for i in range(len(z))]  # 根据水位插值库容
         q = [float(self.minor_q[0])] * len(Q)
@@ -429,9 +394,10 @@ class FloodControlStatic:
 
     # 小洪水dafangying
     def cal_flood_dafangying_minor(self, z11, v11, Q, tguo):
-        v_inter = interpolate.interp1d(z11, v11, kind='linear', fill_value="extrapolate")  # 插值函数
+        zv = zv_table.ZVTable(z11, v11, extrapolate=True)
+        v_inter = zv.v_of_z  # 插值函数
         # 不同库容下的水位插值,zi=z_inter(v[i]),一维线性插值
-        z_inter = interpolate.interp1d(v11, z11, kind='linear', fill_value="extrapolate")
+        z_inter = zv.z_of_v
         z = self.z
         v = [float(v_inter(z[i])) for i in range(len(z))]  # 根据水位插值库容
         q = [float(self.minor_q[0])] * len(Q)
@@ -461,19 +427,31 @@ class FloodControlStatic:
 
     # 正常场次洪水dongpu
     def cal_flood_dongpu(self, z11, v11, Q, tguo):
-        v_inter = interpolate.interp1d(z11, v11, kind='linear', fill_value="extrapolate")  # 插值函数
+        zv = zv_table.ZVTable(z11, v11, extrapolate=True)
+        v_inter = zv.v_of_z  # 插值函数
         # 不同库容下的水位插值,zi=z_inter(v[i]),一维线性插值
-        z_inter = interpolate.interp1d(v11, z11, kind='linear', fill_value="extrapolate")
+        z_inter = zv.z_of_v
 
         # q-v 曲线
         z_qz = self.config['setting']['QZ_table']["values"]["dongpu"]["Z"]
         q_qz = self.config['setting']['QZ_table']["values"]["dongpu"]["Q"]
 
         # 不同水位下的泄量插值,qi=q_inter(z[i]),一维线性插值
+        from scipy import interpolate
         q_inter_z = interpolate.interp1d(z_qz, q_qz, kind='linear', fill_value="extrapolate")
         # 不同泄量下的水位插值,zi=z_inter(q[i]),一维线性插值
         z_inter_q = interpolate.interp1d(q_qz, z_qz, kind='linear', fill_value="extrapolate")
 
+        # 下泄流量对应的库容, 由泄流曲线和水位库容曲线得到
+        def v_of_q(x):
+            return float(v_inter(z_inter_q(x)))
+
+        # 时段末下泄流量的求解方法
+        solve = routing.outflow_solver(self.config, zv, z_qz, q_qz, v_of_q, True, self.args.type,
+                                       getattr(self, "zv_type", None), z_inter_q)
+        # 查蓄量指示曲线时水位由求解给出，不由泄量反推
+        by_level = routing.settings(self.config)[0] == "table"
+
         z = self.z
         v = [float(v_inter(z[i])) for i in range(len(z))]  # 根据水位插值库容
         q = [float(q_inter_z(z[i])) for i in range(len(z))]  # 根据水位插值泄量
@@ -507,18 +485,16 @@ class FloodControlStatic:
                 z[i + 1] = float(z_inter_q(q[i + 1]))
                 v[i + 1] = float(v_inter(z[i + 1]))
             else:
-                z[i] = float(z_inter_q(q[i]))
+                # 泄流曲线水平段上由泄量反推的水位不唯一，查蓄量指示曲线时沿用上一时段求得的水位
+                if not by_level:
+                    z[i] = float(z_inter_q(q[i]))
                 z[i + 1] = float(z_inter_q(q[i + 1]))
                 v[i] = float(v_inter(z[i]))
                 v[i + 1] = float(v_inter(z[i + 1]))
 
-            # （Q1 + Q2）*t / 2 -（q1 + q2）*t / 2 = v2 - v1
-            while (Q[i] + Q[i + 1]) + 2 * 100000000 * (v[i] - v[i + 1]) / (t[i] * 3600) - q[i] - q[i + 1] > 0.01 and \
-                    (Q[i] + Q[i + 1]) + 2 * 100000000 * (v[i] - v[i + 1]) / (t[i] * 3600) - q[i] >= q[i + 1]:  # 这里的条件判断非常重要,影响了整个取值和精度
-                q[i + 1] += 0.01  # 每次q2加0.01,也说明了取值精度
-                # z[i + 1] = 2.4411 * math.log(q[i + 1]) + 16.996
-                z[i + 1] = float(z_inter_q(q[i + 1]))
-                v[i + 1] = float(v_inter(z[i + 1]))
+            # （Q1 + Q2）*t / 2 -（q1 + q2）*t / 2 = v2 - v1, 由水量平衡求解q2
+            q[i + 1], z[i + 1] = solve(Q[i], Q[i + 1], v[i], q[i], t[i], q[i + 1])
+            v[i + 1] = float(v_inter(z[i + 1]))
 
             z_output.append(a)
             z_output[i + 1] = float(z_inter(v[i + 1]))
@@ -528,19 +504,31 @@ class FloodControlStatic:
     # 正常场次洪水dafangying
     def cal_flood_dafangying(self, z11, v11, Q, tguo):
         # print(z11, v11, Q, tguo)
-        v_inter = interpolate.interp1d(z11, v11, kind='linear', fill_value="extrapolate")  # 插值函数
+        zv = zv_table.ZVTable(z11, v11, extrapolate=True)
+        v_inter = zv.v_of_z  # 插值函数
         # 不同库容下的水位插值,zi=z_inter(v[i]),一维线性插值
-        z_inter = interpolate.interp1d(v11, z11, kind='linear', fill_value="extrapolate")
+        z_inter = zv.z_of_v
 
         # q-v 曲线
         z_qz = self.config['setting']['QZ_table']["values"]["dafangying"]["Z"]
         q_qz = self.config['setting']['QZ_table']["values"]["dafangying"]["Q"]
 
         # 不同水位下的泄量插值,qi=q_inter(z[i]),一维线性插值
+        from scipy import interpolate
         q_inter_z = interpolate.interp1d(z_qz, q_qz, kind='linear', fill_value="extrapolate")
         # 不同泄量下的水位插值,zi=z_inter(q[i]),一维线性插值
         z_inter_q = interpolate.interp1d(q_qz, z_qz, kind='linear', fill_value="extrapolate")
 
+        # 下泄流量对应的库容, 由泄流曲线和水位库容曲线得到
+        def v_of_q(x):
+            return float(v_inter(z_inter_q(x)))
+
+        # 时段末下泄流量的求解方法
+        solve = routing.outflow_solver(self.config, zv, z_qz, q_qz, v_of_q, True, self.args.type,
+                                       getattr(self, "zv_type", None), z_inter_q)
+        # 查蓄量指示曲线时水位由求解给出，不由泄量反推
+        by_level = routing.settings(self.config)[0] == "table"
+
         z = self.z
         v = [float(v_inter(z[i])) for i in range(len(z))]  # 根据水位插值库容
         q = [float(q_inter_z(z[i])) for i in range(len(z))]  # 根据水位插值泄量
@@ -576,46 +564,22 @@ class FloodControlStatic:
                 z[i + 1] = float(z_inter_q(q[i + 1]))
                 v[i + 1] = float(v_inter(z[i + 1]))
             else:
-                z[i] = float(z_inter_q(q[i]))
+                # 泄流曲线水平段上由泄量反推的水位不唯一，查蓄量指示曲线时沿用上一时段求得的水位
+                if not by_level:
+                    z[i] = float(z_inter_q(q[i]))
                 z[i + 1] = float(z_inter_q(q[i + 1]))
                 v[i] = float(v_inter(z[i]))  # 通过水位z 插值得到库容v,把np.array转换为float类型值
                 v[i + 1] = float(v_inter(z[i + 1]))
 
-            while (Q[i] + Q[i + 1]) + 2 * 100000000 * (v[i] - v[i + 1]) / (t[i] * 3600) - q[i] - q[i + 1] > 0.01 and \
-                    (Q[i] + Q[i + 1]) + 2 * 100000000 * (v[i] - v[i + 1]) / (t[i] * 3600) - q[i] >= q[i + 1]:  # 这里的条件判断非常重要,影响了整个取值和精度,注意和计算值有关
-                q[i + 1] += 0.01  # 每次q2加0.01,也说明了取值精度
-                # z[i + 1] = 2.6934 * math.log(q[i + 1]) + 13.658
-                z[i + 1] = float(z_inter_q(q[i + 1]))
-                v[i + 1] = float(v_inter(z[i + 1]))
+            # （Q1 + Q2）*t / 2 -（q1 + q2）*t / 2 = v2 - v1, 由水量平衡求解q2
+            q[i + 1], z[i + 1] = solve(Q[i], Q[i + 1], v[i], q[i], t[i], q[i + 1])
+            v[i + 1] = float(v_inter(z[i + 1]))
 
             z_output.append(a)
             z_output[i + 1] = float(z_inter(v[i + 1]))
 
         return z_output, v, q
 
-    def get_zvq(self, q_now, z_now, Q_now, Q_next, z11, v11):
-        v_inter = interpolate.interp1d(z11, v11, kind='linear', fill_value="extrapolate")  # 插值函数
-        # 不同库容下的水位插值,zi=z_inter(v[i]),一维线性插值
-        z_inter = interpolate.interp1d(v11, z11, kind='linear', fill_value="extrapolate")
-
-        q_now = q_now
-        q_next = 10
-
-        z_next = 28
-        z_next = 2.4411 * math.log(q_now) + 16.996
-        v_next = 0.77
-        v_now = float(v_inter(z_now))
-        v_next = float(v_inter(z_next))
-
-        # （Q1 + Q2）*t / 2 -（q1 + q2）*t / 2 = v2 - v1
-        while (Q_now + Q_next) + 2 * 100000000 * (v_now - v_next) / 3600 - q_now - q_next > 0.01 and \
-                (Q_now + Q_next) + 2 * 100000000 * (v_now - v_next) / 3600 - q_now >= q_next:  # 这里的条件判断非常重要,影响了整个取值和精度
-            q_next += 0.01  # 每次q2加0.01,也说明了取值精度
-            z_next = 2.4411 * math.log(q_next) + 16.996
-            v_next = float(v_inter(z_next))
-
-        return z_next, v_next, q_next
-
     # 基础防洪调度，只使用流量
     def base_distribution_dp(self, qi):
         out_water_building_item = ""
@@ -744,8 +708,10 @@ class FloodControlStatic:
 
 
         Q = self.flood_value
-        z_inter = interpolate.interp1d(
-            self.v_table, self.z_table, kind='linear', fill_value="extrapolate")  #
+        zv = zv_table.ZVTable(self.z_table, self.v_table, extrapolate=True)
+        z_inter = zv.z_of_v
+        # 逐小时更新水位、库容, 插值数组在整个调度过程中共用
+        routing_step = routing.RoutingStep(zv, routing.settings(self.config)[1])
         
 
         if self.args.type == "0":
@@ -815,8 +781,7 @@ class FloodControlStatic:
                     else:
                         q_now = q[i]
                         z_now = z[i]
-                        z_next, v_next, q_next = self.get_zvq(
-                            q_now, z[i], Q[i], Q[i + 1], self.z_table, self.v_table)
+                        z_next, v_next, q_next = routing_step(q_now, z[i], Q[i], Q[i + 1])
                         z[i + 1] = z_next
                         v[i + 1] = v_next
                         # q[i + 1] = q_next
@@ -879,8 +844,7 @@ class FloodControlStatic:
                     else:
                         q_now = q[i]
                         z_now = z[i]
-                        z_next, v_next, q_next = self.get_zvq(
-                            q_now, z_now, Q[i], Q[i + 1], self.z_table, self.v_table)
+                        z_next, v_next, q_next = routing_step(q_now, z_now, Q[i], Q[i + 1])
                         z[i + 1] = z_next
                         v[i + 1] = v_next
 
@@ -2,11 +2,14 @@
 import os
 import argparse
 import json
-import sqlite3
 import math
-from scipy import interpolate
-import pymysql as mysql
 import logging
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db, zv_table
+
+import routing
 
 log_file_path = 'water_control_staic.log'
 # 日志配置
@@ -55,20 +58,13 @@ class FloodControlStatic:
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database_monitor']
-
             tablename_zv = self.config['db']['in']['values']['zv']
             tablename_version_zv = self.config['db']['in']['values']['zv_version']
 
             tablename_info = self.config['db']['in']['values']['reservoir_info']
 
             try:
-                conn = mysql.connect(
-                    host=address, port=port, user=user, password=password, database=database)
+                conn = db.connect(self.db_config, "database_monitor")
             except BaseException as e:
                 print("connect to mysql error: {}".format(e))
                 logging.error("connect to mysql error: {}".format(e))
@@ -92,41 +88,34 @@ class FloodControlStatic:
                     break
 
             print("zv type: {}".format(self.zv_type))
-            # 获取z和v
-            sql = "SELECT (RZ) FROM {} WHERE WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
-                tablename_zv, self.args.type, self.zv_type)
-            cursor.execute(sql)
+            # 获取z和v, 同一版本的水位库容表只查询一次
+            self.zv = zv_table.get_zv_table(self.args.type, self.zv_type)
+            if self.zv is None:
+                zv = db.select_columns(cursor, tablename_zv, ["RZ", "W"], "WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
+                    self.args.type, self.zv_type))
 
-            self.z_table = [float(row[0]) for row in cursor.fetchall()]
+                self.z_table = [float(x) for x in zv["RZ"]]
+                self.v_table = [float(x) for x in zv["W"]]
 
-            sql = "SELECT (W) FROM {} WHERE WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
-                tablename_zv, self.args.type, self.zv_type)
-            cursor.execute(sql)
-
-            self.v_table = [float(row[0]) for row in cursor.fetchall()]
+                self.zv = zv_table.set_zv_table(
+                    self.args.type, self.zv_type, self.z_table, self.v_table)
+            else:
+                self.z_table = self.zv.z.tolist()
+                self.v_table = self.zv.v.tolist()
 
             # 将库容从立方米转换为万立方米
             self.v_table = [i/10000 for i in self.v_table]
 
-            # 获取汛线水位
-            sql = "SELECT (LIMIT_LEVEL) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, self.args.type)
+            # 获取汛线水位和汛线库容
+            info = db.select_by_water_type(
+                cursor, tablename_info, ["LIMIT_LEVEL", "LIMIT_CAPACITY"], [self.args.type])[str(self.args.type)]
 
-            cursor.execute(sql)
-
-            self.limit_level_dataset = float(cursor.fetchall()[0][0])
-
-            # 获取汛线库容
-            sql = "SELECT (LIMIT_CAPACITY) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, self.args.type)
-            
-            cursor.execute(sql)
-
-            self.limit_capacity_dataset = float(cursor.fetchall()[0][0])/10000
+            self.limit_level_dataset = float(info["LIMIT_LEVEL"])
+            self.limit_capacity_dataset = float(info["LIMIT_CAPACITY"])/10000
 
             # 关闭数据库
             cursor.close()
-            conn.close()
+            db.release(conn)
 
         except Exception as e:
             print("load data from db error")
@@ -145,15 +134,8 @@ class FloodControlStatic:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database']
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port,
-                             user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         # 读取水位和库容表
@@ -180,7 +162,7 @@ class FloodControlStatic:
         self.flood_time = list(self.flood_time)
 
         cursor.close()
-        conn.close()
+        db.release(conn)
 
     def write_data_to_db(self):
         if "db" not in self.config.keys():
@@ -191,16 +173,8 @@ class FloodControlStatic:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database']
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port,
-                             user=user, password=password, database=database)
-        cursor = conn.cursor()
+        conn = db.connect(self.db_config, "database")
 
         table_name = self.config['db']['out']['values']['static']
 
@@ -210,6 +184,7 @@ class FloodControlStatic:
         _zv_type = str(self.zv_type)
 
         # 插入数据
+        values = []
         for i in range(len(self.z)):
             zi = self.result['z'][i]
             vi = self.result['v'][i]
@@ -226,18 +201,16 @@ class FloodControlStatic:
             q1i = round(q1i, 3)
             q2i = round(q2i, 3)
 
-            # sql = "INSERT INTO {} VALUES ({}, {}, {}, {})".format(table_name, zi, vi, qi)
-            sql = "INSERT INTO {} (Z, V, Q1, Q2, BATCH, SCENE, TYPE, TIME_SERIES, BUILDING, ZV_TYPE) VALUES ({}, {}, {}, {}, '{}', {}, {}, {}, '{}', '{}') ON DUPLICATE KEY UPDATE Z = {}, V = {}, Q1 = {}, Q2 = {}".format(
-                table_name, zi, vi, q1i, q2i, batch, scene, _type, (i + 1), building_i, _zv_type, zi, vi, q1i, q2i)
-
-            cursor.execute(sql)
+            values.append((zi, vi, q1i, q2i, batch, scene, _type, (i + 1), building_i, _zv_type))
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+        db.bulk_upsert(conn, table_name,
+                       ["Z", "V", "Q1", "Q2", "BATCH", "SCENE", "TYPE", "TIME_SERIES", "BUILDING", "ZV_TYPE"],
+                       values, ["Z", "V", "Q1", "Q2"], db.write_chunk_size(self.config))
+        db.release(conn)
 
     def read_data_from_sqlite(self):
         # 读取数据
+        import sqlite3
         conn = sqlite3.connect(self.config['sqlite']['path']['values'])
         cursor = conn.cursor()
 
@@ -293,6 +266,7 @@ class FloodControlStatic:
         self.sqlite_config = self.config['sqlite']['path']['values']
 
         # 连接数据库
+        import sqlite3
         conn = sqlite3.connect(self.sqlite_config)
         cursor = conn.cursor()
 
@@ -319,19 +293,31 @@ class FloodControlStatic:
         conn.close()
 
     def cal_flood_dongpu(self, z11, v11, z, v, q, Q, tguo):
-        v_inter = interpolate.interp1d(z11, v11, kind='linear')  # 插值函数
+        zv = zv_table.ZVTable(z11, v11)
+        v_inter = zv.v_of_z  # 插值函数
         # 不同库容下的水位插值,zi=z_inter(v[i]),一维线性插值
-        z_inter = interpolate.interp1d(v11, z11, kind='linear')
+        z_inter = zv.z_of_v
 
         # q-v 曲线
         z_qz = self.config['setting']['QZ_table']["values"]["dongpu"]["Z"]
         q_qz = self.config['setting']['QZ_table']["values"]["dongpu"]["Q"]
 
         # 不同水位下的泄量插值,qi=q_inter(z[i]),一维线性插值
+        from scipy import interpolate
         q_inter_z = interpolate.interp1d(z_qz, q_qz, kind='linear')
         # 不同泄量下的水位插值,zi=z_inter(q[i]),一维线性插值
         z_inter_q = interpolate.interp1d(q_qz, z_qz, kind='linear')
 
+        # 下泄流量对应的库容, 由泄流曲线和水位库容曲线得到
+        def v_of_q(x):
+            return float(v_inter(z_inter_q(x)))
+
+        # 时段末下泄流量的求解方法
+        solve = routing.outflow_solver(self.config, zv, z_qz, q_qz, v_of_q, False, self.args.type,
+                                       getattr(self, "zv_type", None), z_inter_q)
+        # 查蓄量指示曲线时水位由求解给出，不由泄量反推
+        by_level = routing.settings(self.config)[0] == "table"
+
         z = self.z
         v = [float(v_inter(z[i])) for i in range(len(z))]  # 根据水位插值库容
         q = [float(q_inter_z(z[i])) for i in range(len(z))]  # 根据水位插值泄量
@@ -350,24 +336,24 @@ class FloodControlStatic:
             # 初始化一个q2，这个是试算的起点值q2很重要，不能初始为上一个值q1，因为q2不是一定大于q1的，过了峰值后就下降了
             q.append(31)
 
-            # 检查是否超过用户输入的max值
-            if q[i] >= max_out_user:
-                q[i] = max_out_user
+            # 检查是否超过用户输入的max值, max值可以是逐时刻的列表(下泄流量优化方案的校核)
+            cap = max_out_user[i] if isinstance(max_out_user, list) else max_out_user
+            capped = q[i] >= cap
+            if capped:
+                q[i] = cap
 
             z.append(28)  # 初始化一个水位z值
-            z[i] = float(z_inter_q(q[i]))
+            # 泄流曲线水平段上由泄量反推的水位不唯一，查蓄量指示曲线时沿用上一时段求得的水位
+            if capped or not by_level:
+                z[i] = float(z_inter_q(q[i]))
             z[i + 1] = float(z_inter_q(q[i + 1]))
             v.append(0.77)  # 初始化一个库容值
             v[i] = float(v_inter(z[i]))  # 通过水位z 插值得到库容v  ，把np.array转换为float类型值
             v[i + 1] = float(v_inter(z[i + 1]))
 
-            # （Q1 + Q2）*t / 2 -（q1 + q2）*t / 2 = v2 - v1
-            while (Q[i] + Q[i + 1]) + 2 * 100000000 * (v[i] - v[i + 1]) / (t[i] * 3600) - q[i] - q[i + 1] > 0.01 and \
-                    (Q[i] + Q[i + 1]) + 2 * 100000000 * (v[i] - v[i + 1]) / (t[i] * 3600) - q[i] >= q[i + 1]:  # 这里的条件判断非常重要，影响了整个取值和精度
-                q[i + 1] += 0.01  # 每次q2加0.01，也说明了取值精度
-                # z[i + 1] = 2.4411 * math.log(q[i + 1]) + 16.996
-                z[i + 1] = float(z_inter_q(q[i + 1]))
-                v[i + 1] = float(v_inter(z[i + 1]))
+            # （Q1 + Q2）*t / 2 -（q1 + q2）*t / 2 = v2 - v1, 由水量平衡求解q2
+            q[i + 1], z[i + 1] = solve(Q[i], Q[i + 1], v[i], q[i], t[i], q[i + 1])
+            v[i + 1] = float(v_inter(z[i + 1]))
 
             z_output.append(28)
             z_output[i + 1] = float(z_inter(v[i + 1]))
@@ -375,19 +361,31 @@ class FloodControlStatic:
         return z_output, v, q
 
     def cal_flood_dafangying(self, z11, v11, z, v, q, Q, tguo):
-        v_inter = interpolate.interp1d(z11, v11, kind='linear')  # 插值函数
+        zv = zv_table.ZVTable(z11, v11)
+        v_inter = zv.v_of_z  # 插值函数
         # 不同库容下的水位插值,zi=z_inter(v[i]),一维线性插值
-        z_inter = interpolate.interp1d(v11, z11, kind='linear')
+        z_inter = zv.z_of_v
 
         # q-v 曲线
         z_qz = self.config['setting']['QZ_table']["values"]["dafangying"]["Z"]
         q_qz = self.config['setting']['QZ_table']["values"]["dafangying"]["Q"]
 
         # 不同水位下的泄量插值,qi=q_inter(z[i]),一维线性插值
+        from scipy import interpolate
         q_inter_z = interpolate.interp1d(z_qz, q_qz, kind='linear')
         # 不同泄量下的水位插值,zi=z_inter(q[i]),一维线性插值
         z_inter_q = interpolate.interp1d(q_qz, z_qz, kind='linear')
 
+        # 下泄流量对应的库容, 由泄流曲线和水位库容曲线得到
+        def v_of_q(x):
+            return float(v_inter(z_inter_q(x)))
+
+        # 时段末下泄流量的求解方法
+        solve = routing.outflow_solver(self.config, zv, z_qz, q_qz, v_of_q, False, self.args.type,
+                                       getattr(self, "zv_type", None), z_inter_q)
+        # 查蓄量指示曲线时水位由求解给出，不由泄量反推
+        by_level = routing.settings(self.config)[0] == "table"
+
         z = self.z
         v = [float(v_inter(z[i])) for i in range(len(z))]  # 根据水位插值库容
         q = [float(q_inter_z(z[i])) for i in range(len(z))]  # 根据水位插值泄量
@@ -407,24 +405,25 @@ class FloodControlStatic:
             # 初始化一个q2，这个是试算的起点值q2很重要，不能初始为上一个值q1，因为q2不是一定大于q1的，过了峰值后就下降了
             q.append(31)
 
-            # 检查是否超过用户输入的max值
-            if q[i] >= max_out_user:
-                q[i] = max_out_user
+            # 检查是否超过用户输入的max值, max值可以是逐时刻的列表(下泄流量优化方案的校核)
+            cap = max_out_user[i] if isinstance(max_out_user, list) else max_out_user
+            capped = q[i] >= cap
+            if capped:
+                q[i] = cap
 
             z.append(27.5)  # 初始化一个水位z值
             # 拟合的下泄曲线公式 y = 2.6934ln(x) + 13.658
-            z[i] = float(z_inter_q(q[i]))
+            # 泄流曲线水平段上由泄量反推的水位不唯一，查蓄量指示曲线时沿用上一时段求得的水位
+            if capped or not by_level:
+                z[i] = float(z_inter_q(q[i]))
             z[i + 1] = float(z_inter_q(q[i + 1]))
             v.append(0.5477)  # 初始化一个库容值
             v[i] = float(v_inter(z[i]))  # 通过水位z 插值得到库容v，把np.array转换为float类型值
             v[i + 1] = float(v_inter(z[i + 1]))
 
-            while (Q[i] + Q[i + 1]) + 2 * 100000000 * (v[i] - v[i + 1]) / (t[i] * 3600) - q[i] - q[i + 1] > 0.01 and \
-                    (Q[i] + Q[i + 1]) + 2 * 100000000 * (v[i] - v[i + 1]) / (t[i] * 3600) - q[i] >= q[i + 1]:  # 这里的条件判断非常重要，影响了整个取值和精度，注意和计算值有关
-                q[i + 1] += 0.01  # 每次q2加0.01，也说明了取值精度
-                # z[i + 1] = 2.6934 * math.log(q[i + 1]) + 13.658
-                z[i + 1] = float(z_inter_q(q[i + 1]))
-                v[i + 1] = float(v_inter(z[i + 1]))
+            # （Q1 + Q2）*t / 2 -（q1 + q2）*t / 2 = v2 - v1, 由水量平衡求解q2
+            q[i + 1], z[i + 1] = solve(Q[i], Q[i + 1], v[i], q[i], t[i], q[i + 1])
+            v[i + 1] = float(v_inter(z[i + 1]))
 
             z_output.append(0)
             z_output[i + 1] = float(z_inter(v[i + 1]))
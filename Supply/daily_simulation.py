@@ -0,0 +1,58 @@
+# 供水日调节计算: 从当前库容逐日计算 库容 = 前日库容 + 来水 + 补水 + 连通管来水 - 下泄 - 蒸发 - 供水，
+# 与 regular_supply 中由前后两日水位反推来水的水量平衡相同; 超过汛限库容时弃水
+# 各项为标量或数组，最后一维为日，前面的维度为并行计算的情景(如多组需水)，全部情景逐日一次计算
+import numpy as np
+
+# 剩余水量与 0 比较时的容差(万立方米)，逐日累加的舍入误差不改变可用天数
+VOLUME_TOLERANCE = 1e-9
+
+
+# curve 为水位库容曲线(common.reservoir_curve)，V0 为当前库容，days 为计算天数
+# Van 为安全库容，剩余水量为库容减安全库容，剩余水量小于 0 之前的天数即为可用天数(恰好为 0 的日仍可用)，
+# 各项为常数、无补水、连通管来水和来水时等于 int(剩余水量 / 日耗水量)
+# Vxunxian 为汛限库容(标量或逐日数组)，为空时不弃水; warning_days 不为空时按可用天数给出预警标志(与单日计算相同)
+def simulate(curve, V0, days, Van, inflow=0, replenishment=0, linkpipe=0, discharge=0, evaporation=0, supply=0,
+             Vxunxian=None, warning_days=None):
+    if days < 1:
+        raise ValueError("days should be at least 1, got {}".format(days))
+
+    net = np.asarray(inflow, dtype=float) + np.asarray(replenishment, dtype=float) + \
+        np.asarray(linkpipe, dtype=float) - np.asarray(discharge, dtype=float) - \
+        np.asarray(evaporation, dtype=float) - np.asarray(supply, dtype=float)
+
+    V0 = np.asarray(V0, dtype=float)
+    shape = np.broadcast(V0[..., None], net, np.zeros(days)).shape
+    net = np.broadcast_to(net, shape)
+
+    if Vxunxian is None:
+        v = V0[..., None] + np.cumsum(net, axis=-1)
+        spill = np.zeros(shape)
+    else:
+        v_limit = np.broadcast_to(np.asarray(Vxunxian, dtype=float), (days,))
+        v = np.empty(shape)
+        spill = np.zeros(shape)
+        V = np.broadcast_to(V0, shape[:-1]).copy()
+        for k in range(days):
+            V = V + net[..., k]
+            spill[..., k] = np.maximum(V - v_limit[k], 0)
+            V = V - spill[..., k]
+            v[..., k] = V
+
+    remaining = v - Van
+
+    # 可用天数: 第一次剩余水量小于 0 的日序号, 计算期内未用尽时为 days
+    exhausted = remaining < -VOLUME_TOLERANCE
+    available = np.where(np.any(exhausted, axis=-1), np.argmax(exhausted, axis=-1), days)
+
+    result = {
+        "v": v,
+        "z": curve.z_of_v(v),
+        "spill": spill,
+        "remaining": remaining,
+        "days": available,
+    }
+
+    if warning_days is not None:
+        result["flag"] = np.where(available <= warning_days, 0, 1)
+
+    return result
@@ -0,0 +1,198 @@
+# 供水方案可靠性的蒙特卡洛计算: 由历史逐月来水表生成大量多年合成序列(整年自助抽样或逐月一阶马尔可夫模型)，
+# 按方案批量、多进程计算月末水位、弃水、补水量，统计其分布和保证率的分布
+import os
+import sys
+import json
+import argparse
+import logging
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import supply_simulation
+from optimize_supply import TypicalSupply
+
+log_file_path = 'monte_carlo.log'
+# 日志配置
+logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 逐月序列名称
+SERIES = ["inflow", "need", "evaporation", "leakage", "loss"]
+
+
+# 子进程中计算一块合成序列, kwargs 为 supply_simulation.simulate 的参数
+def simulate_chunk(kwargs):
+    tmp = supply_simulation.simulate(**kwargs)
+    return tmp["z"], tmp["qishui"], tmp["rb"], tmp["rxa"]
+
+
+# 整年自助抽样: 从历史年份中有放回地抽取整年，各序列取同一年份，保留年内各月及来水与需水之间的相关
+def bootstrap(history, samples, years, rng):
+    picks = rng.integers(0, history["inflow"].shape[0], (samples, years))
+    return {name: history[name][picks].reshape(samples, years * 12) for name in SERIES}
+
+
+# 逐月一阶马尔可夫(Thomas-Fiering)模型: 对 log(1 + 来水) 按月保持均值、标准差和相邻月相关系数;
+# 需水、蒸发、渗漏、供损取历史各月均值
+def markov(history, samples, years, rng):
+    x = np.log1p(np.maximum(history["inflow"], 0))  # (历史年数, 12)
+    mean = x.mean(axis=0)
+    std = x.std(axis=0)
+
+    # 相邻月相关系数, 1月与上一年12月相关
+    previous = np.concatenate([np.roll(x[:, -1], 1)[:, None], x[:, :-1]], axis=1)[1:]
+    current = x[1:]
+    r = np.zeros(12)
+    for j in range(12):
+        if np.std(previous[:, j]) > 0 and np.std(current[:, j]) > 0:
+            r[j] = np.corrcoef(previous[:, j], current[:, j])[0, 1]
+
+    z = np.empty((samples, years * 12))
+    value = mean[0] + std[0] * rng.standard_normal(samples)
+    for k in range(years * 12):
+        j = k % 12
+        if k > 0:
+            ratio = std[j] / std[j - 1] if std[j - 1] > 0 else 0
+            noise = std[j] * np.sqrt(max(1 - r[j] ** 2, 0)) * rng.standard_normal(samples)
+            value = mean[j] + r[j] * ratio * (value - mean[j - 1]) + noise
+        z[:, k] = value
+
+    result = {"inflow": np.expm1(z)}
+    for name in SERIES[1:]:
+        result[name] = np.tile(history[name].mean(axis=0), (samples, years))
+    return result
+
+
+class MonteCarloSupply():
+    def __init__(self, args) -> None:
+        self.args = args
+        # 读取历史序列和方案参数
+        self.supply = TypicalSupply(args)
+        self.config = self.supply.config
+        self.setting = self.config["setting"]["monte_carlo"]["values"]
+
+        self.history = {}
+        self.result = {}
+
+    # 历史逐月序列, 按年排列为 (年数, 12)
+    def load_data_from_db(self):
+        self.supply.load_data_from_monitor_db()
+        self.supply.load_data_from_db()
+
+        years = self.supply.series_years()
+        for name in SERIES:
+            self.history[name] = np.asarray(self.supply.input[name][:years * 12], dtype=float).reshape(years, 12)
+
+        print("load {} years of history".format(years))
+        logging.info("load {} years of history".format(years))
+
+    def run(self):
+        method = self.args.method if self.args.method else self.setting["method"]
+        samples = self.args.samples if self.args.samples else self.setting["samples"]
+        years = self.args.years if self.args.years else (self.setting["years"] or self.history["inflow"].shape[0])
+        workers = self.args.workers if self.args.workers is not None else self.setting["workers"]
+        workers = workers if workers > 0 else multiprocessing.cpu_count()
+
+        rng = np.random.default_rng(self.args.seed)
+        if method == "bootstrap":
+            synthetic = bootstrap(self.history, samples, years, rng)
+        elif method == "markov":
+            synthetic = markov(self.history, samples, years, rng)
+        else:
+            print("method error")
+            logging.error("method error")
+            exit(1)
+
+        # 方案按多年平均年来水选取, 也可指定
+        pv = self.args.plan if self.args.plan else self.supply.get_plan(float(self.history["inflow"].sum(axis=1).mean()))
+        Zb, Db, a, b, c, d, e, f, g, Zxunxian, Vxunxian, Zsishui, Vsishui, Vqitiao, Van = self.supply.get_paln_data(
+            pv, self.args.z, self.args.safty_z)
+
+        chunks = np.array_split(np.arange(samples), min(workers, samples))
+        tasks = [{"Win": synthetic["inflow"][index], "Da": synthetic["need"][index],
+                  "Dc": synthetic["evaporation"][index], "Dd": synthetic["leakage"][index],
+                  "Ds": synthetic["loss"][index], "Zb": Zb, "Db": Db, "coeffs": [a, b, c, d, e, f, g],
+                  "Zan": self.args.safty_z, "Van": Van, "V0": np.full(len(index), Vqitiao),
+                  "Zxunxian": Zxunxian, "Vxunxian": Vxunxian, "year": years} for index in chunks]
+
+        if len(tasks) > 1:
+            with multiprocessing.Pool(len(tasks)) as pool:
+                results = pool.map(simulate_chunk, tasks)
+        else:
+            results = [simulate_chunk(task) for task in tasks]
+
+        z = np.concatenate([x[0] for x in results])
+        qishui = np.concatenate([x[1] for x in results])
+        rb = np.concatenate([x[2] for x in results])
+        rxa = np.concatenate([x[3] for x in results])
+
+        # 各月(1-12)的分位数，合并全部年份
+        percentiles = self.setting["percentiles"]
+
+        def monthly(x):
+            x = x.reshape(samples, years, 12)
+            return {str(p): np.percentile(x, p, axis=(0, 1)).tolist() for p in percentiles}
+
+        self.result = {
+            "method": method,
+            "samples": samples,
+            "years": years,
+            "plan": pv,
+            "z": monthly(z),
+            "qishui": monthly(qishui),
+            "rb": monthly(rb),
+            "rate": {
+                "mean": float(rxa.mean()),
+                "percentiles": {str(p): float(np.percentile(rxa, p)) for p in percentiles},
+            },
+        }
+
+        print("plan {}, rate mean {}".format(pv, self.result["rate"]["mean"]))
+        logging.info("plan {}, rate mean {}".format(pv, self.result["rate"]["mean"]))
+
+        return self.result
+
+    def write_result(self):
+        with open(self.args.output, 'w', encoding="utf-8") as f:
+            json.dump(self.result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    # 打包为exe后进程池需要
+    multiprocessing.freeze_support()
+    try:
+        parser = argparse.ArgumentParser("Supply Monte Carlo")
+        parser.add_argument('--config', type=str, default='./optimize_supply.json', help='config file')
+        parser.add_argument("--batch", type=str, required=True, help="batch of the historical monthly series")
+        parser.add_argument("--type", type=int, default=0, help="0: dongpu, 1: dafangying", choices=[0, 1])
+        parser.add_argument("--z", type=float, default=25.5, help="start water level")
+        parser.add_argument("--safty_z", type=float, default=26.5, help="safty water level")
+        parser.add_argument("--strategy", type=str, default="long-series", help="plan strategy",
+                            choices=["long-series", "typical-year"])
+        parser.add_argument("--plan", type=str, default=None, help="plan id, default selected by the strategy")
+        parser.add_argument("--method", type=str, default=None, help="bootstrap or markov",
+                            choices=["bootstrap", "markov"])
+        parser.add_argument("--samples", type=int, default=None, help="synthetic sequences")
+        parser.add_argument("--years", type=int, default=None, help="years of each sequence, default the history")
+        parser.add_argument("--workers", type=int, default=None, help="process count, 0 for all cores")
+        parser.add_argument("--seed", type=int, default=None, help="random seed")
+        parser.add_argument("--output", type=str, default="./monte_carlo.json", help="output file")
+
+        args = parser.parse_args()
+        # 读取全部月份
+        args.month = -1
+
+        print(args.__dict__)
+        logging.info(args.__dict__)
+
+        mc = MonteCarloSupply(args)
+        mc.load_data_from_db()
+        mc.run()
+        mc.write_result()
+
+        print("{\"complete\":true}")
+        logging.info("{\"complete\":true}")
+    except Exception as e:
+        print(e)
+        logging.error(e)
@@ -0,0 +1,200 @@
+# 补水方案搜索: 对某一来水分级(方案号)搜索 12 个月的补水水位 Zb 和补水水量 Db，用历史逐月序列评价，
+# 使补水总量(rxb)与弃水量最小，同时应急补水(水位低于安全水位)的月份比例不超过保证率要求
+# 候选方案用 supply_simulation 批量计算，差分进化按种群并行评价，结果输出为配置中的方案块
+import os
+import sys
+import json
+import argparse
+import logging
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import evolution
+
+import supply_simulation
+from optimize_supply import TypicalSupply
+
+log_file_path = 'plan_search.log'
+# 日志配置
+logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 水库类型 -> 配置中的方案
+RESERVOIRS = {0: "dongpu", 1: "dafangying"}
+
+
+# 优化目标: 对 (N, 24) 的候选方案(前 12 个为 Zb，后 12 个为 Db)批量计算，返回 (N,) 的目标值(越小越好)
+# Win 等序列为 (场景数, 月数)，每个场景从起调库容 V0 开始计算 year 年
+# 应急补水月份比例超过 100 - target_rate 的部分按 penalty 倍计入目标
+class PlanObjective():
+    def __init__(self, series, params, V0, year, target_rate, spill_weight=1, penalty=1000000) -> None:
+        self.series = series
+        self.params = params
+        self.V0 = V0
+        self.year = year
+        self.target_rate = target_rate
+        self.spill_weight = spill_weight
+        self.penalty = penalty
+
+    def simulate(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        return supply_simulation.simulate(
+            self.series["inflow"], self.series["need"], self.series["evaporation"], self.series["leakage"],
+            self.series["loss"], X[:, None, :12], X[:, None, 12:], V0=self.V0, year=self.year, **self.params)
+
+    def __call__(self, X):
+        tmp = self.simulate(X)
+
+        # 各场景平均
+        rxb = tmp["rxb"].mean(axis=1)
+        qishui = tmp["qishui"].sum(axis=-1).mean(axis=1)
+        rxa = tmp["rxa"].mean(axis=1)
+
+        scores = rxb + self.spill_weight * qishui
+        return scores + self.penalty * np.maximum(rxa - (100 - self.target_rate), 0)
+
+
+class PlanSearch():
+    def __init__(self, args) -> None:
+        self.args = args
+        self.supply = TypicalSupply(args)
+        self.config = self.supply.config
+        self.setting = self.config["setting"]["plan_search"]["values"]
+
+        self.history = {}
+        self.result = {}
+
+    # 历史逐月序列, 按年排列为 (年数, 12)
+    def load_data_from_db(self):
+        self.supply.load_data_from_monitor_db()
+        self.supply.load_data_from_db()
+
+        years = self.supply.series_years()
+        for name in ["inflow", "need", "evaporation", "leakage", "loss"]:
+            self.history[name] = np.asarray(self.supply.input[name][:years * 12], dtype=float).reshape(years, 12)
+
+        print("load {} years of history".format(years))
+        logging.info("load {} years of history".format(years))
+
+    # 方案 0 (长系列)按全部年份连续计算; 其余方案取年来水属于该分级的年份，每年从起调水位单独计算
+    def make_series(self):
+        pv = self.args.plan
+        if pv == "0":
+            return {name: x.reshape(1, -1) for name, x in self.history.items()}, self.history["inflow"].shape[0]
+
+        strategy = self.args.strategy
+        self.args.strategy = "typical-year"
+        picks = [i for i, x in enumerate(self.history["inflow"].sum(axis=1)) if self.supply.get_plan(float(x)) == pv]
+        self.args.strategy = strategy
+
+        if len(picks) == 0:
+            print("no year of plan {} in history".format(pv))
+            logging.error("no year of plan {} in history".format(pv))
+            exit(1)
+
+        return {name: x[picks] for name, x in self.history.items()}, 1
+
+    def run(self):
+        pv = self.args.plan
+        series, year = self.make_series()
+
+        Zb, Db, a, b, c, d, e, f, g, Zxunxian, Vxunxian, Zsishui, Vsishui, Vqitiao, Van = self.supply.get_paln_data(
+            pv, self.args.z, self.args.safty_z)
+        params = {"coeffs": [a, b, c, d, e, f, g], "Zan": self.args.safty_z, "Van": Van,
+                  "Zxunxian": Zxunxian, "Vxunxian": Vxunxian}
+
+        target_rate = self.args.target_rate if self.args.target_rate is not None else self.setting["target_rate"]
+        objective = PlanObjective(series, params, Vqitiao, year, target_rate, self.setting["spill_weight"])
+
+        # 补水水位在安全水位与各月汛限水位之间，补水水量不超过配置的上限
+        bounds = [(self.args.safty_z, Zxunxian[j]) for j in range(12)] + \
+            [(0, self.setting["max_volume"])] * 12
+
+        de = evolution.DifferentialEvolution(
+            objective, bounds,
+            pop_size=self.setting["pop_size"] if self.setting["pop_size"] > 0 else None,
+            max_iter=self.args.max_iter if self.args.max_iter is not None else self.setting["max_iter"],
+            seed=self.args.seed,
+            workers=self.args.workers if self.args.workers is not None else self.setting["workers"])
+
+        best_x, best_score = de.run()
+        tmp = objective.simulate(best_x)
+        baseline = objective.simulate(np.concatenate([Zb, Db]))
+
+        rxa = float(tmp["rxa"].mean())
+        plan = self.config["setting"][RESERVOIRS[self.args.type]]["plan"][pv]
+
+        self.result["plan"] = {
+            RESERVOIRS[self.args.type]: {
+                "plan": {
+                    pv: {
+                        "type": plan.get("type", ""),
+                        "supply_water_level": [round(float(x), 3) for x in best_x[:12]],
+                        "supply_water_volume": [round(float(x), 3) for x in best_x[12:]],
+                    }
+                }
+            }
+        }
+        self.result["score"] = best_score
+        self.result["rxb"] = float(tmp["rxb"].mean())
+        self.result["qishui"] = float(tmp["qishui"].sum(axis=-1).mean())
+        self.result["rate"] = rxa
+        self.result["baseline"] = {
+            "rxb": float(baseline["rxb"].mean()),
+            "qishui": float(baseline["qishui"].sum(axis=-1).mean()),
+            "rate": float(baseline["rxa"].mean()),
+        }
+        self.result["iteration"] = de.iteration
+
+        print("plan {}: rxb {}, qishui {}, rate {}, baseline {}".format(
+            pv, self.result["rxb"], self.result["qishui"], rxa, self.result["baseline"]))
+        logging.info("plan {}: rxb {}, qishui {}, rate {}, baseline {}".format(
+            pv, self.result["rxb"], self.result["qishui"], rxa, self.result["baseline"]))
+
+        if rxa > 100 - target_rate:
+            print("rate {} above limit {}".format(rxa, 100 - target_rate))
+            logging.warning("rate {} above limit {}".format(rxa, 100 - target_rate))
+
+        return self.result
+
+    def write_result(self):
+        with open(self.args.output, 'w', encoding="utf-8") as f:
+            json.dump(self.result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    # 打包为exe后进程池需要
+    multiprocessing.freeze_support()
+    try:
+        parser = argparse.ArgumentParser("Supply plan search")
+        parser.add_argument('--config', type=str, default='./optimize_supply.json', help='config file')
+        parser.add_argument("--batch", type=str, required=True, help="batch of the historical monthly series")
+        parser.add_argument("--type", type=int, default=0, help="0: dongpu, 1: dafangying", choices=[0, 1])
+        parser.add_argument("--plan", type=str, default="0", help="plan id, 0 for the long series, 1-5 for the inflow class",
+                            choices=["0", "1", "2", "3", "4", "5"])
+        parser.add_argument("--z", type=float, default=25.5, help="start water level")
+        parser.add_argument("--safty_z", type=float, default=26.5, help="safty water level")
+        parser.add_argument("--target_rate", type=float, default=None, help="guarantee rate (%%), default from config")
+        parser.add_argument("--max_iter", type=int, default=None, help="max iteration")
+        parser.add_argument("--workers", type=int, default=None, help="process count, 0 for all cores")
+        parser.add_argument("--seed", type=int, default=None, help="random seed")
+        parser.add_argument("--output", type=str, default="./plan_searched.json", help="output file")
+
+        args = parser.parse_args()
+        # 读取全部月份, 分级按典型年
+        args.month = -1
+        args.strategy = "long-series"
+
+        print(args.__dict__)
+        logging.info(args.__dict__)
+
+        search = PlanSearch(args)
+        search.load_data_from_db()
+        search.run()
+        search.write_result()
+
+        print("{\"complete\":true}")
+        logging.info("{\"complete\":true}")
+    except Exception as e:
+        print(e)
+        logging.error(e)
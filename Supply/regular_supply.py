@@ -2,12 +2,17 @@
 import sys
 import json
 import os
+import datetime
 import numpy as np
 import argparse
-import pymysql as mysql
 
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db, reservoir_curve
+
+import daily_simulation
+
 log_file_path = 'regular_supply.log'
 # 日志配置
 logging.basicConfig(filename=log_file_path, level=logging.DEBUG,
@@ -32,17 +37,10 @@ class Supply:
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database_monitor']
-
             tablename_info = self.config['db']['in']['values']['reservoir_info']
 
             try:
-                conn = mysql.connect(
-                    host=address, port=port, user=user, password=password, database=database)
+                conn = db.connect(self.db_config, "database_monitor")
             except BaseException as e:
                 print("connect to mysql error: {}".format(e))
                 logging.error("connect to mysql error: {}".format(e))
@@ -51,70 +49,19 @@ class Supply:
             # 获取游标
             cursor = conn.cursor()
 
-            # 获取汛线水位
-            sql = "SELECT (LIMIT_LEVEL) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, 0)
-
-            cursor.execute(sql)
-
-            self.limit_level_dp = float(cursor.fetchall()[0][0])
+            # 获取东圃、大坊盈的汛线水位、汛线库容、死水位和死库容
+            info = db.select_by_water_type(
+                cursor, tablename_info, ["LIMIT_LEVEL", "LIMIT_CAPACITY", "DEAD_LEVEL", "DEAD_CAPACITY"], [0, 1])
 
-            # 获取汛线库容
-            sql = "SELECT (LIMIT_CAPACITY) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, 0)
-            
-            cursor.execute(sql)
-
-            self.limit_capacity_dp = float(cursor.fetchall()[0][0])
-
-            # 获取汛线水位
-            sql = "SELECT (LIMIT_LEVEL) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, 1)
-            
-            cursor.execute(sql)
+            self.limit_level_dp = float(info["0"]["LIMIT_LEVEL"])
+            self.limit_capacity_dp = float(info["0"]["LIMIT_CAPACITY"])
+            self.dead_level_dp = float(info["0"]["DEAD_LEVEL"])
+            self.dead_capacity_dp = float(info["0"]["DEAD_CAPACITY"])
 
-            self.limit_level_dfy = float(cursor.fetchall()[0][0])
-
-            # 获取汛线库容
-            sql = "SELECT (LIMIT_CAPACITY) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, 1)
-            
-            cursor.execute(sql)
-
-            self.limit_capacity_dfy = float(cursor.fetchall()[0][0])
-
-            # 获取死水位
-            sql = "SELECT (DEAD_LEVEL) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, 0)
-            
-            cursor.execute(sql)
-
-            self.dead_level_dp = float(cursor.fetchall()[0][0])
-
-            # 获取死库容
-            sql = "SELECT (DEAD_CAPACITY) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, 0)
-            
-            cursor.execute(sql)
-
-            self.dead_capacity_dp = float(cursor.fetchall()[0][0])
-
-            # 获取死水位
-            sql = "SELECT (DEAD_LEVEL) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, 1)
-
-
-            cursor.execute(sql)
-
-            self.dead_level_dfy = float(cursor.fetchall()[0][0])
-
-            # 获取死库容
-            sql = "SELECT (DEAD_CAPACITY) FROM {} WHERE WATER_TYPE = '{}'".format(
-                tablename_info, 1)
-            
-            cursor.execute(sql)
-
-            self.dead_capacity_dfy = float(cursor.fetchall()[0][0])
+            self.limit_level_dfy = float(info["1"]["LIMIT_LEVEL"])
+            self.limit_capacity_dfy = float(info["1"]["LIMIT_CAPACITY"])
+            self.dead_level_dfy = float(info["1"]["DEAD_LEVEL"])
+            self.dead_capacity_dfy = float(info["1"]["DEAD_CAPACITY"])
 
 
 
@@ -127,7 +74,7 @@ class Supply:
                     self.limit_level_dfy_datasets[i] = self.limit_level_dfy + 0.5
                     
             cursor.close()
-            conn.close()
+            db.release(conn)
 
         except Exception as e:
             print(e)
@@ -149,21 +96,14 @@ class Supply:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database']
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port,
-                             user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         # write your code here
 
         cursor.close()
-        conn.close()
+        db.release(conn)
 
     def write_data_to_db(self):
         if "db" not in self.config.keys():
@@ -174,15 +114,8 @@ class Supply:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database']
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port,
-                             user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         # write your code here
@@ -258,13 +191,13 @@ class Supply:
         conn.commit()
 
         cursor.close()
-        conn.close()
+        db.release(conn)
 
-    def supply_water_dongpu(self, aa2, bb2, cc2, dd2, ee2, Zjin, Zzuo, Zan, Dbu, Dxie, Dzheng, Dlian, Dgong, Tyu):
+    def supply_water_dongpu(self, curve, Zjin, Zzuo, Zan, Dbu, Dxie, Dzheng, Dlian, Dgong, Tyu):
         result = {}
         # 董铺水库
-        Vjin = aa2 * Zjin**4 + bb2 * Zjin**3 + cc2 * Zjin**2 + dd2 * Zjin + ee2
-        Vzuo = aa2 * Zzuo**4 + bb2 * Zzuo**3 + cc2 * Zzuo**2 + dd2 * Zzuo + ee2
+        Vjin = curve.v_of_z(Zjin)
+        Vzuo = curve.v_of_z(Zzuo)
         Win2 = Vjin - Vzuo - Dbu + Dxie + Dzheng - Dlian + Dgong
 
         result["Vjin"] = float(Vjin)
@@ -279,7 +212,7 @@ class Supply:
             # print(0)
             result["inflow"] = 0
 
-        Van2 = aa2 * Zan**4 + bb2 * Zan**3 + cc2 * Zan**2 + dd2 * Zan + ee2
+        Van2 = curve.v_of_z(Zan)
         Vsheng2 = Vjin - Van2
         # print('董铺水库剩余水量(万方)')
         # print(Vsheng2)
@@ -298,13 +231,11 @@ class Supply:
 
         return result
 
-    def supply_water_dafangying(self, aa1, bb1, cc1, dd1, ee1, ff1, gg1, Zjin, Zzuo, Zan, Dbu, Dxie, Dzheng, Dlian, Dgong, Tyu):
+    def supply_water_dafangying(self, curve, Zjin, Zzuo, Zan, Dbu, Dxie, Dzheng, Dlian, Dgong, Tyu):
         result = {}
         # 大房郢水库
-        Vjin = aa1 * Zjin**6 + bb1 * Zjin**5 + cc1 * Zjin**4 + \
-            dd1 * Zjin**3 + ee1 * Zjin**2 + ff1 * Zjin + gg1
-        Vzuo = aa1 * Zzuo**6 + bb1 * Zzuo**5 + cc1 * Zzuo**4 + \
-            dd1 * Zzuo**3 + ee1 * Zzuo**2 + ff1 * Zzuo + gg1
+        Vjin = curve.v_of_z(Zjin)
+        Vzuo = curve.v_of_z(Zzuo)
         Win = Vjin - Vzuo - Dbu + Dxie + Dzheng - Dlian + Dgong
 
         result["Vjin"] = float(Vjin)
@@ -319,8 +250,7 @@ class Supply:
             # print(0)
             result["inflow"] = 0
 
-        Van1 = aa1 * Zan**6 + bb1 * Zan**5 + cc1 * Zan**4 + \
-            dd1 * Zan**3 + ee1 * Zan**2 + ff1 * Zan + gg1
+        Van1 = curve.v_of_z(Zan)
         Vsheng1 = Vjin - Van1
         # print('大房郢水库剩余水量(万方)')
         # print(Vsheng1)
@@ -338,8 +268,7 @@ class Supply:
 
         return result
 
-    def calculate_mode_one(self, a1, b1, c1, d1, e1, f1, g1,
-                           aa2, bb2, cc2, dd2, ee2,
+    def calculate_mode_one(self, curve_dfy, curve_dp,
                            Lyu1, Lyu2, Zjieshu2,
                            Vqishi1, Vqishi2,
                            Dbchu1, Dbchu2,
@@ -347,8 +276,7 @@ class Supply:
                            Zan1, Zxunxian1
                            ):
 
-        Vjieshu2 = aa2 * Zjieshu2**4 + bb2 * Zjieshu2**3 + \
-            cc2 * Zjieshu2**2 + dd2 * Zjieshu2 + ee2
+        Vjieshu2 = curve_dp.v_of_z(Zjieshu2)
 
         Dbri1 = Lyu1 * 86400 / 10000
         Dbri2 = Lyu2 * 86400 / 10000
@@ -359,8 +287,7 @@ class Supply:
         Db1 = Tyu * Dbri1
 
         Vjieshu1 = Vqishi1 + Db1 - Dbchu1 * Tyu + Djiang1 * Tyu
-        Zjieshu1 = a1 * Vjieshu1**6 + b1 * Vjieshu1**5 + c1 * Vjieshu1**4 + \
-            d1 * Vjieshu1**3 + e1 * Vjieshu1**2 + f1 * Vjieshu1 + g1
+        Zjieshu1 = curve_dfy.z_of_v(Vjieshu1)
 
         result = {
             "plan_days": Tyu,
@@ -380,8 +307,7 @@ class Supply:
 
         return result
 
-    def calculate_mode_two(self, a2, b2, c2, d2, e2, f2, g2,
-                           a1, b1, c1, d1, e1, f1, g1,
+    def calculate_mode_two(self, curve_dp, curve_dfy,
                            Lyu1, Lyu2, Dzl,
                            Vqishi1, Vqishi2,
                            Dbchu1, Dbchu2,
@@ -403,8 +329,7 @@ class Supply:
 
         result["dp_volume"] = Vjieshu2
 
-        Zjieshu2 = a2 * Vjieshu2 ** 6 + b2 * Vjieshu2 ** 5 + c2 * Vjieshu2 ** 4 + \
-            d2 * Vjieshu2 ** 3 + e2 * Vjieshu2 ** 2 + f2 * Vjieshu2 + g2
+        Zjieshu2 = curve_dp.z_of_v(Vjieshu2)
 
         result["dp_z"] = Zjieshu2
 
@@ -415,8 +340,7 @@ class Supply:
 
         result["dfy_volume"] = Vjieshu1
 
-        Zjieshu1 = a1 * Vjieshu1 ** 6 + b1 * Vjieshu1 ** 5 + c1 * Vjieshu1 ** 4 + \
-            d1 * Vjieshu1 ** 3 + e1 * Vjieshu1 ** 2 + f1 * Vjieshu1 + g1
+        Zjieshu1 = curve_dfy.z_of_v(Vjieshu1)
 
         result["dfy_z"] = Zjieshu1
 
@@ -472,40 +396,14 @@ class Supply:
 
         Dz = self.args.total_amount
 
-        a1 = self.config["setting"]["values"]["dfy_a"]
-        b1 = self.config["setting"]["values"]["dfy_b"]
-        c1 = self.config["setting"]["values"]["dfy_c"]
-        d1 = self.config["setting"]["values"]["dfy_d"]
-        e1 = self.config["setting"]["values"]["dfy_e"]
-        f1 = self.config["setting"]["values"]["dfy_f"]
-        g1 = self.config["setting"]["values"]["dfy_g"]
-
-        a2 = self.config["setting"]["values"]["dp_a"]
-        b2 = self.config["setting"]["values"]["dp_b"]
-        c2 = self.config["setting"]["values"]["dp_c"]
-        d2 = self.config["setting"]["values"]["dp_d"]
-        e2 = self.config["setting"]["values"]["dp_e"]
-        f2 = self.config["setting"]["values"]["dp_f"]
-        g2 = self.config["setting"]["values"]["dp_g"]
-
-        aa1 = self.config["setting"]["values"]["dfy_aa"]
-        bb1 = self.config["setting"]["values"]["dfy_bb"]
-        cc1 = self.config["setting"]["values"]["dfy_cc"]
-        dd1 = self.config["setting"]["values"]["dfy_dd"]
-        ee1 = self.config["setting"]["values"]["dfy_ee"]
-        ff1 = self.config["setting"]["values"]["dfy_ff"]
-        gg1 = self.config["setting"]["values"]["dfy_gg"]
-
-        aa2 = self.config["setting"]["values"]["dp_aa"]
-        bb2 = self.config["setting"]["values"]["dp_bb"]
-        cc2 = self.config["setting"]["values"]["dp_cc"]
-        dd2 = self.config["setting"]["values"]["dp_dd"]
-        ee2 = self.config["setting"]["values"]["dp_ee"]
+        # 水位库容曲线
+        curve_dfy = reservoir_curve.from_config(self.config["setting"]["values"], "dafangying")
+        curve_dp = reservoir_curve.from_config(self.config["setting"]["values"], "dongpu")
 
         # 供水调度
         supply_result_dongpu = self.supply_water_dongpu(
-            aa2, bb2, cc2, dd2, ee2, Zjin_dongpu, Zzuo_dongpu, Zan_dongpu, Dbu_dongpu, Dxie_dongpu, Dzheng_dongpu, Dlian_dongpu, Dgong_dongpu, Tyu_dp)
-        supply_result_dafangying = self.supply_water_dafangying(aa1, bb1, cc1, dd1, ee1, ff1, gg1, Zjin_dafangying, Zzuo_dafangying,
+            curve_dp, Zjin_dongpu, Zzuo_dongpu, Zan_dongpu, Dbu_dongpu, Dxie_dongpu, Dzheng_dongpu, Dlian_dongpu, Dgong_dongpu, Tyu_dp)
+        supply_result_dafangying = self.supply_water_dafangying(curve_dfy, Zjin_dafangying, Zzuo_dafangying,
                                                                 Zan_dafangying, Dbu_dafangying, Dxie_dafangying, Dzheng_dafangying, Dlian_dafangying, Dgong_dafangying, Tyu_dfy)
 
         print(supply_result_dafangying)
@@ -520,27 +418,20 @@ class Supply:
         # 补水计划生成
         Vqi_dongpu = Vjin_dongpu - Dbgong_dongpu * Tqi + \
             Dlian_dongpu * Tqi + Djiang_dongpu * Tqi
-        Zqishui_dongpu = a2 * Vqi_dongpu**6 + b2 * Vqi_dongpu**5 + c2 * \
-            Vqi_dongpu**4 + d2 * Vqi_dongpu**3 + e2 * Vqi_dongpu**2 + f2 * Vqi_dongpu + g2
-        Vqishui_dongpu = aa2 * Zqishui_dongpu**4 + bb2 * Zqishui_dongpu**3 + \
-            cc2 * Zqishui_dongpu**2 + dd2 * Zqishui_dongpu + ee2
+        Zqishui_dongpu = curve_dp.z_of_v(Vqi_dongpu)
+        Vqishui_dongpu = curve_dp.v_of_z(Zqishui_dongpu)
 
         Vqi_dafangying = Vjin_dafangying - Dbgong_dafangying * \
             Tqi + Dlian_dafangying * Tqi + Dbjiang_dafangying * Tqi
-        Zqishui_dafangying = a1 * Vqi_dafangying**6 + b1 * Vqi_dafangying**5 + c1 * \
-            Vqi_dafangying**4 + d1 * Vqi_dafangying**3 + e1 * \
-            Vqi_dafangying**2 + f1 * Vqi_dafangying + g1
-        Vqishui_dafangying = aa1 * Zqishui_dafangying**6 + bb1 * Zqishui_dafangying**5 + cc1 * Zqishui_dafangying**4 + \
-            dd1 * Zqishui_dafangying**3 + ee1 * \
-            Zqishui_dafangying**2 + ff1 * Zqishui_dafangying + gg1
+        Zqishui_dafangying = curve_dfy.z_of_v(Vqi_dafangying)
+        Vqishui_dafangying = curve_dfy.v_of_z(Zqishui_dafangying)
 
         DbChu_dafangying = Dbgong_dafangying + Dbzheng_dafangying
         DbChu_dongpu = Dbgong_dongpu + Dbzheng_dongpu
 
         # 模式一
         if self.args.mode == 1:
-            result = self.calculate_mode_one(a1, b1, c1, d1, e1, f1, g1,
-                                             aa2, bb2, cc2, dd2, ee2,
+            result = self.calculate_mode_one(curve_dfy, curve_dp,
                                              Lyu_dafangying, Lyu_dongpu, Zjieshu_dongpu,
                                              Vqishui_dafangying, Vqishui_dongpu,
                                              DbChu_dafangying, DbChu_dongpu,
@@ -559,8 +450,7 @@ class Supply:
 
         # 模式二
         elif self.args.mode == 2:
-            result = self.calculate_mode_two(a2, b2, c2, d2, e2, f2, g2,
-                                             a1, b1, c1, d1, e1, f1, g1,
+            result = self.calculate_mode_two(curve_dp, curve_dfy,
                                              Lyu_dafangying, Lyu_dongpu, Dz,
                                              Vqishui_dafangying, Vqishui_dongpu,
                                              DbChu_dafangying, DbChu_dongpu,
@@ -575,6 +465,53 @@ class Supply:
 
             self.result["plan-2"] = result
 
+    # 多日逐日计算: 从今日水位开始计算两库 days 天的库容、水位、弃水、剩余水量过程和可用天数，按预警天数给出标志
+    # dp、dfy 为各项逐日过程(inflow、replenishment、linkpipe、discharge、evaporation、supply)，可为 (情景数, days) 的数组
+    # 未给出的项取昨日的值，来水取 0; 大房郢的连通管来水为董铺的相反数
+    # 可用天数与 run 中的单日计算规则不同: 单日计算 T = int((剩余水量 + 补水 + 昨日来水) / (供水 + 下泄 + 蒸发))，
+    # 补水、来水只计一次且不计连通管来水; 这里补水、连通管来水逐日重复，来水逐日给出，因此天数和预警标志可能不同
+    def run_horizon(self, days=None, dp=None, dfy=None):
+        days = days if days else self.config["setting"]["horizon"]["values"]["days"]
+        values = self.config["setting"]["values"]
+
+        # 逐日的汛限库容按所在月份取
+        start = datetime.datetime.strptime(self.args.time[:10], "%Y-%m-%d")
+        months = [(start + datetime.timedelta(days=k)).month - 1 for k in range(days)]
+
+        reservoirs = {
+            "dp": ("dongpu", self.args.today_z_dongpu, self.args.safty_z_dongpu, self.args.warning_days_dp, {
+                "replenishment": self.args.yesterday_replenishment_dongpu,
+                "linkpipe": self.args.yesterday_linkpipe_dongpu,
+                "discharge": self.args.yesterday_discharge_dongpu,
+                "evaporation": self.args.yesterday_evaporation_dongpu,
+                "supply": self.args.yesterday_supply_dongpu,
+            }, dp),
+            "dfy": ("dafangying", self.args.today_z_dafangying, self.args.safty_z_dafangying, self.args.warning_days_dfy, {
+                "replenishment": self.args.yesterday_replenishment_dafangying,
+                "linkpipe": -self.args.yesterday_linkpipe_dongpu,
+                "discharge": self.args.yesterday_discharge_dafangying,
+                "evaporation": self.args.yesterday_evaporation_dafangying,
+                "supply": self.args.yesterday_supply_dafangying,
+            }, dfy),
+        }
+
+        for key, (name, Zjin, Zan, Tyu, terms, series) in reservoirs.items():
+            curve = reservoir_curve.from_config(values, name)
+            if series:
+                terms.update(series)
+
+            Vxunxian = [values["Vxunxian_{}".format(key)][m] for m in months]
+            result = daily_simulation.simulate(curve, curve.v_of_z(Zjin), days, curve.v_of_z(Zan),
+                                               Vxunxian=Vxunxian, warning_days=Tyu, **terms)
+            self.result["{}_horizon".format(key)] = result
+
+            print("{} horizon {} days, available days {} - {}".format(
+                name, days, np.min(result["days"]), np.max(result["days"])))
+            logging.info("{} horizon {} days, available days {} - {}".format(
+                name, days, np.min(result["days"]), np.max(result["days"])))
+
+        return self.result["dp_horizon"], self.result["dfy_horizon"]
+
 if __name__ == "__main__":
     # Add the arguments from the command line
     pass
\ No newline at end of file
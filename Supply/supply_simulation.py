@@ -0,0 +1,117 @@
+# 供水补水月调节计算: 按月依次来水、补水、供水，水位低于安全水位时应急补水到安全库容，超过汛限水位时弃水
+# 多年逐月序列一次计算; 来水等序列最后一维为月份，前面的维度为并行计算的方案，水位库容多项式用 Horner 法按数组计算
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.reservoir_curve import horner
+
+
+# 单一方案, 序列为列表，逐月标量计算
+def _simulate_one(Win, Da, out, Zb, Db, coeffs, Zan, Van, V, Zxunxian, Vxunxian, year, months, result):
+    Ra, Rb, Vg, qishui, return_z = result
+    Z_an = horner(coeffs, Van)
+
+    for i in range(year):
+        for j in months:
+            k = i * 12 + j
+
+            V = V + Win[k]
+            Vg[k] = Da[k]
+
+            # 月初水位低于补水水位，当月补水
+            supply = 0.0 if horner(coeffs, V) >= Zb[j] else Db[j]
+
+            # 进行供水
+            V = V + supply - out[k]
+            Z = horner(coeffs, V)
+
+            # 低于安全水位，应急补水到安全库容; 否则水位过量时弃水
+            if Z < Zan:
+                Rb[k] = Van - V + supply
+                Ra[k] = 1
+                V = Van
+                return_z[k] = Z_an
+            elif Z > Zxunxian[j]:
+                Rb[k] = supply
+                qishui[k] = V - Vxunxian[j]
+                V = Vxunxian[j]
+                return_z[k] = Zxunxian[j]
+            else:
+                Rb[k] = supply
+                return_z[k] = Z
+
+
+# 多个方案, 序列为数组，每月对全部方案一次计算; Zb、Db 可按方案给出 (..., 12)
+def _simulate_batch(Win, Da, out, Zb, Db, coeffs, Zan, Van, V, Zxunxian, Vxunxian, year, months, result):
+    Ra, Rb, Vg, qishui, return_z = result
+    Z_an = horner(coeffs, Van)
+
+    for i in range(year):
+        for j in months:
+            k = i * 12 + j
+
+            V = V + Win[..., k]
+            Vg[..., k] = Da[..., k]
+
+            supply = np.where(horner(coeffs, V) >= Zb[..., j], 0.0, Db[..., j])
+
+            V = V + supply - out[..., k]
+            Z = horner(coeffs, V)
+
+            below = Z < Zan
+            over = ~below & (Z > Zxunxian[j])
+
+            Rb[..., k] = np.where(below, Van - V + supply, supply)
+            Ra[..., k] = below
+            qishui[..., k] = np.where(over, V - Vxunxian[j], 0)
+
+            V = np.where(below, Van, np.where(over, Vxunxian[j], V))
+            return_z[..., k] = np.where(below, Z_an, np.where(over, Zxunxian[j], Z))
+
+
+# Win、Da、Dc、Dd、Ds 为来水、需水、蒸发、渗漏、供损的逐月序列(year * 12)，Zb、Db 为各月补水水位和补水水量(12)
+# coeffs 为库容-水位多项式系数，Zan、Van 为安全水位和库容，V0 为起调库容，Zxunxian、Vxunxian 为各月汛限水位和库容
+# months 为每年计算的月份(0-11)，默认全年; 返回与 get_cs_R_Com 相同的结果，序列为数组
+# Zb、Db 的前面维度与来水等序列一样按方案广播，用于同时评价多组补水方案
+def simulate(Win, Da, Dc, Dd, Ds, Zb, Db, coeffs, Zan, Van, V0, Zxunxian, Vxunxian, year, months=None):
+    Win = np.asarray(Win, dtype=float)
+    Da = np.asarray(Da, dtype=float)
+    months = list(range(12)) if months is None else list(months)
+
+    # 供水、蒸发、渗漏、供损合计
+    out = Da + np.asarray(Dd, dtype=float) + np.asarray(Ds, dtype=float) + np.asarray(Dc, dtype=float)
+
+    V0 = np.asarray(V0, dtype=float)
+    Zb = np.asarray(Zb, dtype=float)
+    Db = np.asarray(Db, dtype=float)
+    shape = np.broadcast(V0, Win[..., 0], out[..., 0], Zb[..., 0], Db[..., 0]).shape
+
+    if shape == ():
+        result = [[0] * (year * 12) for i in range(5)]
+        _simulate_one(Win.tolist(), Da.tolist(), out.tolist(), Zb.tolist(), Db.tolist(), coeffs, Zan, Van, float(V0),
+                      list(Zxunxian), list(Vxunxian), year, months, result)
+        result = [np.asarray(x, dtype=float) for x in result]
+    else:
+        result = [np.zeros(shape + (year * 12,)) for i in range(5)]
+        _simulate_batch(Win, Da, out, Zb, Db, coeffs, Zan, Van, np.broadcast_to(V0, shape).copy(),
+                        Zxunxian, Vxunxian, year, months, result)
+
+    Ra, Rb, Vg, qishui, return_z = result
+
+    # 原计算中 counta 未计数，bzv 保持为 0
+    counta = 0
+    bzv = (counta / (year * 12 + 1)) * 100
+    rxa = np.mean(Ra, axis=-1) * 100
+    rxb = np.sum(Rb, axis=-1)
+
+    return {
+        "rxa": rxa,
+        "rxb": rxb,
+        "z": return_z,
+        "qishui": qishui,
+        "bzv": bzv,
+        "rb": Rb,
+        "vg": Vg,
+    }
@@ -3,10 +3,12 @@ import json
 import os
 import numpy as np
 import argparse
-import pymysql as mysql
 
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db, reservoir_curve
+
 log_file_path = 'supply_water.log'
 # 日志配置
 logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -34,20 +36,14 @@ class Supply:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database'] 
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port, user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         # write your code here
         
         cursor.close()
-        conn.close()
+        db.release(conn)
 
 
     def write_data_to_db(self):
@@ -59,16 +55,9 @@ class Supply:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database'] 
-
 
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port, user=user, password=password, database=database)
-        cursor = conn.cursor()
+        conn = db.connect(self.db_config, "database")
 
         # write your code here
         table_name = self.config["db"]['out']["values"]
@@ -83,20 +72,12 @@ class Supply:
         dafangying_v = round(self.result["dafangying"]["V"], 3)
         dafangying_flag = self.result["dafangying"]["flag"]
         
-        sql = "INSERT INTO {} (BATCH, TYPE, FLAG, Z, V) VALUES ('{}', '{}', '{}', {}, {})".format(table_name, batch, "0", dongpu_flag, dongpu_z, dongpu_v)
-        print(sql)
-       
-        cursor.execute(sql)
-        
-        sql = "INSERT INTO {} (BATCH, TYPE, FLAG, Z, V) VALUES ('{}', '{}', '{}', {}, {})".format(table_name, batch, "1", dafangying_flag, dafangying_z, dafangying_v)
-        print(sql)
-       
-        cursor.execute(sql)
-
-        conn.commit()
+        values = [(batch, "0", dongpu_flag, dongpu_z, dongpu_v),
+                  (batch, "1", dafangying_flag, dafangying_z, dafangying_v)]
 
-        cursor.close()
-        conn.close()
+        db.bulk_upsert(conn, table_name, ["BATCH", "TYPE", "FLAG", "Z", "V"], values,
+                       chunk_size=db.write_chunk_size(self.config))
+        db.release(conn)
 
     def run(self):
         Zqitiao1 = self.args.z_dfy
@@ -113,34 +94,9 @@ class Supply:
         L1 = 13.64 * (Zp1 ** 0.5)
         L2 = 13.64 * (Zp2 ** 0.5)
 
-        a1 = self.config["setting"]["values"]["dfy_a"]
-        a2 = self.config["setting"]["values"]["dp_a"]
-        b1 = self.config["setting"]["values"]["dfy_b"]
-        b2 = self.config["setting"]["values"]["dp_b"]
-        c1 = self.config["setting"]["values"]["dfy_c"]
-        c2 = self.config["setting"]["values"]["dp_c"]
-        d1 = self.config["setting"]["values"]["dfy_d"]
-        d2 = self.config["setting"]["values"]["dp_d"]
-        e1 = self.config["setting"]["values"]["dfy_e"]
-        e2 = self.config["setting"]["values"]["dp_e"]
-        f1 = self.config["setting"]["values"]["dfy_f"]
-        f2 = self.config["setting"]["values"]["dp_f"]
-        g1 = self.config["setting"]["values"]["dfy_g"]
-        g2 = self.config["setting"]["values"]["dp_g"]
-
-        aa1 = self.config["setting"]["values"]["dfy_aa"]
-        bb1 = self.config["setting"]["values"]["dfy_bb"]
-        cc1 = self.config["setting"]["values"]["dfy_cc"]
-        dd1 = self.config["setting"]["values"]["dfy_dd"]
-        ee1 = self.config["setting"]["values"]["dfy_ee"]
-        ff1 = self.config["setting"]["values"]["dfy_ff"]
-        gg1 = self.config["setting"]["values"]["dfy_gg"]
-
-        aa2 = self.config["setting"]["values"]["dp_aa"]
-        bb2 = self.config["setting"]["values"]["dp_bb"]
-        cc2 = self.config["setting"]["values"]["dp_cc"]
-        dd2 = self.config["setting"]["values"]["dp_dd"]
-        ee2 = self.config["setting"]["values"]["dp_ee"]
+        # 水位库容曲线, 1 为大房郢, 2 为董铺
+        curve1 = reservoir_curve.from_config(self.config["setting"]["values"], "dafangying")
+        curve2 = reservoir_curve.from_config(self.config["setting"]["values"], "dongpu")
 
         Zxunxian1 = self.config["setting"]["values"]["Zxunxian_dfy"]
         Zxunxian2 = self.config["setting"]["values"]["Zxunxian_dp"]
@@ -153,8 +109,8 @@ class Supply:
         Vsishui2 = self.config["setting"]["values"]["Vsishui_dp"]
 
 
-        Vqitaio1 = aa1 * (Zqitiao1 ** 6) + bb1 * (Zqitiao1 ** 5) + cc1 * (Zqitiao1 ** 4) + dd1 * (Zqitiao1 ** 3) + ee1 * (Zqitiao1 ** 2) + ff1 * Zqitiao1 + gg1
-        Vqitaio2 = aa2 * (Zqitiao2 ** 4) + bb2 * (Zqitiao2 ** 3) + cc2 * (Zqitiao2 ** 2) + dd2 * Zqitiao2 + ee2
+        Vqitaio1 = curve1.v_of_z(Zqitiao1)
+        Vqitaio2 = curve2.v_of_z(Zqitiao2)
 
         print(Vqitaio1, Vqitaio2)
 
@@ -167,21 +123,21 @@ class Supply:
         Z_control1 = self.args.control_dfy
         Z_control2 = self.args.control_dp
 
-        Db1 = aa1 * (Z_control1 ** 6) + bb1 * (Z_control1 ** 5) + cc1 * (Z_control1 ** 4) + dd1 * (Z_control1 ** 3) + ee1 * (Z_control1 ** 2) + ff1 * Z_control1 + gg1
+        Db1 = curve1.v_of_z(Z_control1)
 
-        Db2 = aa2 * (Z_control2 ** 4) + bb2 * (Z_control2 ** 3) + cc2 * (Z_control2 ** 2) + dd2 * Z_control2 + ee2
+        Db2 = curve2.v_of_z(Z_control2)
 
         print(Db1, Db2)
 
         # 开始计算大方郢调度过程
         V1 = V1 + win1
-        Z1 = a1 * (V1**6) + b1 * (V1**5) + c1 * (V1**4) + d1 * (V1**3) + e1 * (V1**2) + f1 * V1 + g1
+        Z1 = curve1.z_of_v(V1)
         Vsheng1 = V1 - Vsishui1  # 水库剩余水量，死库容之上
         Vneed1 = Da1
 
         if Vsheng1 >= Vneed1:
             V1 = V1 - Da1
-            Z1 = a1 * (V1**6) + b1 * (V1**5) + c1 * (V1**4) + d1 * (V1**3) + e1 * (V1**2) + f1 * V1 + g1
+            Z1 = curve1.z_of_v(V1)
 
             if Z1 >= Z_control1:
                 if Z1 >= Zxunxian1[self.args.month - 1]:
@@ -194,7 +150,7 @@ class Supply:
                 self.result["dafangying"] = {"flag": "0", "Z": Z1, "V": qishui1}
             else:
                 # print("大房郢供水量较充足，为维持水位线需补水")
-                RbZ1 = aa1 * (Z1 ** 6) + bb1 * (Z1 ** 5) + cc1 * (Z1 ** 4) + dd1 * (Z1 ** 3) + ee1 * (Z1 ** 2) + ff1 * Z1 + gg1
+                RbZ1 = curve1.v_of_z(Z1)
                 Rb1 = Db1 - RbZ1
                 Z1 = Z_control1
                 self.result["dafangying"] = {"flag": "1", "Z": Z1, "V": Rb1}
@@ -206,13 +162,13 @@ class Supply:
 
         # 开始计算董铺调度过程
         V2 = V2 + win2
-        Z2 = a2 * (V2**6) + b2 * (V2**5) + c2 * (V2**4) + d2 * (V2**3) + e2 * (V2**2) + f2 * V2 + g2
+        Z2 = curve2.z_of_v(V2)
         Vsheng2 = V2 - Vsishui2  # 水库剩余水量，死库容之上
         Vneed2 = Da2
 
         if Vsheng2 >= Vneed2:
             V2 = V2 - Da2
-            Z2 = a2 * (V2**6) + b2 * (V2**5) + c2 * (V2**4) + d2 * (V2**3) + e2 * (V2**2) + f2 * V2 + g2
+            Z2 = curve2.z_of_v(V2)
 
             if Z2 >= Z_control2:
                 if Z2 >= Zxunxian2[self.args.month - 1]:
@@ -225,7 +181,7 @@ class Supply:
                 self.result["dongpu"] = {"flag": "0", "Z": Z2, "V": qishui2}
             else:
                 # print("董铺供水量较充足，为维持水位线需补水")
-                RbZ2 = aa2 * (Z2 ** 4) + bb2 * (Z2 ** 3) + cc2 * (Z2 ** 2) + dd2 * Z2 + ee2
+                RbZ2 = curve2.v_of_z(Z2)
                 Rb2 = Db2 - RbZ2
                 Z2 = Z_control2
                 self.result["dongpu"] = {"flag": "1", "Z": Z2, "V": Rb2}
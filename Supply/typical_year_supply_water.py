@@ -1,9 +1,14 @@
-import numpy as np
+import os
+import sys
 import argparse
 import json
-import pymysql as mysql
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db, reservoir_curve
+
+import supply_simulation
+
 log_file_path = 'typical_year_supply_water.log'
 # 日志配置
 logging.basicConfig(filename=log_file_path, level=logging.DEBUG,
@@ -31,15 +36,8 @@ class TypicalSupply:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database']
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port,
-                             user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         table_input = self.config['db']['in']['values']
@@ -52,7 +50,8 @@ class TypicalSupply:
         # 如果month为-1，则读取全部月份, 否则读取对应月份
 
         if _month == -1:
-            sql = "SELECT * FROM {} WHERE BATCH='{}' AND TYPE={}".format(
+            # 多年长系列按写入顺序读取
+            sql = "SELECT * FROM {} WHERE BATCH='{}' AND TYPE={} ORDER BY ID".format(
                 table_input, _batch, _type)
         else:
             sql = "SELECT * FROM {} WHERE BATCH='{}' AND TYPE={} AND MONTH={}".format(
@@ -93,10 +92,22 @@ class TypicalSupply:
                     self.input["loss"].insert(i, 0)
 
         cursor.close()
-        conn.close()
+        db.release(conn)
 
         return self.input
 
+    # 逐月序列的年数, 长系列的月数须为12的整数倍
+    def series_years(self):
+        if self.args.month != -1:
+            return 1
+
+        if len(self.input["inflow"]) % 12 != 0:
+            print("monthly series length {} is not a multiple of 12".format(len(self.input["inflow"])))
+            logging.error("monthly series length {} is not a multiple of 12".format(len(self.input["inflow"])))
+            exit(1)
+
+        return max(len(self.input["inflow"]) // 12, 1)
+
     def write_data_to_db(self):
         if "db" not in self.config.keys():
             print("config db is error")
@@ -106,16 +117,8 @@ class TypicalSupply:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database']
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port,
-                             user=user, password=password, database=database)
-        cursor = conn.cursor()
+        conn = db.connect(self.db_config, "database")
 
         table_output = self.config['db']['out']['values']
 
@@ -125,6 +128,7 @@ class TypicalSupply:
 
         print(self.result)
 
+        values = []
         for item in self.result:
             Z = float(item["z"])
             THROW = float(item["qishui"])
@@ -148,106 +152,30 @@ class TypicalSupply:
             # sql = "INSERT INTO {} (BATCH, MONTH, Z, THROW, RB, VG, RATE, RATE_B, TYPE, PLAN) VALUES ('{}', {}, {}, {}, {}, {}, {}, {}, {}, '{}') ON DUPLICATE KEY UPDATE Z = {}, THROW = {}, RB = {}, VG = {}, RATE = {}, RATE_B = {}".format(table_output, _batch, MONTH, Z, THROW, RB, VG, RATE, RATE_B, _type, PLAN, Z, THROW, RB, VG, RATE, RATE_B)
 
             # no rate and rate b
-            sql = "INSERT INTO {} (BATCH, MONTH, Z, THROW, RB, VG, TYPE, PLAN) VALUES ('{}', {}, {}, {}, {}, {}, {}, '{}') ON DUPLICATE KEY UPDATE Z = {}, THROW = {}, RB = {}, VG = {}".format(
-                table_output, _batch, MONTH, Z, THROW, RB, VG, _type, PLAN, Z, THROW, RB, VG)
-
-            # print(sql)
-            cursor.execute(sql)
+            values.append((_batch, MONTH, Z, THROW, RB, VG, _type, PLAN))
 
-        conn.commit()
-
-        cursor.close()
-        conn.close()
+        db.bulk_upsert(conn, table_output, ["BATCH", "MONTH", "Z", "THROW", "RB", "VG", "TYPE", "PLAN"],
+                       values, ["Z", "THROW", "RB", "VG"], db.write_chunk_size(self.config))
+        db.release(conn)
 
     def get_cs_R_Com(self, Zan, Van, Zb, Da, Db, Dc, Dd, Ds, Win, a, b, c, d, e, f, g, Zqitiao, Vqitaio, year, Zxunxian, Vxunxian, Zsishui, Vsishui):
-        Z = Zqitiao
-        V = Vqitaio
-        alpha = 0.05
-        Ra = [0] * year * 12
-        Rb = [0] * year * 12
-        counta = 0
-        Vg = [0] * year * 12
-        qishui = [0] * year * 12
-        return_z = [0] * year * 12
-
         if self.args.month == -1:
-            start, end = 0, 12
+            months = range(12)
         else:
-            _month = (int(self.args.month) % 100)
-            start, end = _month - 1, _month
-
-        for i in range(year):
-            for j in range(start, end):
-                V = V + Win[i * 12 + j]
-                Z = a * (V ** 6) + b * (V ** 5) + c * (V ** 4) + \
-                    d * (V ** 3) + e * (V ** 2) + f * V + g
-                Vg[i * 12 + j] = Da[i * 12 + j]
-
-                if Z >= Zb[j]:              # 月初水位高于补水水位，不补水
-                    # 进行供水
-                    V = V - Da[i * 12 + j] - Dd[i * 12 + j] - \
-                        Ds[i * 12 + j] - Dc[i * 12 + j]
-                    Z = a * (V ** 6) + b * (V ** 5) + c * (V ** 4) + \
-                        d * (V ** 3) + e * (V ** 2) + f * V + g
-
-                    if Z < Zan:
-                        Rb[i * 12 + j] = Van - V
-                        V = V + Rb[i * 12 + j]
-                        Z = a * (V ** 6) + b * (V ** 5) + c * (V ** 4) + \
-                            d * (V ** 3) + e * (V ** 2) + f * V + g
-                        Ra[i * 12 + j] = 1
-                        qishui[i * 12 + j] = 0
-                    elif Z > Zxunxian[j]:           # 供完水之后，如水位过量产生弃水
-                        qishui[i * 12 + j] = V - Vxunxian[j]
-                        V = Vxunxian[j]
-                        Z = Zxunxian[j]
-                        Rb[i * 12 + j] = 0
-                    else:
-                        qishui[i * 12 + j] = 0
-                        Rb[i * 12 + j] = 0
-                    return_z[i * 12 + j] = Z
-
-                else:                               # 月初水位低于补水水位，当月补水
-                    V = V + Db[j]
-                    Z = a * (V ** 6) + b * (V ** 5) + c * (V ** 4) + \
-                        d * (V ** 3) + e * (V ** 2) + f * V + g
-
-                    # 进行供水
-                    V = V - Da[i * 12 + j] - Dd[i * 12 + j] - \
-                        Ds[i * 12 + j] - Dc[i * 12 + j]
-                    Z = a * (V ** 6) + b * (V ** 5) + c * (V ** 4) + \
-                        d * (V ** 3) + e * (V ** 2) + f * V + g
-
-                    if Z < Zan:
-                        Rb[i * 12 + j] = Van - V + Db[j]
-                        V = Van
-                        Z = a * (V ** 6) + b * (V ** 5) + c * (V ** 4) + \
-                            d * (V ** 3) + e * (V ** 2) + f * V + g
-                        Ra[i * 12 + j] = 1
-                        qishui[i * 12 + j] = 0
-                    elif Z > Zxunxian[j]:           # 供完水之后，如水位过量产生弃水
-                        qishui[i * 12 + j] = V - Vxunxian[j]
-                        V = Vxunxian[j]
-                        Z = Zxunxian[j]
-                        Rb[i * 12 + j] = Db[j]
-                    else:
-                        qishui[i * 12 + j] = 0
-                        Rb[i * 12 + j] = Db[j]
-
-                    return_z[i * 12 + j] = Z
-
-        bzv = (counta / (year * 12 + 1)) * 100
-        rxa = np.mean(Ra) * 100
-        rxb = np.sum(Rb)
+            months = [(int(self.args.month) % 100) - 1]
+
+        # year 年逐月序列一次计算，库容-水位多项式用 Horner 法
+        tmp = supply_simulation.simulate(Win, Da, Dc, Dd, Ds, Zb, Db, [a, b, c, d, e, f, g], Zan, Van, Vqitaio,
+                                         Zxunxian, Vxunxian, year, months)
 
         result = {
-            "rxa": rxa,
-            "rxb": rxb,
-            "z": return_z,
-            "qishui": qishui,
-            "bzv": bzv,
-            "rb": Rb,
-            "vg": Vg,
+            "rxa": float(tmp["rxa"]),
+            "rxb": float(tmp["rxb"]),
+            "z": tmp["z"].tolist(),
+            "qishui": tmp["qishui"].tolist(),
+            "bzv": tmp["bzv"],
+            "rb": tmp["rb"].tolist(),
+            "vg": tmp["vg"].tolist(),
         }
 
         print(result)
@@ -265,59 +193,33 @@ class TypicalSupply:
             Zb = self.config["setting"]["dongpu"]["plan"][pv]["supply_water_level"]
             Db = self.config["setting"]["dongpu"]["plan"][pv]["supply_water_volume"]
 
-            a = self.config["setting"]["params"]["values"]["dp_a"]
-            b = self.config["setting"]["params"]["values"]["dp_b"]
-            c = self.config["setting"]["params"]["values"]["dp_c"]
-            d = self.config["setting"]["params"]["values"]["dp_d"]
-            e = self.config["setting"]["params"]["values"]["dp_e"]
-            f = self.config["setting"]["params"]["values"]["dp_f"]
-            g = self.config["setting"]["params"]["values"]["dp_g"]
-
-            aa = self.config["setting"]["params"]["values"]["dp_aa"]
-            bb = self.config["setting"]["params"]["values"]["dp_bb"]
-            cc = self.config["setting"]["params"]["values"]["dp_cc"]
-            dd = self.config["setting"]["params"]["values"]["dp_dd"]
-            ee = self.config["setting"]["params"]["values"]["dp_ee"]
+            # 水位库容曲线, Z(V) 系数 a..g
+            curve = reservoir_curve.from_config(self.config["setting"]["params"]["values"], "dongpu")
+            a, b, c, d, e, f, g = curve.z_coeffs
 
             Zxuanxian = self.config["setting"]["params"]["values"]["Zxunxian_dp"]
             Vxuanxian = self.config["setting"]["params"]["values"]["Vxunxian_dp"]
             Zsishui = self.config["setting"]["params"]["values"]["Zsishui_dp"]
             Vsishui = self.config["setting"]["params"]["values"]["Vsishui_dp"]
 
-            Vqitiao = aa * (Zqitiao ** 4) + bb * (Zqitiao ** 3) + \
-                cc * (Zqitiao ** 2) + dd * Zqitiao + ee
-            Van = aa * (Zan ** 4) + bb * (Zan ** 3) + \
-                cc * (Zan ** 2) + dd * Zan + ee
+            Vqitiao = curve.v_of_z(Zqitiao)
+            Van = curve.v_of_z(Zan)
 
         elif self.args.type == 1:
             Zb = self.config["setting"]["dafangying"]["plan"][pv]["supply_water_level"]
             Db = self.config["setting"]["dafangying"]["plan"][pv]["supply_water_volume"]
 
-            a = self.config["setting"]["params"]["values"]["dfy_a"]
-            b = self.config["setting"]["params"]["values"]["dfy_b"]
-            c = self.config["setting"]["params"]["values"]["dfy_c"]
-            d = self.config["setting"]["params"]["values"]["dfy_d"]
-            e = self.config["setting"]["params"]["values"]["dfy_e"]
-            f = self.config["setting"]["params"]["values"]["dfy_f"]
-            g = self.config["setting"]["params"]["values"]["dfy_g"]
-
-            aa = self.config["setting"]["params"]["values"]["dfy_aa"]
-            bb = self.config["setting"]["params"]["values"]["dfy_bb"]
-            cc = self.config["setting"]["params"]["values"]["dfy_cc"]
-            dd = self.config["setting"]["params"]["values"]["dfy_dd"]
-            ee = self.config["setting"]["params"]["values"]["dfy_ee"]
-            ff = self.config["setting"]["params"]["values"]["dfy_ff"]
-            gg = self.config["setting"]["params"]["values"]["dfy_gg"]
+            # 水位库容曲线, Z(V) 系数 a..g
+            curve = reservoir_curve.from_config(self.config["setting"]["params"]["values"], "dafangying")
+            a, b, c, d, e, f, g = curve.z_coeffs
 
             Zxuanxian = self.config["setting"]["params"]["values"]["Zxunxian_dfy"]
             Vxuanxian = self.config["setting"]["params"]["values"]["Vxunxian_dfy"]
             Zsishui = self.config["setting"]["params"]["values"]["Zsishui_dfy"]
             Vsishui = self.config["setting"]["params"]["values"]["Vsishui_dfy"]
 
-            Vqitiao = aa * (Zqitiao ** 6) + bb * (Zqitiao ** 5) + cc * (Zqitiao ** 4) + \
-                dd * (Zqitiao ** 3) + ee * (Zqitiao ** 2) + ff * Zqitiao + gg
-            Van = aa * (Zan ** 6) + bb * (Zan ** 5) + cc * (Zan ** 4) + \
-                dd * (Zan ** 3) + ee * (Zan ** 2) + ff * Zan + gg
+            Vqitiao = curve.v_of_z(Zqitiao)
+            Van = curve.v_of_z(Zan)
 
         Win = self.input["inflow"]
         Da = self.input["need"]
@@ -325,7 +227,8 @@ class TypicalSupply:
         Dd = self.input["leakage"]
         Ds = self.input["loss"]
 
-        year = 1
+        # 多于12个月时为多年长系列，全部年份一次计算
+        year = self.series_years()
         tmp = self.get_cs_R_Com(Zan, Van, Zb, Da, Db, Dc, Dd, Ds, Win, a, b, c, d,
                                 e, f, g, Zqitiao, Vqitiao, year, Zxuanxian, Vxuanxian, Zsishui, Vsishui)
 
@@ -337,11 +240,12 @@ class TypicalSupply:
             _month = -1
 
         print(_month)
-        for i in range(12):
-            if _month != -1 and i + 1 != _month:
+        for i in range(len(tmp["z"])):
+            if _month != -1 and i % 12 + 1 != _month:
                 continue
+            # 多年长系列的月份为在系列中的序号(第k年m月为 12*(k-1)+m)，各年的结果不互相覆盖
             result.append({
-                "month": self.args.month if _month != -1 else self.input["month"][i],
+                "month": self.args.month if _month != -1 else (self.input["month"][i] if year == 1 else i + 1),
                 "z": tmp["z"][i],
                 "qishui": tmp["qishui"][i],
                 "rb": tmp["rb"][i],
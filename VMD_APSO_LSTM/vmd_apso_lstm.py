@@ -1,16 +1,13 @@
 # cython: language_level=3
+# keras、pyswarm、vmdpy、sklearn 导入较慢，在用到的方法中才导入(pyswarm 只在使用APSO训练时导入)
 import numpy as np
-from pyswarm import pso
-from keras.models import Sequential
-from keras.layers import Dense, LSTM
-from vmdpy import VMD
-from sklearn.preprocessing import MinMaxScaler
 import sys
 import os
 import json
 import argparse
-import sqlite3
-import pymysql as mysql
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db
 
 # 去掉warning
 import warnings
@@ -22,6 +19,9 @@ log_file_path = 'vmd_apso_lstm.log'
 # 日志配置
 logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 已加载的推理模型, (权重文件, LSTM单元数, 输入长度) -> (文件修改时间, 模型)
+_inference_models = {}
+
 
 class VMD_APSO_LSTM:
     
@@ -59,14 +59,8 @@ class VMD_APSO_LSTM:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database'] 
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port, user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         table_name = self.config['db']['in']['values']
@@ -82,7 +76,7 @@ class VMD_APSO_LSTM:
 
         # 关闭数据库连接
         cursor.close()
-        conn.close()
+        db.release(conn)
     
     # 写入数据到数据库
     def write_data_to_db(self):
@@ -94,14 +88,8 @@ class VMD_APSO_LSTM:
         # 数据库参数
         self.db_config = self.config['db']['values']
 
-        address = self.db_config['address']
-        port = self.db_config['port']
-        user = self.db_config['user']
-        password = self.db_config['password']
-        database = self.db_config['database'] 
-
         # 建立数据库连接
-        conn = mysql.connect(host=address, port=port, user=user, password=password, database=database)
+        conn = db.connect(self.db_config, "database")
         cursor = conn.cursor()
 
         table_name = self.config['db']['out']['values']
@@ -119,11 +107,12 @@ class VMD_APSO_LSTM:
 
         # 关闭数据库连接
         cursor.close()
-        conn.close()
+        db.release(conn)
 
     # 从sqlite中读取数据
     def read_data_from_sqlite(self):
         # 连接数据库文件
+        import sqlite3
         conn = sqlite3.connect(self.config['sqlite']['values']['path'])
 
         table_name = self.config['sqlite']['in']['values']
@@ -148,6 +137,7 @@ class VMD_APSO_LSTM:
     # 向sqlite中写入数据
     def write_data_to_sqlite(self):
         # 连接数据库文件
+        import sqlite3
         conn = sqlite3.connect(self.config['sqlite']['values']['path'])
         cursor = conn.cursor()
 
@@ -181,6 +171,8 @@ class VMD_APSO_LSTM:
 
     # vmd分解
     def vmd_decompose(self):
+        from vmdpy import VMD
+
         u, u_hat, omega = VMD(self.data, self.vmd_alpha, self.vmd_tau, self.vmd_K, self.vmd_DC, self.vmd_init, self.vmd_tol)
         return u, u_hat, omega
     
@@ -215,6 +207,9 @@ class VMD_APSO_LSTM:
 
     # 模型定义
     def create_model(self, lstm_units, input_length):
+        from keras.models import Sequential
+        from keras.layers import Dense, LSTM
+
         model = Sequential()
         model.add(LSTM(lstm_units, input_shape=(input_length, 1)))
         model.add(Dense(1, activation='sigmoid'))
@@ -256,6 +251,7 @@ class VMD_APSO_LSTM:
             ub = np.append(ub, r[1])
 
             # 使用APSO算法搜索最优参数
+        from pyswarm import pso
         best_params, best_fitness = pso(self.fitness_function, lb = lb, ub = ub, swarmsize=5, maxiter=10, debug=True, args=(X_train, y_train, X_val, y_val, batch_size, input_length))
 
         # 输出最优参数和对应的准确率
@@ -266,6 +262,8 @@ class VMD_APSO_LSTM:
     
     # 训练
     def train(self):
+        from sklearn.preprocessing import MinMaxScaler
+
         is_use_apso = self.args.is_use_apso
         is_save = self.args.is_save
         N = self.length
@@ -382,8 +380,24 @@ class VMD_APSO_LSTM:
         logging.info("MAE: %.4f, ME: %.4f, RMSE: %.4f, NSE: %.4f, PBIAS: %.4f" % (mae, me, rmse, NSE, PBIAS))
         return mae, me, rmse, NSE, PBIAS
 
+    # 读取推理模型, 常驻进程中同一权重文件(未修改时)只加载一次
+    def load_inference_model(self, weight_path, lstm_units, input_length):
+        key = (weight_path, lstm_units, input_length)
+        mtime = os.path.getmtime(weight_path)
+
+        if key in _inference_models.keys() and _inference_models[key][0] == mtime:
+            return _inference_models[key][1]
+
+        model = self.create_model(lstm_units, input_length)
+        model.load_weights(weight_path)
+        _inference_models[key] = (mtime, model)
+
+        return model
+
     # 推理
     def inference(self):
+        from sklearn.preprocessing import MinMaxScaler
+
         data_infer_all, data_real_all = [], []
         K = self.vmd_K
         path = self.config["VMD_APSO_LSTM"][self.args.type]["path"]['values']
@@ -409,10 +423,8 @@ class VMD_APSO_LSTM:
             batch_size = int(float(best_params.split(',')[4].strip()))
 
             # 创建模型
-            model = self.create_model(lstm_units, input_length)
-
             weight_path = os.path.join(path, str(i) + '_model.h5')
-            model.load_weights(weight_path)
+            model = self.load_inference_model(weight_path, lstm_units, input_length)
 
             # 归一化
             scaler = MinMaxScaler(feature_range=(0, 1))
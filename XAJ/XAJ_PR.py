@@ -1,15 +1,22 @@
 # 新安江模型计算径流量
 import json
 import numpy as np
-import sqlite3
 import argparse
 import datetime
-import pymysql as mysql
-import math
-from scipy import interpolate
 from collections import defaultdict
 import logging
 import os
+import sys
+
+import confluence
+import ensemble
+import pr_batch
+import rainfall_grid
+import rainfall_window
+import xaj_batch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db, zv_table
 
 log_file_path = 'XAJ_PR.log'
 # 日志配置
@@ -29,6 +36,8 @@ class XAJ_PR():
         self.result_pr = []
         self.result_pr_r = []
         self.result = []
+        self.result_ensemble = []
+        self.ensemble_columns = []
         self.length = 0
         self.flood_flag = 0
 
@@ -38,6 +47,7 @@ class XAJ_PR():
 
         self.z_table = []     # 水位表
         self.v_table = []     # 库容表
+        self.zv = None        # 水位库容插值表
 
         self.config = None
 
@@ -68,21 +78,23 @@ class XAJ_PR():
         start = 24
         end = len(self.data['rainfull']) - 72
 
+        # 任意连续24小时的降雨量之和及最大时段降雨量, sums[i]对应rainfull[i-24:i]
+        sums = rainfall_window.rolling_sum(self.data['rainfull'], 24)
+        maxes = rainfall_window.rolling_max(self.data['rainfull'], 24)
+
+        # 各时刻的洪水类型
+        flood_class = np.zeros(len(sums), dtype=int)
+        if self.type == "0":
+            flood_class[rainfall_window.reaches(sums, 26) & ~rainfall_window.reaches(sums, 100)] = 1
+            flood_class[rainfall_window.reaches(sums, 100) | (maxes >= 45)] = 2
+        else:
+            flood_class[rainfall_window.reaches(sums, 20)] = 1
+
+        self.data['flood_class'] = flood_class[:len(self.data['rainfull'])].tolist()
+
         flag = 0
-        # 滑动窗口计算任意连续24消失的降雨量之和
-        for i in range(start, end):
-            if self.type == "0":
-                if sum(self.data['rainfull'][i-24:i]) >= 100 or max(self.data['rainfull'][i-24:i]) >= 45:
-                    flag = max(flag, 2)
-                elif sum(self.data['rainfull'][i-24:i]) >= 26 and sum(self.data['rainfull'][i-24:i]) < 100:
-                    flag = max(flag, 1)
-                else:
-                    flag = max(flag, 0)
-            else:
-                if sum(self.data['rainfull'][i-24:i]) >= 20:
-                    flag = max(flag, 1)
-                else:
-                    flag = max(flag, 0)
+        if end > start:
+            flag = int(flood_class[start:end].max())
 
         return flag
 
@@ -96,12 +108,6 @@ class XAJ_PR():
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database_monitor']
-
             # 入参
             start_time = self.ins.start
             end_time = self.ins.end
@@ -113,8 +119,7 @@ class XAJ_PR():
             PPTN_surface = self.config['db']['in']['values']['surface_pptn']
 
             try:
-                conn = mysql.connect(
-                    host=address, port=port, user=user, password=password, database=database)
+                conn = db.connect(self.db_config, "database_monitor")
             except BaseException as e:
                 print("connect to mysql error: {}".format(e))
                 logging.error("connect to mysql error: {}".format(e))
@@ -139,18 +144,20 @@ class XAJ_PR():
 
             print("zv type: {}".format(self.zv_type))
 
-            # 获取z和v
-            sql = "SELECT (RZ) FROM {} WHERE WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
-                tablename_zv, self.ins.type, self.zv_type)
-            cursor.execute(sql)
+            # 获取z和v, 同一版本的水位库容表只查询一次
+            self.zv = zv_table.get_zv_table(self.ins.type, self.zv_type)
+            if self.zv is None:
+                zv = db.select_columns(cursor, tablename_zv, ["RZ", "W"], "WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
+                    self.ins.type, self.zv_type))
 
-            self.z_table = [float(row[0]) for row in cursor.fetchall()]
+                self.z_table = [float(x) for x in zv["RZ"]]
+                self.v_table = [float(x) for x in zv["W"]]
 
-            sql = "SELECT (W) FROM {} WHERE WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
-                tablename_zv, self.ins.type, self.zv_type)
-            cursor.execute(sql)
-
-            self.v_table = [float(row[0]) for row in cursor.fetchall()]
+                self.zv = zv_table.set_zv_table(
+                    self.ins.type, self.zv_type, self.z_table, self.v_table)
+            else:
+                self.z_table = self.zv.z.tolist()
+                self.v_table = self.zv.v.tolist()
 
             # 获取点雨量数据
             sql = "select * from {} where TM between '{}' and '{}' order by TM".format(
@@ -161,12 +168,6 @@ class XAJ_PR():
             # 读取数据
             tmp = cursor.fetchall()
 
-            point_rainfall_result = defaultdict(list)
-            point_rainfall_tmp = defaultdict(list)
-
-            for row in tmp:
-                point_rainfall_tmp[row[0]].append((row[1], row[2]))
-
             # 根据start_time和end_time计算长度(小时)
             start_time = datetime.datetime.strptime(
                 start_time, "%Y-%m-%d %H:%M:%S")
@@ -177,23 +178,10 @@ class XAJ_PR():
 
             length = int((end_time - start_time).total_seconds() / 60 / 60) + 1
 
-            for station in point_rainfall_tmp.keys():
-                time_list = [str(x[0].strftime("%Y-%m-%d %H:%M:%S"))
-                             for x in point_rainfall_tmp[station]]
-                for i in range(length):
-                    timex = start_time + datetime.timedelta(minutes=i * 60)
-                    timex = str(timex.strftime("%Y-%m-%d %H:%M:%S"))
-
-                    if timex not in time_list:
-                        point_rainfall_result[station].append(0)
-                    else:
-                        index = time_list.index(timex)
-                        if point_rainfall_tmp[station][index][1] == None:
-                            point_rainfall_result[station].append(0)
-                        else:
-                            point_rainfall_result[station].append(
-                                point_rainfall_tmp[station][index][1])
-    
+            # 各测站逐小时对齐，缺测补0
+            stations, grid = rainfall_grid.grid_stations(tmp, start_time, length, fill=0)
+            point_rainfall_result = defaultdict(list, zip(stations, grid.tolist()))
+
             self.data["point_rainfall"] = point_rainfall_result
 
 
@@ -255,7 +243,7 @@ class XAJ_PR():
 
             # 关闭数据库
             cursor.close()
-            conn.close()
+            db.release(conn)
 
         except Exception as e:
             print("load data from db error")
@@ -274,12 +262,6 @@ class XAJ_PR():
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database']
-
             # 入参
             start_time = self.ins.start
             end_time = self.ins.end
@@ -295,8 +277,7 @@ class XAJ_PR():
 
             # 建立数据库连接
             try:
-                conn = mysql.connect(
-                    host=address, port=port, user=user, password=password, database=database)
+                conn = db.connect(self.db_config, "database")
             except BaseException as e:
                 print("connect to mysql error: {}".format(e))
                 logging.error("connect to mysql error: {}".format(e))
@@ -306,19 +287,12 @@ class XAJ_PR():
             cursor = conn.cursor()
 
             # 获取inflow和outflow
-            sql = "SELECT (INFLOW) FROM {} WHERE TM BETWEEN '{}' and '{}' and BATCH = '{}' and TYPE = '{}' order by TM".format(
-                in_outflow_table_name, start_time, end_time, _batch, _type)
-            cursor.execute(sql)
-
-            tmp = cursor.fetchall()
-            self.data["inflow_x"] = [float(x[0]) for x in tmp]
-
-            sql = "SELECT (OUTFLOW) FROM {} WHERE TM BETWEEN '{}' and '{}' and BATCH = '{}' and TYPE = '{}' order by TM".format(
-                in_outflow_table_name, start_time, end_time, _batch, _type)
-            cursor.execute(sql)
+            flow = db.select_columns(cursor, in_outflow_table_name, ["INFLOW", "OUTFLOW"],
+                                     "TM BETWEEN '{}' and '{}' and BATCH = '{}' and TYPE = '{}'".format(
+                                         start_time, end_time, _batch, _type), "TM")
 
-            tmp = cursor.fetchall()
-            self.data["outflow_x"] = [float(x[0]) for x in tmp]
+            self.data["inflow_x"] = [float(x) for x in flow["INFLOW"]]
+            self.data["outflow_x"] = [float(x) for x in flow["OUTFLOW"]]
 
             # 获取数据
             sql = "select (value) from {} where TIME between '{}' and '{}' and BATCH = '{}' and TYPE = '{}' order by TIME".format(
@@ -349,23 +323,9 @@ class XAJ_PR():
             length = int((datetime.datetime.strptime(
                 end_time, "%Y-%m-%d %H:%M:%S") - datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")).total_seconds() / 60 / 60) + 1 - 72
 
-            self.data['inflow'] = []
-
-            # convert datetime.datetime to str
-            exist_time = [x[1] for x in tmp]
-            exist_time = [str(x.strftime("%Y-%m-%d %H:%M:%S"))
-                          for x in exist_time]
-
-            for i in range(length):
-                timex = datetime.datetime.strptime(
-                    start_time, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(hours=i)
-                timex = str(timex.strftime("%Y-%m-%d %H:%M:%S"))
-
-                if timex not in exist_time:
-                    self.data['inflow'].append(-1)
-                else:
-                    index = exist_time.index(timex)
-                    self.data['inflow'].append(float(tmp[index][2]))
+            # 逐小时对齐实测流量，缺测补-1
+            self.data['inflow'] = rainfall_grid.grid_series(
+                tmp, datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S"), max(length, 0), fill=-1).tolist()
 
             # 实测降雨后补72个-1
             for i in range(72):
@@ -401,7 +361,7 @@ class XAJ_PR():
 
             # 关闭数据库
             cursor.close()
-            conn.close()
+            db.release(conn)
 
         except Exception as e:
             print("load data from db error")
@@ -411,6 +371,56 @@ class XAJ_PR():
         print("load data from db success")
         logging.info("load data from db success")
 
+    # 读取集合预报的情景降雨: batches 为各成员的降雨批次，一次查询读取全部批次
+    # 需在 load_data_from_db 之后调用，各成员降雨长度与 self.length 一致
+    def load_ensemble_from_db(self, batches):
+        if "db" not in self.config.keys():
+            print("config db is error")
+            exit(1)
+
+        try:
+            # 数据库参数
+            self.db_config = self.config['db']['values']
+
+            rainfall_table_name = self.config['db']['in']['values']['rainfall']
+
+            # 建立数据库连接
+            try:
+                conn = db.connect(self.db_config, "database")
+            except BaseException as e:
+                print("connect to mysql error: {}".format(e))
+                logging.error("connect to mysql error: {}".format(e))
+                exit(1)
+
+            cursor = conn.cursor()
+
+            batch_list = ", ".join(["'{}'".format(batch) for batch in batches])
+            sql = "select BATCH, TIME, value from {} where TIME between '{}' and '{}' and BATCH IN ({}) and TYPE = '{}' order by TIME".format(
+                rainfall_table_name, self.ins.start, self.ins.end, batch_list, self.ins.type)
+            cursor.execute(sql)
+
+            tmp = cursor.fetchall()
+            self.data["ensemble_rainfall"], missing = ensemble.member_rainfall(
+                tmp, batches, self.ins.start, self.length)
+
+            # 缺测时段的降雨按0计算
+            for batch, count in zip(batches, missing):
+                if count > 0:
+                    print("ensemble batch {} misses {} hours".format(batch, count))
+                    logging.warning("ensemble batch {} misses {} hours".format(batch, count))
+
+            # 关闭数据库
+            cursor.close()
+            db.release(conn)
+
+        except Exception as e:
+            print("load ensemble data from db error")
+            logging.error("load ensemble data from db error, error: {}".format(e))
+            print(e)
+
+        print("load ensemble data from db success")
+        logging.info("load ensemble data from db success")
+
     # 给数据库中写入数据
 
     def write_data_to_db(self):
@@ -423,25 +433,18 @@ class XAJ_PR():
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database']
-
             # 建立数据库连接
-            conn = mysql.connect(host=address, port=port,
-                                 user=user, password=password, database=database)
+            conn = db.connect(self.db_config, "database")
 
             table_name = self.config['db']['out']['values']
 
             # 写入数据 保存self.result_xaj中的数据
-            cursor = conn.cursor()
 
             batch = self.ins.batch
             _type = self.ins.type
             _zv_type = str(self.zv_type)
 
+            values = []
             for i in range(len(self.result_xaj)):
                 timex = self.result_xaj[i][0]
                 QX = float(self.result_xaj[i][1])
@@ -468,17 +471,14 @@ class XAJ_PR():
                 if PR_R < 0:
                     PR_R = 0
 
-                # sql = "INSERT INTO {} (TIME, BATCH, QX, QP, PR_R, TYPE) VALUES ('{}', '{}', {}, {}, {}, {}) ON DUPLICATE KEY UPDATE QX = {}, QP = {}, PR_R = {}".format(table_name, timex, batch, QX, QP, PR_R, _type, QX, QP, PR_R)
-                # sql = "INSERT INTO {} (TIME, BATCH, QX, QP, PR_R, TYPE) values ('{}', '{}', '{}', {}, {}, {})".format(table_name, timex, batch, QX, QP, PR_R, _type)
-                sql = "INSERT INTO {} (TIME, BATCH, QX, QP, PR_R, ZX_R, ZX_A, ZP_R, ZP_A, TYPE, ZV_TYPE) VALUES ('{}', '{}', {}, {}, {}, {}, {}, {}, {}, {}, '{}') ON DUPLICATE KEY UPDATE QX = {}, QP = {}, PR_R = {}, ZX_A = {}, ZP_A = {}".format(
-                    table_name, timex, batch, QX, QP, PR_R, ZX_R, ZX_A, ZP_R, ZP_A, _type, _zv_type, QX, QP, PR_R, ZX_A, ZP_A)
+                values.append((timex, batch, QX, QP, PR_R, ZX_R, ZX_A, ZP_R, ZP_A, _type, _zv_type))
 
-                cursor.execute(sql)
+            # 更新式插入, 已有记录时只更新 QX、QP、PR_R、ZX_A、ZP_A
+            db.bulk_upsert(conn, table_name,
+                           ["TIME", "BATCH", "QX", "QP", "PR_R", "ZX_R", "ZX_A", "ZP_R", "ZP_A", "TYPE", "ZV_TYPE"],
+                           values, ["QX", "QP", "PR_R", "ZX_A", "ZP_A"], db.write_chunk_size(self.config))
 
-            conn.commit()
-
-            cursor.close()
-            conn.close()
+            db.release(conn)
         except Exception as e:
             print("write data to db error")
             print(e)
@@ -488,6 +488,48 @@ class XAJ_PR():
         print("write data to db success")
         logging.info("write data to db success")
 
+    # 写入集合预报的分位数, 列名为 QX_P10、ZX_P50 等
+    def write_ensemble_to_db(self):
+        if "db" not in self.config.keys():
+            print("config db is error")
+            logging.error("config db is error for write ensemble to db")
+            exit(1)
+
+        try:
+            # 数据库参数
+            self.db_config = self.config['db']['values']
+
+            # 建立数据库连接
+            conn = db.connect(self.db_config, "database")
+
+            # 分位数写入单独的集合预报输出表
+            table_name = self.config['db']['out_ensemble']['values']
+
+            batch = self.ins.batch
+            _type = self.ins.type
+            _zv_type = str(self.zv_type)
+
+            values = []
+            for timex, row in self.result_ensemble:
+                # 流量保留小数点后4位且不小于0，水位保留小数点后3位
+                row = [round(max(float(v), 0), 4) if column[0] == "Q" else round(float(v), 3)
+                       for column, v in zip(self.ensemble_columns, row)]
+
+                values.append([timex, batch, _type, _zv_type] + row)
+
+            db.bulk_upsert(conn, table_name, ["TIME", "BATCH", "TYPE", "ZV_TYPE"] + self.ensemble_columns,
+                           values, self.ensemble_columns, db.write_chunk_size(self.config))
+
+            db.release(conn)
+        except Exception as e:
+            print("write ensemble to db error")
+            print(e)
+            logging.error("write ensemble to db error, error: {}".format(e))
+            exit(0)
+
+        print("write ensemble to db success")
+        logging.info("write ensemble to db success")
+
     # 从SQLite中读取数据
 
     def load_data_from_sqlite(self):
@@ -508,6 +550,7 @@ class XAJ_PR():
         inflow_table_name = self.config['sqlite']['in']['values']['inflow']
 
         # 连接数据库
+        import sqlite3
         conn = sqlite3.connect(self.sqlite_config)
         cursor = conn.cursor()
 
@@ -557,6 +600,7 @@ class XAJ_PR():
         self.sqlite_config = self.config['sqlite']['path']['values']
 
         # 连接数据库
+        import sqlite3
         conn = sqlite3.connect(self.sqlite_config)
         cursor = conn.cursor()
 
@@ -633,11 +677,8 @@ class XAJ_PR():
         else:
             return 1
 
-    # PR模型计算
-    def PR_calculate(self):
-        N = self.length
-        E0 = self.data['evaporation']
-        P0 = self.data['rainfull']
+    # PR模型衰减系数K, 取开始时刻+47小时所在月份的值
+    def PR_K(self):
         # E_sum = np.sum(E0[47:(47+24)])
         # K = 1 - 0.95 * E_sum / 80
         # TODO: 使用新的K值计算
@@ -650,103 +691,58 @@ class XAJ_PR():
         K = self.config["PR"]["values"][revisor_type]["K"][k_month-1]
         print("k_month: ", k_month, "K: ", K)
 
-        kc = self.ins.p_kc
-        area = self.ins.p_area
-        FR0 = self.ins.p_FR0
-        S0 = self.ins.p_S0
-        QI0 = self.ins.p_QI0
-        QG0 = self.ins.p_QG0
-        SM = self.ins.p_SM
-        EX = self.ins.p_EX
-        KI = self.ins.p_KI
-        KG = self.ins.p_KG
-        CI = self.ins.p_CI
-        CG = self.ins.p_CG
-        UH = self.ins.p_UH
-
-        P_set = np.array(self.data["day_rainfall"])[-20:]
-        Pa = 0
-        doc = [] 
-        R = [0] * N
-
-        # print(P_set)
-        for day in range(0, len(P_set)):
-            Pa = Pa + K ** (day + 1) * P_set[len(P_set) - day - 1]
-        
-        print("Pa: ", Pa)
-
-        # 判断Pa是否位nan
-        if math.isnan(Pa):
-            Pa = 0
+        return K
 
-        if Pa > 80:
-            Pa = 80
-        
-        SUM_P = 0
+    # 降雨径流曲线 R = a * (P + Pa) ^ b 的系数
+    def PR_curve(self, rainstorm_center):
+        '''
+            董铺上游=0.00059199399469861*（P+Pa）^2.15219493931108
+            董铺下游=0.00174276402839024*（P+Pa）^1.92834705920637
+            大房郢上游=0.000780474937164339*（P+Pa）^2.04252570988374
+            大房郢下游=0.00047030380416462*（P+Pa）^2.20305737583984
+        '''
+        # 判断暴雨中心
+        if rainstorm_center == 1:
+            if self.ins.type == "0":        # 董铺上游
+                return 0.00059199399469861, 2.15219493931108
+            else:                           # 大房郢上游
+                return 0.000780474937164339, 2.04252570988374
+        else:
+            if self.ins.type == "0":
+                return 0.00174276402839024, 1.92834705920637
+            else:
+                return 0.00047030380416462, 2.20305737583984
 
-        rainfall_copy = self.data['rainfull'].copy()
-        for t in range(47):
-            rainfall_copy[t] = 0
+    # PR模型计算
+    def PR_calculate(self):
+        N = self.length
 
-        rainstorm_center = self.PR_rainstorm_center()
+        K = self.PR_K()
 
-        print("tainstorm_center:", rainstorm_center)
+        params = pr_batch.args_to_params(self.ins)
 
-        print("Pa: ", Pa)
-        print("K: ", K)
+        Pa = pr_batch.antecedent_precipitation(self.data["day_rainfall"], K)
         
-        for t in range(N):          # PR模型前47个点不计算
-            P = float(rainfall_copy[t])
-            SUM_P += P
-            # for hour in range(1, 480):
-                # Pa = Pa + K ** hour * P_set[480 - hour + t - 1]
-            '''
-                董铺上游=0.00059199399469861*（P+Pa）^2.15219493931108
-                董铺下游=0.00174276402839024*（P+Pa）^1.92834705920637
-                大房郢上游=0.000780474937164339*（P+Pa）^2.04252570988374
-                大房郢下游=0.00047030380416462*（P+Pa）^2.20305737583984
-            '''
-            # 判断暴雨中心
-            if rainstorm_center == 1:
-                if self.ins.type == "0":        # 董铺上游
-                    R[t] = 0.00059199399469861 * (SUM_P + Pa) ** 2.15219493931108
-                else:                           # 大房郢上游
-                    R[t] = 0.000780474937164339 * (SUM_P + Pa) ** 2.04252570988374
-            else:
-                if self.ins.type == "0":
-                    R[t] = 0.00174276402839024 * (SUM_P + Pa) ** 1.92834705920637
-                else:
-                    R[t] = 0.00047030380416462 * (SUM_P + Pa) ** 2.20305737583984
-
-            # 计算净雨量
-            if t == 0:
-                net_rainfall = 0
-            else:
-                net_rainfall = R[t] - R[t-1]
-            
-            # print(net_rainfall)
+        print("Pa: ", Pa[0])
 
-            E = float(self.data['evaporation'][t])
-            EP = kc * E
-            PE = max(P - EP, 0)
+        # PR模型前47个点不计算
+        rainfall_copy = np.asarray(self.data['rainfull'][:N], dtype=float)
+        rainfall_copy[:47] = 0
 
-            # 计算三水源划分
-            if PE == 0:
-                FR = 0
-            else:
-                FR = net_rainfall/PE
+        rainstorm_center = self.PR_rainstorm_center()
 
-            RS, RI, RG, S0, FR0 = self.XAJ_three_source(
-                FR, net_rainfall, PE, SM, EX, S0, FR0, KI, KG)
+        print("tainstorm_center:", rainstorm_center)
 
-            # 更新数据
-            doc.append([RS, RI, RG])
+        print("Pa: ", Pa[0])
+        print("K: ", K)
 
-        # 汇流计算
-        doc = np.array(doc)
+        a, b = self.PR_curve(rainstorm_center)
 
         # 计算径流量
-        Q = self.XAJ_confluence(doc, area, CI, CG, UH, QI0, QG0)
+        Q, R = pr_batch.simulate(
+            rainfall_copy, self.data['evaporation'][:N], Pa, a, b, params)
+        Q = Q[0]
+        R = R[0].tolist()
 
         # 实时矫正
         Q = self.realtime_correct(Q, "PR")
@@ -784,8 +780,78 @@ class XAJ_PR():
         # print(self.result_pr)
         return self.result_pr
 
+    # PR模型多情景计算: K_list为多个衰减系数，或Pa_list直接给定多个前期影响雨量
+    # 返回 M×T 的流量矩阵, correct为True时对每个情景进行实时矫正和流量过程修正
+    def PR_calculate_scenarios(self, K_list=None, Pa_list=None, correct=False):
+        N = self.length
+
+        if Pa_list is not None:
+            Pa = np.asarray(Pa_list, dtype=float)
+            Pa = np.minimum(Pa, 80)
+        else:
+            if K_list is None:
+                K_list = [self.PR_K()]
+            Pa = pr_batch.antecedent_precipitation(self.data["day_rainfall"], K_list)
+
+        params = pr_batch.args_to_params(self.ins)
+
+        rainfall_copy = np.asarray(self.data['rainfull'][:N], dtype=float)
+        rainfall_copy[:47] = 0
+
+        a, b = self.PR_curve(self.PR_rainstorm_center())
+
+        Q, _ = pr_batch.simulate(
+            rainfall_copy, self.data['evaporation'][:N], Pa, a, b, params)
+
+        if correct:
+            for m in range(Q.shape[0]):
+                q = self.realtime_correct(Q[m].copy(), "PR")
+                Q[m] = self.correct_water_module(q)
+
+        # 前47小时为0
+        Q[:, :47] = 0
+
+        return Q
+
     # XAJ模型计算
     def XAJ_calculate(self):
+        # 配置了热启动时从状态库继续计算
+        if "state" in self.config.keys() and self.config["state"]["values"]["enable"]:
+            Q = self.XAJ_simulate_warm()
+        else:
+            Q = self.XAJ_simulate()
+
+        # 实时矫正
+        Q = self.realtime_correct(Q, "XAJ")
+
+        # 修正模块
+        Q = self.correct_water_module(Q)
+
+
+        # 计算水位, 单降雨水位；全部水位
+        inflowx = [0] * self.length
+        outflowx = [0] * self.length
+
+        Z_rainfall = self.cal_water_z(Q, inflowx, outflowx)
+
+        inflow_x = self.data["inflow_x"]
+        outflow_x = self.data["outflow_x"]
+
+        Z_all = self.cal_water_z(Q, inflow_x, outflow_x)
+
+        start_time = self.ins.start
+        for i in range(len(Q)):
+            # 每次加10分钟, start_time是一个字符串
+            time_index = datetime.datetime.strptime(
+                start_time, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(minutes=60*i)
+            time_index = str(time_index.strftime("%Y-%m-%d %H:%M:%S"))
+            self.result_xaj.append((time_index, Q[i], Z_rainfall[i], Z_all[i]))
+
+        # print(self.result_xaj)
+        return self.result_xaj
+
+    # XAJ模型逐时段产流、汇流计算, 从命令行参数给定的初始状态开始
+    def XAJ_simulate(self):
 
         # XAJ算法参数
         area = self.ins.x_area
@@ -838,36 +904,135 @@ class XAJ_PR():
         doc = np.array(doc)
 
         # 计算径流量
-        Q = self.XAJ_confluence(doc, area, CI, CG, UH, QI0, QG0)
+        return self.XAJ_confluence(doc, area, CI, CG, UH, QI0, QG0)
 
-        # 实时矫正
-        Q = self.realtime_correct(Q, "XAJ")
+    # 热启动计算流量: 从状态库中读取本次起始时刻起已计算的时段，只计算其后的时段，
+    # 并保存实测部分(前 observed 个时段)新计算时段末的状态
+    def XAJ_simulate_warm(self):
+        import state_store
 
-        # 修正模块
-        Q = self.correct_water_module(Q)
+        setting = self.config["state"]["values"]
 
+        params = xaj_batch.args_to_params(self.ins)
+        key = state_store.params_key(params)
 
-        # 计算水位, 单降雨水位；全部水位
-        inflowx = [0] * self.length
-        outflowx = [0] * self.length
+        N = self.length
+        observed = min(setting["observed"], N)
 
-        Z_rainfall = self.cal_water_z(Q, inflowx, outflowx)
+        start_time = datetime.datetime.strptime(self.ins.start, "%Y-%m-%d %H:%M:%S")
+        times = [(start_time + datetime.timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S") for i in range(N)]
+
+        # 起始时刻之前的时段, 用于读取起始状态及地表径流汇流所需的地表径流
+        n_history = max(len(params["UH"]) - 1, 1)
+        history_times = [(start_time - datetime.timedelta(hours=n_history - i)).strftime("%Y-%m-%d %H:%M:%S")
+                         for i in range(n_history)]
+
+        store = state_store.StateStore(setting["path"], setting["table"])
+
+        Q, values, k = state_store.resume(
+            store, self.ins.type, key, params, self.data['rainfull'][:N], self.data['evaporation'][:N],
+            times, history_times, observed)
+
+        if observed > k:
+            store.save(self.ins.type, key, times[k:observed],
+                       {column: values[column][:observed - k] for column in state_store.STATE_COLUMNS})
+
+        store.prune((start_time - datetime.timedelta(days=setting["keep_days"])).strftime("%Y-%m-%d %H:%M:%S"))
+        store.close()
+
+        print("warm start: {} saved hours, {} new hours".format(k, N - k))
+        logging.info("warm start: {} saved hours, {} new hours".format(k, N - k))
+
+        return Q
+
+    # XAJ模型批量计算: param_list为多组参数(格式同配置文件XAJ.values.dongpu), 为空时使用命令行参数
+    # 返回 M×T 的流量矩阵, correct为True时对每组结果进行实时矫正和流量过程修正
+    def XAJ_calculate_batch(self, param_list=None, correct=False):
+        if param_list is None:
+            param_list = [xaj_batch.args_to_params(self.ins)]
+
+        params = xaj_batch.stack_params(param_list)
+
+        P = self.data['rainfull'][:self.length]
+        E = self.data['evaporation'][:self.length]
+
+        Q = xaj_batch.simulate(P, E, params)
+
+        if correct:
+            for m in range(Q.shape[0]):
+                q = self.realtime_correct(Q[m].copy(), "XAJ")
+                Q[m] = self.correct_water_module(q)
+
+        return Q
+
+    # 集合预报计算: rainfall 为 M×T 的各成员降雨，为空时使用 load_ensemble_from_db 读取的情景降雨，
+    # 若未读取则按配置对预报降雨进行扰动(第48个时刻起)
+    # XAJ、PR模型对全部成员一次批量计算，逐成员实时矫正、修正并计算全部水位，结果为各时刻的分位数
+    def ensemble_calculate(self, rainfall=None):
+        N = self.length
+        setting = self.config["ensemble"]["values"]
+        percentiles = setting["percentiles"]
+
+        if rainfall is None:
+            if "ensemble_rainfall" in self.data.keys():
+                rainfall = self.data["ensemble_rainfall"]
+            else:
+                rainfall = ensemble.perturb_rainfall(
+                    self.data['rainfull'][:N], setting["members"], setting["sigma"], setting["seed"], start=47)
+
+        rainfall = np.asarray(rainfall, dtype=float)[:, :N]
+        M = rainfall.shape[0]
+
+        E = self.data['evaporation'][:N]
+
+        # XAJ模型, 各成员参数相同
+        params = xaj_batch.stack_params([xaj_batch.args_to_params(self.ins)] * M)
+        Q_xaj = xaj_batch.simulate(rainfall, E, params)
+
+        # PR模型, 前期影响雨量和暴雨中心由实测数据确定，各成员相同
+        Pa = pr_batch.antecedent_precipitation(self.data["day_rainfall"], self.PR_K())
+        a, b = self.PR_curve(self.PR_rainstorm_center())
+
+        rainfall_pr = rainfall.copy()
+        rainfall_pr[:, :47] = 0
+
+        Q_pr, _ = pr_batch.simulate(
+            rainfall_pr, E, Pa, a, b, pr_batch.args_to_params(self.ins))
 
         inflow_x = self.data["inflow_x"]
         outflow_x = self.data["outflow_x"]
 
-        Z_all = self.cal_water_z(Q, inflow_x, outflow_x)
+        Z_xaj = np.zeros((M, N))
+        Z_pr = np.zeros((M, N))
+        for m in range(M):
+            q = self.realtime_correct(Q_xaj[m].copy(), "XAJ")
+            Q_xaj[m] = self.correct_water_module(q, rainfall[m])
+            Z_xaj[m] = self.cal_water_z(Q_xaj[m], inflow_x, outflow_x)
 
-        start_time = self.ins.start
-        for i in range(len(Q)):
-            # 每次加10分钟, start_time是一个字符串
-            time_index = datetime.datetime.strptime(
-                start_time, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(minutes=60*i)
-            time_index = str(time_index.strftime("%Y-%m-%d %H:%M:%S"))
-            self.result_xaj.append((time_index, Q[i], Z_rainfall[i], Z_all[i]))
+            q = self.realtime_correct(Q_pr[m].copy(), "PR")
+            Q_pr[m] = self.correct_water_module(q, rainfall[m])
+            Z_pr[m] = self.cal_water_z(Q_pr[m], inflow_x, outflow_x)
 
-        # print(self.result_xaj)
-        return self.result_xaj
+        # 前47小时为0
+        Q_pr[:, :47] = 0
+
+        bands = []
+        self.ensemble_columns = []
+        for name, X in [("QX", Q_xaj), ("ZX", Z_xaj), ("QP", Q_pr), ("ZP", Z_pr)]:
+            bands.append(ensemble.percentile_bands(X, percentiles))
+            self.ensemble_columns += ["{}_P{}".format(name, p) for p in percentiles]
+        bands = np.concatenate(bands)
+
+        self.result_ensemble = []
+        start_time = datetime.datetime.strptime(self.ins.start, "%Y-%m-%d %H:%M:%S")
+        for i in range(N):
+            time_index = (start_time + datetime.timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S")
+            self.result_ensemble.append((time_index, bands[:, i].tolist()))
+
+        print("ensemble members: {}".format(M))
+        logging.info("ensemble members: {}".format(M))
+
+        return self.result_ensemble
 
     # XAJ时段蒸发量计算
     def XAJ_Ep_calculate(self, P, E, WU, WL, EU=0):
@@ -920,11 +1085,8 @@ class XAJ_PR():
             RI = 0
             RG = 0
         else:
-            AU = MS * (1 - (1 - (S0*FR0/FR) / SM)**(1/(1+EX)))
-
-            # 若AU为复数，则只取实数部分
-            if AU.imag != 0:
-                AU = AU.real
+            # 自由水蓄量超过SM时按蓄满处理
+            AU = MS * (1 - max(1 - (S0*FR0/FR) / SM, 0)**(1/(1+EX)))
 
             if PE + AU < MS:
                 RS = FR * (PE + S0*FR0/FR - SM + SM*(1 - (PE+AU)/MS)**(EX+1))
@@ -961,27 +1123,10 @@ class XAJ_PR():
 
     # XAJ汇流计算
     def XAJ_confluence(self, doc, area, CI, CG, UH, QI0, QG0):
-        N = len(doc)
-        tmp_doc = np.zeros((N, 9))
-        tmp_doc[:, 0] = doc[:, 0]
-        tmp_doc[:, 1] = doc[:, 1]
-        tmp_doc[:, 2] = doc[:, 2]
-        doc = tmp_doc
-
-        # 汇流
-        temp = np.convolve(doc[:, 0], UH)
-        doc[:, 3] = temp[:N]
-
-        for t in range(N):
-            QI = (1 - CI) * doc[t, 1] * area / 3.6 + CI * QI0
-            QG = (1 - CG) * doc[t, 2] * area / 3.6 + CG * QG0
-            doc[t, 4] = QI
-            doc[t, 5] = QG
-            QI0 = QI
-            QG0 = QG
-        doc[:, 6] = doc[:, 3] + doc[:, 4] + doc[:, 5]  # 总流量
-
-        return doc[:, 6]
+        doc = np.asarray(doc, dtype=float)
+
+        # 汇流, 地表径流按单位线卷积，壤中流和地下径流按线性水库滤波
+        return confluence.route(doc[:, 0], doc[:, 1], doc[:, 2], UH, area, CI, CG, QI0, QG0)
 
     # 洪峰位置平滑校正（前五个时刻+洪峰时刻+后五个时刻）
     def peak_smooth_correct(self, Q):
@@ -1111,7 +1256,7 @@ class XAJ_PR():
         return correct_Q
 
     # 流量过程修正模块
-    def correct_water_module(self, Q):
+    def correct_water_module(self, Q, rainfall=None):
         '''
             修正规则：
                 从-47时刻开始，找连续48小时降雨之和大于等于5的时刻，以该时刻为分界线进行修正，
@@ -1124,23 +1269,27 @@ class XAJ_PR():
                     5 若小于2，且下时刻降雨为0，则下时刻流量值为上时刻预报流量*0.8
                     6 小于0.6，且下时刻降雨为0，则下时刻流量值为0。
         '''
+        # rainfall 为该流量过程对应的降雨，为空时使用读取的降雨(集合预报中各成员降雨不同)
+        if rainfall is None:
+            rainfall = self.data["rainfull"]
+
         # 针对连续48小时不降雨进行修正
         # 找到第一个不为0的流量值所在的位置
         n1 = 48
         start_index = 0
-        sum_rainfall_tmp = 0
-        for i in range(0, n1 - 1):
-            sum_rainfall_tmp += self.data["rainfull"][i]
-            if sum_rainfall_tmp >= 5:
-                start_index = i
-                break
-        
-        if sum_rainfall_tmp < 5:
-            for i in range(n1, len(Q)):
-                if sum(self.data["rainfull"][i - n1: i]) >= 5:
-                    start_index = i
-                    break
-        
+
+        # 前47个时刻内累计降雨达到5的时刻
+        sum_rainfall = np.cumsum(np.asarray(rainfall[:n1 - 1], dtype=float))
+        hits = np.nonzero(rainfall_window.reaches(sum_rainfall, 5))[0]
+        if len(hits) > 0:
+            start_index = int(hits[0])
+        else:
+            # 连续48小时降雨之和达到5的时刻
+            index = rainfall_window.first_sum_reaching(
+                rainfall[:len(Q) - 1], n1, 5)
+            if index is not None:
+                start_index = index
+
         for i in range(0, start_index):
             Q[i] = Q[i] - 15         # modify 14.49 to 15
             if Q[i] < 0:
@@ -1148,7 +1297,7 @@ class XAJ_PR():
 
         # 针对全部预报流量进行修正
         for i in range(start_index, len(Q) - 1):
-            if self.data["rainfull"][i + 1] < 0.0001:
+            if rainfall[i + 1] < 0.0001:
                 if Q[i] < 0.6:
                     Q[i + 1] = 0
                 elif Q[i] < 2:
@@ -1166,53 +1315,30 @@ class XAJ_PR():
 
     # 计算水位模块
     def cal_water_z(self, Q, inflow, outflow):
-
-        # for i in range(len(Q)):
-        #     print("Q: ", Q[i], "inflow: ", inflow[i], "outflow: ", outflow[i])
-
         start_z = self.ins.z
         length = len(Q)
-        Q = list(Q)
         n1 = 48
 
+        if self.zv is None:
+            self.zv = zv_table.ZVTable(self.z_table, self.v_table)
+
         # 计算实际入库流量， 单位立方米每秒
-        real_Q = [0] * length
-        for i in range(n1, length):
-            real_Q[i] = Q[i] + float(inflow[i]) - float(outflow[i])
+        real_Q = np.asarray(Q[n1:], dtype=float) + np.asarray(inflow[n1:length], dtype=float) - \
+            np.asarray(outflow[n1:length], dtype=float)
 
-        # 计算当前时段入库水量，时间间隔为1小时
-        water_in = [0] * length
-
-        for i in range(n1, length):
-            if i == 0:
-                water_in[i] = real_Q[i] * 3600 / 10000
-            else:
-                water_in[i] = water_in[i-1] + real_Q[i] * 3600 / 10000
+        # 计算当前时段累计入库水量，时间间隔为1小时
+        water_in = np.cumsum(real_Q * 3600 / 10000)
 
         # 根据起调水位获取当前库容, 从水位-库容表中查询
-        # 不同水位下的库容插值，vi=v_inter(z[i])，一维线性插值
-        v_inter = interpolate.interp1d(
-            self.z_table, self.v_table, kind='linear')
-        # 不同库容下的水位插值，zi=z_inter(v[i])，一维线性插值
-        z_inter = interpolate.interp1d(
-            self.v_table, self.z_table, kind='linear')
-
-        start_v = v_inter(start_z)
+        start_v = self.zv.v_of_z(start_z)
 
         # 计算当前时段库容, 库容单位为万立方米
-        water_v = [0] * length
-        for i in range(n1, length):
-            water_v[i] = start_v + water_in[i]
+        water_v = start_v + water_in
 
-        # 计算各时段水位
+        # 计算各时段水位, 超过最大库容时取最大水位
         water_z = [-999] * length
         water_z[n1 - 1] = start_z
-        for i in range(n1, length):
-            # 最大水位范围
-            if water_v[i] > max(self.v_table):
-                water_z[i] = max(self.z_table)
-            else:
-                water_z[i] = float(z_inter(water_v[i]))
+        water_z[n1:] = self.zv.z_of_v_capped(water_v).tolist()
 
         return water_z
 
@@ -1,16 +1,20 @@
 # 新安江模型计算径流量
 import json
 import numpy as np
-import sqlite3
 import argparse
 import datetime
-import pymysql as mysql
-import math
-from scipy import interpolate
 from collections import defaultdict
 
 import logging
 import os
+import sys
+
+import confluence
+import pr_batch
+import rainfall_grid
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import db, zv_table
 
 log_file_path = 'XAJ_PR_REAL.log'
 # 日志配置
@@ -38,6 +42,7 @@ class XAJ_PR():
 
         self.z_table = []     # 水位表
         self.v_table = []     # 库容表
+        self.zv = None        # 水位库容插值表
 
         self.config = None
 
@@ -86,12 +91,6 @@ class XAJ_PR():
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database_monitor']
-
             # 入参
             start_time = self.ins.start
 
@@ -109,8 +108,7 @@ class XAJ_PR():
             PPTN_surface = self.config['db']['in']['values']['surface_pptn']
 
             try:
-                conn = mysql.connect(
-                    host=address, port=port, user=user, password=password, database=database)
+                conn = db.connect(self.db_config, "database_monitor")
             except BaseException as e:
                 print("connect to mysql error: {}".format(e))
                 logging.error("connect to mysql error: {}".format(e))
@@ -135,18 +133,20 @@ class XAJ_PR():
 
             print("zv type: {}".format(self.zv_type))
 
-            # 获取z和v
-            sql = "SELECT (RZ) FROM {} WHERE WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
-                tablename_zv, self.ins.type, self.zv_type)
-            cursor.execute(sql)
-
-            self.z_table = [float(row[0]) for row in cursor.fetchall()]
+            # 获取z和v, 同一版本的水位库容表只查询一次
+            self.zv = zv_table.get_zv_table(self.ins.type, self.zv_type)
+            if self.zv is None:
+                zv = db.select_columns(cursor, tablename_zv, ["RZ", "W"], "WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
+                    self.ins.type, self.zv_type))
 
-            sql = "SELECT (W) FROM {} WHERE WATER_TYPE = '{}' and ZV_TYPE = '{}'".format(
-                tablename_zv, self.ins.type, self.zv_type)
-            cursor.execute(sql)
+                self.z_table = [float(x) for x in zv["RZ"]]
+                self.v_table = [float(x) for x in zv["W"]]
 
-            self.v_table = [float(row[0]) for row in cursor.fetchall()]
+                self.zv = zv_table.set_zv_table(
+                    self.ins.type, self.zv_type, self.z_table, self.v_table)
+            else:
+                self.z_table = self.zv.z.tolist()
+                self.v_table = self.zv.v.tolist()
 
             # 获取点雨量数据
             sql = "select * from {} where TM between '{}' and '{}' order by TM".format(
@@ -157,12 +157,6 @@ class XAJ_PR():
             # 读取数据
             tmp = cursor.fetchall()
 
-            point_rainfall_result = defaultdict(list)
-            point_rainfall_tmp = defaultdict(list)
-
-            for row in tmp:
-                point_rainfall_tmp[row[0]].append((row[1], row[2]))
-
             # 根据pre_start_time和start_time计算长度(小时)
             pre_start_time = datetime.datetime.strptime(
                 pre_start_time, "%Y-%m-%d %H:%M:%S")
@@ -177,22 +171,9 @@ class XAJ_PR():
             length = int((end_time - start_time).total_seconds() / 60 / 60) + 1
 
             print(start_time, end_time)
-            for station in point_rainfall_tmp.keys():
-                time_list = [str(x[0].strftime("%Y-%m-%d %H:%M:%S"))
-                             for x in point_rainfall_tmp[station]]
-                for i in range(length):
-                    timex = start_time + datetime.timedelta(minutes=i * 60)
-                    timex = str(timex.strftime("%Y-%m-%d %H:%M:%S"))
-
-                    if timex not in time_list:
-                        point_rainfall_result[station].append(0)
-                    else:
-                        index = time_list.index(timex)
-                        if point_rainfall_tmp[station][index][1] == None:
-                            point_rainfall_result[station].append(0)
-                        else:
-                            point_rainfall_result[station].append(
-                                point_rainfall_tmp[station][index][1])
+            # 各测站逐小时对齐，缺测补0
+            stations, grid = rainfall_grid.grid_stations(tmp, start_time, length, fill=0)
+            point_rainfall_result = defaultdict(list, zip(stations, grid.tolist()))
 
             self.data["point_rainfall"] = point_rainfall_result
 
@@ -250,7 +231,7 @@ class XAJ_PR():
 
             # 关闭数据库
             cursor.close()
-            conn.close()
+            db.release(conn)
 
         except Exception as e:
             print("load data from db error")
@@ -272,12 +253,6 @@ class XAJ_PR():
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database']
-
             # 入参
             start_time = self.ins.start
 
@@ -296,8 +271,7 @@ class XAJ_PR():
             in_outflow_table_name = self.config['db']['in']['values']['in-outflow']
             # 建立数据库连接
             try:
-                conn = mysql.connect(
-                    host=address, port=port, user=user, password=password, database=database)
+                conn = db.connect(self.db_config, "database")
             except BaseException as e:
                 print("connect to mysql error: {}".format(e))
                 exit(1)
@@ -308,19 +282,12 @@ class XAJ_PR():
             print(pre_start_time, start_time)
 
             # 获取inflow和outflow
-            sql = "SELECT (INFLOW) FROM {} WHERE TM BETWEEN '{}' and '{}' and BATCH = '{}' and TYPE = '{}' order by TM".format(
-                in_outflow_table_name, pre_start_time, start_time, _batch, _type)
-            cursor.execute(sql)
-
-            tmp = cursor.fetchall()
-            self.data["inflow_x"] = [float(x[0]) for x in tmp]
+            flow = db.select_columns(cursor, in_outflow_table_name, ["INFLOW", "OUTFLOW"],
+                                     "TM BETWEEN '{}' and '{}' and BATCH = '{}' and TYPE = '{}'".format(
+                                         pre_start_time, start_time, _batch, _type), "TM")
 
-            sql = "SELECT (OUTFLOW) FROM {} WHERE TM BETWEEN '{}' and '{}' and BATCH = '{}' and TYPE = '{}' order by TM".format(
-                in_outflow_table_name, pre_start_time, start_time, _batch, _type)
-            cursor.execute(sql)
-
-            tmp = cursor.fetchall()
-            self.data["outflow_x"] = [float(x[0]) for x in tmp]
+            self.data["inflow_x"] = [float(x) for x in flow["INFLOW"]]
+            self.data["outflow_x"] = [float(x) for x in flow["OUTFLOW"]]
 
             # 获取z和v
             # sql = "SELECT (Z) FROM {} WHERE TYPE = '{}'".format(
@@ -385,23 +352,9 @@ class XAJ_PR():
             length = int((datetime.datetime.strptime(
                 start_time, "%Y-%m-%d %H:%M:%S") - datetime.datetime.strptime(pre_start_time, "%Y-%m-%d %H:%M:%S")).total_seconds() / 60 / 60) + 1
 
-            self.data['inflow'] = []
-
-            # convert datetime.datetime to str
-            exist_time = [x[1] for x in tmp]
-            exist_time = [str(x.strftime("%Y-%m-%d %H:%M:%S"))
-                          for x in exist_time]
-
-            for i in range(length):
-                timex = datetime.datetime.strptime(
-                    pre_start_time, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(hours=i)
-                timex = str(timex.strftime("%Y-%m-%d %H:%M:%S"))
-
-                if timex not in exist_time:
-                    self.data['inflow'].append(-1)
-                else:
-                    index = exist_time.index(timex)
-                    self.data['inflow'].append(float(tmp[index][2]))
+            # 逐小时对齐实测流量，缺测补-1
+            self.data['inflow'] = rainfall_grid.grid_series(
+                tmp, datetime.datetime.strptime(pre_start_time, "%Y-%m-%d %H:%M:%S"), max(length, 0), fill=-1).tolist()
 
             # 实测降雨后补72个-1
             for i in range(72):
@@ -451,7 +404,7 @@ class XAJ_PR():
 
             # 关闭数据库
             cursor.close()
-            conn.close()
+            db.release(conn)
 
         except Exception as e:
             print("load data from db error")
@@ -461,9 +414,98 @@ class XAJ_PR():
         print("load data from db success")
         logging.info("load data from db success")
 
+    # 读取某一时刻的观测数据(滚动预报中每小时追加), 该时刻无降雨数据时返回None
+    def load_hour_from_db(self, time):
+        if "db" not in self.config.keys():
+            print("config db is error")
+            logging.error("config db is error")
+            exit(1)
+
+        hour = {}
+
+        try:
+            # 数据库参数
+            self.db_config = self.config['db']['values']
+
+            _batch = self.ins.batch
+            _type = self.ins.type
+
+            rainfall_table_name = self.config['db']['in']['values']['rainfall']
+            evaporation_table_name = self.config['db']['in']['values']['evaporation']
+            inflow_table_name = self.config['db']['in']['values']['inflow']
+            in_outflow_table_name = self.config['db']['in']['values']['in-outflow']
+            PPTN_table_name = self.config['db']['in']['values']['point_rainfall']
+
+            try:
+                conn = db.connect(self.db_config, "database")
+            except BaseException as e:
+                print("connect to mysql error: {}".format(e))
+                logging.error("connect to mysql error: {}".format(e))
+                exit(1)
+
+            cursor = conn.cursor()
+
+            sql = "select (VALUE) from {} where TIME = '{}' and BATCH = '{}' and TYPE = '{}'".format(
+                rainfall_table_name, time, _batch, _type)
+            cursor.execute(sql)
+            tmp = cursor.fetchall()
+            if len(tmp) == 0:
+                cursor.close()
+                db.release(conn)
+                return None
+            hour["rainfull"] = float(tmp[0][0])
+
+            sql = "select (VALUE) from {} where TIME = '{}' and BATCH = '{}' and TYPE = '{}'".format(
+                evaporation_table_name, time, _batch, _type)
+            cursor.execute(sql)
+            tmp = cursor.fetchall()
+            hour["evaporation"] = float(tmp[0][0]) if len(tmp) > 0 else 0
+
+            sql = "select * from {} where TIME = '{}' and TYPE = '{}' and BATCH = '{}'".format(
+                inflow_table_name, time, _type, "10000")
+            cursor.execute(sql)
+            tmp = cursor.fetchall()
+            hour["inflow"] = rainfall_grid.grid_series(
+                tmp, datetime.datetime.strptime(time, "%Y-%m-%d %H:%M:%S"), 1, fill=-1)[0]
+
+            sql = "SELECT INFLOW, OUTFLOW FROM {} WHERE TM = '{}' and BATCH = '{}' and TYPE = '{}'".format(
+                in_outflow_table_name, time, _batch, _type)
+            cursor.execute(sql)
+            tmp = cursor.fetchall()
+            if len(tmp) > 0:
+                hour["inflow_x"] = float(tmp[0][0])
+                hour["outflow_x"] = float(tmp[0][1])
+
+            cursor.close()
+            db.release(conn)
+
+            # 点雨量在监控数据库中
+            conn = db.connect(self.db_config, "database_monitor")
+            cursor = conn.cursor()
+
+            sql = "select * from {} where TM = '{}'".format(PPTN_table_name, time)
+            cursor.execute(sql)
+            tmp = cursor.fetchall()
+
+            stations, grid = rainfall_grid.grid_stations(
+                tmp, datetime.datetime.strptime(time, "%Y-%m-%d %H:%M:%S"), 1, fill=0)
+            hour["point_rainfall"] = dict(zip(stations, grid[:, 0].tolist()))
+
+            cursor.close()
+            db.release(conn)
+
+        except Exception as e:
+            print("load hour data from db error")
+            print(e)
+            logging.error("load hour data from db error {}".format(e))
+            return None
+
+        return hour
+
     # 给数据库中写入数据
 
-    def write_data_to_db(self):
+    # rows 为要写入的结果下标，为空时写入全部结果(滚动预报中只写入变化的行)
+    def write_data_to_db(self, rows=None):
         if "db" not in self.config.keys():
             print("config db is error")
             logging.error("config db is error for write data to db")
@@ -473,26 +515,23 @@ class XAJ_PR():
             # 数据库参数
             self.db_config = self.config['db']['values']
 
-            address = self.db_config['address']
-            port = self.db_config['port']
-            user = self.db_config['user']
-            password = self.db_config['password']
-            database = self.db_config['database']
-
             # 建立数据库连接
-            conn = mysql.connect(host=address, port=port,
-                                 user=user, password=password, database=database)
+            conn = db.connect(self.db_config, "database")
 
             table_name = self.config['db']['out']['values']
 
             # 写入数据 保存self.result_xaj中的数据
-            cursor = conn.cursor()
 
             batch = self.ins.batch
             _type = self.ins.type
             _zv_type = str(self.zv_type)
 
-            for i in range(len(self.result_xaj)):
+            if rows is None:
+                rows = range(len(self.result_xaj))
+
+            values = []
+
+            for i in rows:
                 timex = self.result_xaj[i][0]
                 QX = float(self.result_xaj[i][1])
                 QP = float(self.result_pr[i][1])
@@ -518,18 +557,14 @@ class XAJ_PR():
                 if PR_R < 0:
                     PR_R = 0
 
-                # sql = "INSERT INTO {} (TIME, BATCH, QX, QP, PR_R, TYPE) values ('{}', '{}', '{}', {}, {}, {})".format(table_name, timex, batch, QX, QP, PR_R, _type)
-
-                # 更新式插入
-                sql = "INSERT INTO {} (TIME, BATCH, QX, QP, PR_R, ZX_R, ZX_A, ZP_R, ZP_A, TYPE, ZV_TYPE) VALUES ('{}', '{}', {}, {}, {}, {}, {}, {}, {}, {}, '{}') ON DUPLICATE KEY UPDATE QX = {}, QP = {}, PR_R = {}, ZX_A = {}, ZP_A = {}".format(
-                    table_name, timex, batch, QX, QP, PR_R, ZX_R, ZX_A, ZP_R, ZP_A, _type, _zv_type, QX, QP, PR_R, ZX_A, ZP_A)
-
-                cursor.execute(sql)
+                values.append((timex, batch, QX, QP, PR_R, ZX_R, ZX_A, ZP_R, ZP_A, _type, _zv_type))
 
-            conn.commit()
+            # 更新式插入, 已有记录时只更新 QX、QP、PR_R、ZX_A、ZP_A
+            db.bulk_upsert(conn, table_name,
+                           ["TIME", "BATCH", "QX", "QP", "PR_R", "ZX_R", "ZX_A", "ZP_R", "ZP_A", "TYPE", "ZV_TYPE"],
+                           values, ["QX", "QP", "PR_R", "ZX_A", "ZP_A"], db.write_chunk_size(self.config))
 
-            cursor.close()
-            conn.close()
+            db.release(conn)
         except Exception as e:
             print("write data to db error")
             print(e)
@@ -559,6 +594,7 @@ class XAJ_PR():
         inflow_table_name = self.config['sqlite']['in']['values']['inflow']
 
         # 连接数据库
+        import sqlite3
         conn = sqlite3.connect(self.sqlite_config)
         cursor = conn.cursor()
 
@@ -608,6 +644,7 @@ class XAJ_PR():
         self.sqlite_config = self.config['sqlite']['path']['values']
 
         # 连接数据库
+        import sqlite3
         conn = sqlite3.connect(self.sqlite_config)
         cursor = conn.cursor()
 
@@ -680,12 +717,25 @@ class XAJ_PR():
         else:
             return 1
 
-    # PR模型计算
+    # 各时刻的暴雨中心，与逐时刻调用PR_rainstorm_center(index)的结果一致
+    def PR_rainstorm_center_by_hour(self):
+        year = self.ins.start.split(" ")[0].split("-")[0]
 
-    def PR_calculate(self):
-        N = self.length
-        E0 = self.data['evaporation']
-        P0 = self.data['rainfull']
+        # 2018年之前(包括2018)使用v1版本，否则使用v2版本
+        version_year = "v1"
+        if int(year) <= 2018:
+            version_year = "v1"
+        else:
+            version_year = "v2"
+
+        upstream_station = self.config['STCD']['values'][str(self.ins.type)][version_year]['upstream']
+        downstream_station = self.config['STCD']['values'][str(self.ins.type)][version_year]['downstream']
+
+        return pr_batch.rainstorm_center_by_hour(
+            self.data['point_rainfall'], upstream_station, downstream_station, self.length)
+
+    # PR模型衰减系数K, 取开始时刻+47小时所在月份的值
+    def PR_K(self):
         # E_sum = np.sum(E0[47:(47+24)])
         # K = 1 - 0.95 * E_sum / 80
 
@@ -698,91 +748,52 @@ class XAJ_PR():
         K = self.config["PR"]["values"][revisor_type]["K"][k_month-1]
         print("k_month: ", k_month, "K: ", K)
 
-        kc = self.ins.p_kc
-        area = self.ins.p_area
-        FR0 = self.ins.p_FR0
-        S0 = self.ins.p_S0
-        QI0 = self.ins.p_QI0
-        QG0 = self.ins.p_QG0
-        SM = self.ins.p_SM
-        EX = self.ins.p_EX
-        KI = self.ins.p_KI
-        KG = self.ins.p_KG
-        CI = self.ins.p_CI
-        CG = self.ins.p_CG
-        UH = self.ins.p_UH
-
-        # zeros_juzhen = [0] * 480
-        P_set = np.array(self.data["day_rainfall"])[-20:]
-        Pa = 0
-        doc = []
-        R = [0] * N
-        
-        for day in range(1, len(P_set)):
-            Pa = Pa + K ** (day + 1) * P_set[len(P_set) - day - 1]
-        
-        # 判断Pa是否位nan
-        if math.isnan(Pa):
-            Pa = 0
+        return K
 
-        if Pa > 80:
-            Pa = 80
-        
-        SUM_P = 0
-
-        for t in range(N):
-            P = float(self.data['rainfull'][t])
-            SUM_P += P
-            # for hour in range(1, 480):
-                # Pa = Pa + K ** hour * P_set[480 - hour + t - 1]
-            '''
-                董铺上游=0.00059199399469861*（P+Pa）^2.15219493931108
-                董铺下游=0.00174276402839024*（P+Pa）^1.92834705920637
-                大房郢上游=0.000780474937164339*（P+Pa）^2.04252570988374
-                大房郢下游=0.00047030380416462*（P+Pa）^2.20305737583984
-            '''
-            # 判断暴雨中心
-            if self.PR_rainstorm_center(t) == 1:
-                if self.ins.type == "0":        # 董铺上游
-                    R[t] = 0.00059199399469861 * (SUM_P + Pa) ** 2.15219493931108
-                else:                           # 大房郢上游
-                    R[t] = 0.000780474937164339 * (SUM_P + Pa) ** 2.04252570988374
+    # 降雨径流曲线 R = a * (P + Pa) ^ b 的系数
+    def PR_curve(self, rainstorm_center):
+        '''
+            董铺上游=0.00059199399469861*（P+Pa）^2.15219493931108
+            董铺下游=0.00174276402839024*（P+Pa）^1.92834705920637
+            大房郢上游=0.000780474937164339*（P+Pa）^2.04252570988374
+            大房郢下游=0.00047030380416462*（P+Pa）^2.20305737583984
+        '''
+        # 判断暴雨中心
+        if rainstorm_center == 1:
+            if self.ins.type == "0":        # 董铺上游
+                return 0.00059199399469861, 2.15219493931108
+            else:                           # 大房郢上游
+                return 0.000780474937164339, 2.04252570988374
+        else:
+            if self.ins.type == "0":
+                return 0.000866974103358191, 2.17009103644037
             else:
-                if self.ins.type == "0":
-                    R[t] = 0.000866974103358191 * (SUM_P + Pa) ** 2.17009103644037
-                else:
-                    R[t] = 0.00047030380416462 * (SUM_P + Pa) ** 2.20305737583984
+                return 0.00047030380416462, 2.20305737583984
 
-        
-            # 计算净雨量
-            if t == 0:
-                net_rainfall = 0
-            else:
-                net_rainfall = R[t] - R[t-1]
+    # PR模型计算
 
-            
-            E = float(self.data['evaporation'][t])
-            EP = kc * E
-            PE = max(P - EP, 0)
+    def PR_calculate(self):
+        N = self.length
 
+        K = self.PR_K()
 
-            # 计算三水源划分
-            if PE == 0:
-                FR = 0
-            else:
-                FR = net_rainfall/PE
+        params = pr_batch.args_to_params(self.ins)
 
-            RS, RI, RG, S0, FR0 = self.XAJ_three_source(
-                FR, net_rainfall, PE, SM, EX, S0, FR0, KI, KG)
+        Pa = pr_batch.antecedent_precipitation(self.data["day_rainfall"], K, first_day=1)
 
-            # 更新数据
-            doc.append([RS, RI, RG])
+        # 各时刻的暴雨中心
+        rainstorm_center = self.PR_rainstorm_center_by_hour()
 
-        # 汇流计算
-        doc = np.array(doc)
+        a_up, b_up = self.PR_curve(1)
+        a_down, b_down = self.PR_curve(0)
+        a = np.where(rainstorm_center == 1, a_up, a_down)
+        b = np.where(rainstorm_center == 1, b_up, b_down)
 
         # 计算径流量
-        Q = self.XAJ_confluence(doc, area, CI, CG, UH, QI0, QG0)
+        Q, R = pr_batch.simulate(
+            self.data['rainfull'][:N], self.data['evaporation'][:N], Pa, a, b, params)
+        Q = Q[0]
+        R = R[0].tolist()
 
         # 实时矫正
         Q = self.realtime_correct(Q, "PR")
@@ -814,8 +825,41 @@ class XAJ_PR():
 
         return self.result_pr
 
-    # XAJ模型计算
-    def XAJ_calculate(self):
+    # XAJ模型计算, Q 为已计算的流量(滚动预报中增量计算)，为空时从初始状态重新计算
+    def XAJ_calculate(self, Q=None):
+        if Q is None:
+            Q = self.XAJ_simulate()
+
+        # 实时矫正
+        Q = self.realtime_correct(Q, "XAJ")
+
+        # 修正模块
+        Q = self.correct_water_module(Q)
+
+        # 计算水位, 单降雨水位；全部水位
+        inflowx = [0] * self.length
+        outflowx = [0] * self.length
+
+        Z_rainfall = self.cal_water_z(Q, inflowx, outflowx)
+
+        inflow_x = self.data["inflow_x"]
+        outflow_x = self.data["outflow_x"]
+
+        Z_all = self.cal_water_z(Q, inflow_x, outflow_x)
+
+        start_time = self.ins.start
+        for i in range(len(Q)):
+            # 每次加60分钟, start_time是一个字符串
+            time_index = datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(
+                minutes=60*i) - datetime.timedelta(minutes=60*(int(self.ins.n1)))
+            time_index = str(time_index.strftime("%Y-%m-%d %H:%M:%S"))
+            self.result_xaj.append((time_index, Q[i], Z_rainfall[i], Z_all[i]))
+
+        # print(self.result_xaj)
+        return self.result_xaj
+
+    # XAJ模型逐时段产流、汇流计算, 从命令行参数给定的初始状态开始
+    def XAJ_simulate(self):
 
         # XAJ算法参数
         area = self.ins.x_area
@@ -868,35 +912,7 @@ class XAJ_PR():
         doc = np.array(doc)
 
         # 计算径流量
-        Q = self.XAJ_confluence(doc, area, CI, CG, UH, QI0, QG0)
-
-        # 实时矫正
-        Q = self.realtime_correct(Q, "XAJ")
-
-        # 修正模块
-        Q = self.correct_water_module(Q)
-
-        # 计算水位, 单降雨水位；全部水位
-        inflowx = [0] * self.length
-        outflowx = [0] * self.length
-
-        Z_rainfall = self.cal_water_z(Q, inflowx, outflowx)
-
-        inflow_x = self.data["inflow_x"]
-        outflow_x = self.data["outflow_x"]
-
-        Z_all = self.cal_water_z(Q, inflow_x, outflow_x)
-
-        start_time = self.ins.start
-        for i in range(len(Q)):
-            # 每次加60分钟, start_time是一个字符串
-            time_index = datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(
-                minutes=60*i) - datetime.timedelta(minutes=60*(int(self.ins.n1)))
-            time_index = str(time_index.strftime("%Y-%m-%d %H:%M:%S"))
-            self.result_xaj.append((time_index, Q[i], Z_rainfall[i], Z_all[i]))
-
-        # print(self.result_xaj)
-        return self.result_xaj
+        return self.XAJ_confluence(doc, area, CI, CG, UH, QI0, QG0)
 
     # XAJ时段蒸发量计算
     def XAJ_Ep_calculate(self, P, E, WU, WL, EU=0):
@@ -950,10 +966,8 @@ class XAJ_PR():
             RI = 0
             RG = 0
         else:
-            AU = MS * (1 - (1 - (S0*FR0/FR) / SM)**(1/(1+EX)))
-            # 若为复数，只取实数部分
-            if AU.imag != 0:
-                AU = AU.real
+            # 自由水蓄量超过SM时按蓄满处理
+            AU = MS * (1 - max(1 - (S0*FR0/FR) / SM, 0)**(1/(1+EX)))
             if PE + AU < MS:
                 RS = FR * (PE + S0*FR0/FR - SM + SM*(1 - (PE+AU)/MS)**(EX+1))
             else:
@@ -989,27 +1003,10 @@ class XAJ_PR():
 
     # XAJ汇流计算
     def XAJ_confluence(self, doc, area, CI, CG, UH, QI0, QG0):
-        N = self.length
-        tmp_doc = np.zeros((N, 9))
-        tmp_doc[:, 0] = doc[:, 0]
-        tmp_doc[:, 1] = doc[:, 1]
-        tmp_doc[:, 2] = doc[:, 2]
-        doc = tmp_doc
-
-        # 汇流
-        temp = np.convolve(doc[:, 0], UH)
-        doc[:, 3] = temp[:N]
-
-        for t in range(N):
-            QI = (1 - CI) * doc[t, 1] * area / 3.6 + CI * QI0
-            QG = (1 - CG) * doc[t, 2] * area / 3.6 + CG * QG0
-            doc[t, 4] = QI
-            doc[t, 5] = QG
-            QI0 = QI
-            QG0 = QG
-        doc[:, 6] = doc[:, 3] + doc[:, 4] + doc[:, 5]  # 总流量
-
-        return doc[:, 6]
+        doc = np.asarray(doc, dtype=float)
+
+        # 汇流, 地表径流按单位线卷积，壤中流和地下径流按线性水库滤波
+        return confluence.route(doc[:, 0], doc[:, 1], doc[:, 2], UH, area, CI, CG, QI0, QG0)
 
     # 洪峰位置平滑校正（前五个时刻+洪峰时刻+后五个时刻）
     def peak_smooth_correct(self, Q):
@@ -1187,46 +1184,28 @@ class XAJ_PR():
     def cal_water_z(self, Q, inflow, outflow):
         start_z = self.ins.z
         length = len(Q)
-        Q = list(Q)
+        n1 = self.ins.n1 + 1
 
-        # 计算实际入库流量， 单位立方米每秒
-        real_Q = [0] * length
-        for i in range(self.ins.n1 + 1, length):
-            real_Q[i] = Q[i] + float(inflow[i]) - float(outflow[i])
+        if self.zv is None:
+            self.zv = zv_table.ZVTable(self.z_table, self.v_table)
 
-        # 计算当前时段入库水量，时间间隔为1小时
-        water_in = [0] * length
+        # 计算实际入库流量， 单位立方米每秒
+        real_Q = np.asarray(Q[n1:], dtype=float) + np.asarray(inflow[n1:length], dtype=float) - \
+            np.asarray(outflow[n1:length], dtype=float)
 
-        for i in range(self.ins.n1 + 1, length):
-            if i == 0:
-                water_in[i] = real_Q[i] * 3600 / 10000
-            else:
-                water_in[i] = water_in[i-1] + real_Q[i] * 3600 / 10000
+        # 计算当前时段累计入库水量，时间间隔为1小时
+        water_in = np.cumsum(real_Q * 3600 / 10000)
 
         # 根据起调水位获取当前库容, 从水位-库容表中查询
-        # 不同水位下的库容插值，vi=v_inter(z[i])，一维线性插值
-        v_inter = interpolate.interp1d(
-            self.z_table, self.v_table, kind='linear')
-        # 不同库容下的水位插值，zi=z_inter(v[i])，一维线性插值
-        z_inter = interpolate.interp1d(
-            self.v_table, self.z_table, kind='linear')
-
-        start_v = v_inter(start_z)
+        start_v = self.zv.v_of_z(start_z)
 
         # 计算当前时段库容, 库容单位为万立方米
-        water_v = [0] * length
-        for i in range(self.ins.n1 + 1, length):
-            water_v[i] = start_v + water_in[i]
+        water_v = start_v + water_in
 
-        # 计算各时段水位
+        # 计算各时段水位, 超过最大库容时取最大水位
         water_z = [-999] * length
-        water_z[self.ins.n1] = start_z
-        for i in range(self.ins.n1 + 1, length):
-            # 最大水位范围
-            if water_v[i] > max(self.v_table):
-                water_z[i] = max(self.z_table)
-            else:
-                water_z[i] = float(z_inter(water_v[i]))
+        water_z[n1 - 1] = start_z
+        water_z[n1:] = self.zv.z_of_v_capped(water_v).tolist()
 
         return water_z
 
@@ -0,0 +1,212 @@
+# 新安江模型参数率定: 以实测入库流量(inflow)的纳什效率系数为目标，差分进化搜索参数
+import os
+import sys
+import copy
+import json
+import hashlib
+import argparse
+import logging
+import multiprocessing
+import numpy as np
+
+import xaj_batch
+from XAJ_PR import XAJ_PR
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import evolution
+
+log_file_path = 'calibration.log'
+# 日志配置
+logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+
+# 纳什效率系数, sim 为 (M, n)，obs 为 (n,)
+def nse(sim, obs):
+    obs = np.asarray(obs, dtype=float)
+    denominator = np.sum((obs - obs.mean()) ** 2)
+    if denominator == 0:
+        return np.full(sim.shape[0], np.nan)
+    return 1 - np.sum((sim - obs) ** 2, axis=1) / denominator
+
+
+# 率定目标函数: 各场次 1 - NSE 的平均值，对整个候选种群批量计算
+class NSEObjective():
+    def __init__(self, events, base_params, names, spin_up=0) -> None:
+        # events: [(降雨, 蒸发, 实测流量)], 实测流量缺测为-1
+        self.events = events
+        self.base_params = base_params
+        self.names = names
+        self.spin_up = spin_up
+
+    def params_of(self, x):
+        params = dict(self.base_params)
+        for name, value in zip(self.names, x):
+            params[name] = float(value)
+        return params
+
+    def __call__(self, X):
+        params = xaj_batch.stack_params([self.params_of(x) for x in X])
+
+        scores = np.zeros(len(X))
+        for P, E, obs in self.events:
+            mask = obs != -1
+            mask[:self.spin_up] = False
+
+            Q = xaj_batch.simulate(P, E, params)
+            scores += 1 - nse(Q[:, mask], obs[mask])
+
+        return scores / len(self.events)
+
+
+class XAJCalibration():
+    def __init__(self, args) -> None:
+        self.args = args
+        self.config = None
+        self.events = []
+        self.windows = []  # 各场次的 (起始时间, 终止时间)
+        self.result = {}
+
+        self.load_config()
+
+    def load_config(self):
+        # 从配置文件中读取配置
+        with open(self.args.config, 'r', encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        if "calibration" not in self.config.keys():
+            print("config calibration is error")
+            logging.error("config calibration is error")
+            exit(1)
+
+        self.setting = self.config["calibration"]["values"]
+
+    # 率定的参数块, 默认为水库对应的配置
+    def block_name(self):
+        if self.args.block:
+            return self.args.block
+        return "dongpu" if self.args.type == "0" else "dafangying"
+
+    # 读取各场次的降雨、蒸发和实测流量
+    def load_data_from_db(self):
+        if len(self.args.start) != len(self.args.end):
+            print("start and end count mismatch")
+            logging.error("start and end count mismatch")
+            exit(1)
+
+        for start, end in zip(self.args.start, self.args.end):
+            ins = copy.copy(self.args)
+            ins.start = start
+            ins.end = end
+
+            xaj = XAJ_PR(ins)
+            xaj.load_data_from_db()
+
+            if xaj.length == 0 or "inflow" not in xaj.data.keys():
+                print("event {} ~ {} has no data".format(start, end))
+                logging.error("event {} ~ {} has no data".format(start, end))
+                continue
+
+            P = np.asarray(xaj.data['rainfull'][:xaj.length], dtype=float)
+            E = np.asarray(xaj.data['evaporation'][:xaj.length], dtype=float)
+            obs = np.asarray(xaj.data['inflow'][:xaj.length], dtype=float)
+
+            if np.sum(obs[self.setting["spin_up"]:] != -1) < 2:
+                print("event {} ~ {} has no measured inflow".format(start, end))
+                logging.error("event {} ~ {} has no measured inflow".format(start, end))
+                continue
+
+            self.events.append((P, E, obs))
+            self.windows.append((start, end))
+
+        print("load {} events".format(len(self.events)))
+        logging.info("load {} events".format(len(self.events)))
+
+    # 检查点的标识: 参数块、水库类型、场次、预热时段数和固定参数不同时不能续算
+    def checkpoint_key(self, base_params):
+        key = {
+            "block": self.block_name(),
+            "type": self.args.type,
+            "events": self.windows,
+            "spin_up": self.setting["spin_up"],
+            "base_params": base_params,
+        }
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+    # 检查点文件, 配置中的路径可以包含 {block}，按参数块分别保存
+    def checkpoint_path(self):
+        checkpoint = self.args.checkpoint if self.args.checkpoint else self.setting.get("checkpoint")
+        if not checkpoint:
+            return None
+        return checkpoint.format(block=self.block_name())
+
+    def run(self):
+        if len(self.events) == 0:
+            print("Data is None")
+            logging.error("Data is None")
+            exit(0)
+
+        base_params = self.config["XAJ"]["values"][self.block_name()]
+        bounds = self.setting["bounds"]
+        names = list(bounds.keys())
+
+        objective = NSEObjective(self.events, base_params, names, self.setting["spin_up"])
+
+        de = evolution.DifferentialEvolution(
+            objective, [bounds[name] for name in names],
+            pop_size=self.setting["pop_size"], F=self.setting["F"], CR=self.setting["CR"],
+            max_iter=self.args.max_iter if self.args.max_iter else self.setting["max_iter"],
+            tol=self.setting["tol"], seed=self.args.seed,
+            workers=self.args.workers if self.args.workers is not None else self.setting["workers"],
+            checkpoint=self.checkpoint_path(), key=self.checkpoint_key(base_params))
+
+        best_x, best_score = de.run()
+
+        self.result["params"] = objective.params_of(best_x)
+        self.result["nse"] = 1 - best_score
+        self.result["iteration"] = de.iteration
+        self.result["history"] = [1 - x for x in de.history]
+
+        print("NSE: {}".format(self.result["nse"]))
+        logging.info("NSE: {}, params: {}".format(self.result["nse"], self.result["params"]))
+
+        return self.result
+
+    # 将率定后的参数块写入文件, 格式与配置文件中 XAJ.values.dongpu 一致
+    def write_result(self):
+        with open(self.args.output, 'w', encoding="utf-8") as f:
+            json.dump({self.block_name(): self.result["params"], "nse": self.result["nse"]},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    # 打包为exe后进程池需要
+    multiprocessing.freeze_support()
+    try:
+        parser = argparse.ArgumentParser("XAJ calibration")
+        parser.add_argument('--config', type=str, default='./xaj_config.json', help='config file')
+        parser.add_argument("--type", type=str, default="0", help="0: dongpu, 1: dafangying", choices=["0", "1"])
+        parser.add_argument("--batch", type=str, default="10000", help="batch id")
+        parser.add_argument("--start", type=str, action="append", required=True, help="start time of event, repeatable")
+        parser.add_argument("--end", type=str, action="append", required=True, help="end time of event, repeatable")
+        parser.add_argument("--block", type=str, default=None, help="parameter block in XAJ config, e.g. dongpu_minor")
+        parser.add_argument("--max_iter", type=int, default=None, help="max iteration")
+        parser.add_argument("--workers", type=int, default=None, help="process count, 0 for all cores")
+        parser.add_argument("--seed", type=int, default=None, help="random seed")
+        parser.add_argument("--checkpoint", type=str, default=None, help="checkpoint file for resume")
+        parser.add_argument("--output", type=str, default="./xaj_calibrated.json", help="output file")
+
+        args = parser.parse_args()
+
+        print(args.__dict__)
+        logging.info(args.__dict__)
+
+        calibration = XAJCalibration(args)
+        calibration.load_data_from_db()
+        calibration.run()
+        calibration.write_result()
+
+        print("{\"complete\":true}")
+        logging.info("{\"complete\":true}")
+    except Exception as e:
+        print(e)
+        logging.error(e)
@@ -0,0 +1,37 @@
+# 集合预报: 同一时段的多条降雨过程(多个批次的情景降雨或扰动降雨)组成 M×T 的降雨矩阵，
+# 一次批量计算后统计各时刻流量、水位的分位数
+import numpy as np
+
+import rainfall_grid
+
+
+# 按批次整理情景降雨, rows 为 (批次, 时间, 降雨) 记录，按相对 start_time 的小时偏移放入各成员的序列
+# 返回 (批次数 × length) 的数组(批次顺序与 batches 一致，缺测时段为0)及各成员的缺测时段数
+def member_rainfall(rows, batches, start_time, length):
+    members, grid = rainfall_grid.grid_stations(rows, start_time, length, fill=np.nan)
+    index = {str(batch): i for i, batch in enumerate(members)}
+
+    rainfall = np.full((len(batches), length), np.nan)
+    for i, batch in enumerate(batches):
+        if str(batch) in index:
+            rainfall[i] = grid[index[str(batch)]]
+
+    missing = np.sum(np.isnan(rainfall), axis=1)
+    return np.where(np.isnan(rainfall), 0, rainfall), missing
+
+
+# 扰动降雨: 从 start 时刻起对每个时段的降雨乘以均值为1的对数正态随机因子
+# 第一个成员为原始降雨(控制预报)，返回 (members × T) 的数组
+def perturb_rainfall(rainfall, members, sigma, seed=None, start=0):
+    rainfall = np.asarray(rainfall, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    factor = np.ones((members, len(rainfall)))
+    factor[1:, start:] = np.exp(sigma * rng.standard_normal((members - 1, len(rainfall) - start)) - sigma ** 2 / 2)
+
+    return rainfall[None, :] * factor
+
+
+# 各时刻的分位数, X 为 (M, T)，返回 (len(percentiles), T)
+def percentile_bands(X, percentiles):
+    return np.percentile(np.asarray(X, dtype=float), percentiles, axis=0)
@@ -0,0 +1,107 @@
+# PR(降雨径流相关图)模型批量计算：累计降雨一次求和、降雨径流曲线按数组计算，
+# 三水源划分在情景维度(M, 不同的前期影响雨量Pa)上向量化，输出 M×T 径流矩阵
+import numpy as np
+
+import confluence
+import rainfall_window
+import xaj_batch
+
+
+# PR模型参数名(命令行参数前缀为 p_)
+PR_PARAM_KEYS = ["kc", "area", "FR0", "S0", "QI0", "QG0", "SM", "EX", "KI", "KG", "CI", "CG", "UH"]
+
+
+# 从命令行参数中读取PR模型参数
+def args_to_params(ins, prefix="p_"):
+    params = {}
+    for key in PR_PARAM_KEYS:
+        params[key] = getattr(ins, prefix + key)
+    return params
+
+
+# 前期影响雨量 Pa = sum(K^(day+1) * P[-day-1])，K 可以是多个情景
+# 为nan时取0, 最大为cap
+def antecedent_precipitation(day_rainfall, K, first_day=0, cap=80):
+    P_set = np.asarray(day_rainfall, dtype=float)[-20:]
+    K = np.atleast_1d(np.asarray(K, dtype=float))
+
+    days = np.arange(first_day, len(P_set))
+    Pa = (K[:, None] ** (days + 1) * P_set[::-1][days]).sum(axis=1)
+
+    # Pa为nan时取0, 最大为cap
+    Pa = np.where(np.isnan(Pa), 0, Pa)
+    Pa = np.minimum(Pa, cap)
+
+    return Pa
+
+
+# 降雨径流曲线 R = a * (累计降雨 + Pa) ^ b，a、b 为常数或逐时段数组(T,)，返回 (M, T)
+# P 为 (T,) 或 (M, T)(集合预报中每个情景一条降雨过程)
+def runoff_curve(P, Pa, a, b):
+    sum_P = np.atleast_2d(np.cumsum(np.asarray(P, dtype=float), axis=-1))
+    Pa = np.atleast_1d(np.asarray(Pa, dtype=float))
+    return a * (sum_P + Pa[:, None]) ** b
+
+
+# 净雨量, 第一个时段为0
+def net_rainfall(R):
+    net = np.zeros(R.shape)
+    net[:, 1:] = np.diff(R, axis=1)
+    return net
+
+
+# 产流计算，P 为 (T,) 或 (M, T)，返回累计径流 R 及 RS、RI、RG (M, T)
+def runoff_generation(P, E, Pa, a, b, params):
+    P = np.asarray(P, dtype=float)
+    E = np.asarray(E, dtype=float)
+
+    R = runoff_curve(P, Pa, a, b)
+    net = net_rainfall(R)
+    M, T = R.shape
+
+    PE = np.broadcast_to(np.maximum(P - params["kc"] * E, 0), (M, T))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        FR = np.where(PE == 0, 0.0, net / np.where(PE == 0, 1, PE))
+
+    S0 = np.full(M, float(params["S0"]))
+    FR0 = np.full(M, float(params["FR0"]))
+
+    RS = np.zeros((M, T))
+    RI = np.zeros((M, T))
+    RG = np.zeros((M, T))
+    for t in range(T):
+        RS[:, t], RI[:, t], RG[:, t], S0, FR0 = xaj_batch.three_source(
+            FR[:, t], net[:, t], PE[:, t], S0, FR0, params)
+
+    return R, RS, RI, RG
+
+
+# 批量计算，返回流量 Q 与累计径流 R, 均为 (M, T)
+def simulate(P, E, Pa, a, b, params):
+    R, RS, RI, RG = runoff_generation(P, E, Pa, a, b, params)
+    Q = confluence.route(RS, RI, RG, params["UH"], params["area"], params["CI"],
+                         params["CG"], params["QI0"], params["QG0"])
+    return Q, R
+
+
+# 各时刻的暴雨中心: 以各测站 index-23 ~ index 时刻降雨之和最大者为中心，在下游测站为0，否则为1
+# 前23个时刻窗口不完整，各站降雨之和记为0(并列时取上游测站在前的顺序)
+def rainstorm_center_by_hour(point_rainfall, upstream_station, downstream_station, length):
+    stations = list(dict.fromkeys(list(upstream_station) + list(downstream_station)))
+
+    grid = np.zeros((len(stations), length))
+    for i, station in enumerate(stations):
+        series = np.asarray(point_rainfall[station][:length], dtype=float)
+        grid[i, :len(series)] = series
+
+    sums = np.zeros((len(stations), length))
+    for i in range(len(stations)):
+        window_sum = rainfall_window.rolling_sum(grid[i], 24)
+        sums[i, 23:] = window_sum[24:]
+
+    # 与最大值相差在前缀和误差之内的视为并列，取顺序在前的测站
+    center_station = np.argmax(rainfall_window.reaches(sums, sums.max(axis=0)), axis=0)
+    downstream = np.array([station in downstream_station for station in stations])
+
+    return np.where(downstream[center_station], 0, 1)
+
@@ -0,0 +1,61 @@
+# 将数据库中按时间记录的测站数据一次性对齐到逐小时网格上
+# 缺测时段填充 fill，同一时段有重复记录时取第一条(与原逐时段字符串查找的结果一致)
+import numpy as np
+
+
+# 计算各记录相对起始时刻的小时偏移，非整点或超出范围的记录标记为无效
+def hour_offsets(times, start_time, length):
+    if len(times) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=bool)
+
+    seconds = (np.array(times, dtype="datetime64[s]") -
+               np.datetime64(start_time, "s")).astype(np.int64)
+    offsets = seconds // 3600
+    valid = (seconds % 3600 == 0) & (offsets >= 0) & (offsets < length)
+
+    return offsets, valid
+
+
+# 将记录的数值转换为浮点数组，空值为nan
+def _values_to_array(values):
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+
+# 多测站数据网格化, rows 为 (测站, 时间, 数值) 的记录
+# 返回测站列表(按首次出现的顺序)和 (测站数 × length) 的数组
+def grid_stations(rows, start_time, length, fill=0, station_col=0, time_col=1, value_col=2):
+    stations = list(dict.fromkeys(row[station_col] for row in rows))
+    grid = np.full((len(stations), length), float(fill))
+    if len(rows) == 0:
+        return stations, grid
+
+    station_index = {station: i for i, station in enumerate(stations)}
+    rows_station = np.array([station_index[row[station_col]] for row in rows])
+    offsets, valid = hour_offsets([row[time_col] for row in rows], start_time, length)
+    values = _values_to_array([row[value_col] for row in rows])
+
+    # 同一测站同一时段取第一条记录
+    cells = rows_station[valid] * length + offsets[valid]
+    cells, first = np.unique(cells, return_index=True)
+    values = values[valid][first]
+
+    grid.flat[cells] = np.where(np.isnan(values), fill, values)
+
+    return stations, grid
+
+
+# 单站数据网格化，返回长度为 length 的数组
+def grid_series(rows, start_time, length, fill=-1, time_col=1, value_col=2):
+    series = np.full(length, float(fill))
+    if len(rows) == 0:
+        return series
+
+    offsets, valid = hour_offsets([row[time_col] for row in rows], start_time, length)
+    values = _values_to_array([row[value_col] for row in rows])
+
+    cells, first = np.unique(offsets[valid], return_index=True)
+    values = values[valid][first]
+
+    series[cells] = np.where(np.isnan(values), fill, values)
+
+    return series
@@ -0,0 +1,48 @@
+# 降雨滑动窗口统计：用前缀和、分段视图一次计算整条序列的窗口和与窗口最大值
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# 前缀和相减会带来浮点误差，窗口和与阈值比较时允许的误差(降雨数据精度远低于此)
+SUM_TOLERANCE = 1e-9
+
+
+# 窗口和: 返回长度为 len(x)+1 的数组, sums[i] = sum(x[i-window:i]), i < window 时为 nan
+def rolling_sum(x, window):
+    x = np.asarray(x, dtype=float)
+    sums = np.full(len(x) + 1, np.nan)
+    if len(x) < window:
+        return sums
+
+    prefix = np.concatenate(([0.0], np.cumsum(x)))
+    sums[window:] = prefix[window:] - prefix[:-window]
+
+    return sums
+
+
+# 窗口和达到阈值, 允许前缀和的浮点误差; nan 视为未达到
+def reaches(sums, threshold):
+    return np.asarray(sums) >= threshold - SUM_TOLERANCE
+
+
+# 窗口最大值: 返回长度为 len(x)+1 的数组, maxes[i] = max(x[i-window:i]), i < window 时为 nan
+def rolling_max(x, window):
+    x = np.asarray(x, dtype=float)
+    maxes = np.full(len(x) + 1, np.nan)
+    if len(x) < window:
+        return maxes
+
+    maxes[window:] = sliding_window_view(x, window).max(axis=1)
+
+    return maxes
+
+
+# 第一个窗口和达到阈值的位置(窗口为 x[i-window:i])，i 从 start 开始查找，找不到时返回 None
+def first_sum_reaching(x, window, threshold, start=None):
+    sums = rolling_sum(x, window)
+    if start is None:
+        start = window
+    hits = np.nonzero(reaches(sums[start:], threshold))[0]
+    if len(hits) == 0:
+        return None
+    return int(hits[0]) + start
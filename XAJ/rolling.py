@@ -0,0 +1,270 @@
+# 实时预报滚动计算: 常驻内存，降雨、蒸发、实测流量等保存在长度为 n1+n2 的环形缓冲区中，
+# 每追加一个小时的观测只从第一个变化的时段起重新计算XAJ产流，只写入结果变化的预报行
+# 窗口移出的时段末状态作为新窗口的初始状态(连续计算)，不再每次从命令行给定的初始状态冷启动
+import time
+import logging
+import datetime
+import numpy as np
+from collections import defaultdict
+
+import confluence
+import xaj_batch
+
+
+# 窗口中的观测序列及窗口后部(预报时段)的填充值
+SERIES_FILL = {"rainfull": 0, "evaporation": 0, "inflow": -1, "inflow_x": None, "outflow_x": None}
+
+# 各时段保存的XAJ计算结果: 时段末状态及地表径流深、壤中流和地下径流流量
+STEP_KEYS = ["WU", "WL", "WD", "S0", "FR0", "RS", "QI", "QG"]
+
+
+# 定长环形缓冲区, 下标0为最早的时段
+class RingBuffer():
+    def __init__(self, values) -> None:
+        self.data = np.array(values, dtype=float)
+        self.head = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[(self.head + index) % len(self.data)]
+
+    def __setitem__(self, index, value):
+        self.data[(self.head + index) % len(self.data)] = value
+
+    # 追加到末尾，移出并返回最早的值
+    def push(self, value):
+        dropped = self.data[self.head]
+        self.data[self.head] = value
+        self.head = (self.head + 1) % len(self.data)
+        return dropped
+
+    # 从 start 起按时间顺序写入
+    def write(self, start, values):
+        index = (self.head + start + np.arange(len(values))) % len(self.data)
+        self.data[index] = values
+
+    def array(self):
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+
+class RollingForecast():
+    # model 为已读取数据(load_data_from_monitor_db、load_data_from_db)的 XAJ_PR_REAL.XAJ_PR
+    def __init__(self, model) -> None:
+        self.model = model
+        self.length = model.length
+        # 窗口中起始时刻(当前时刻)的下标
+        self.now = model.ins.n1
+
+        self.start_time = datetime.datetime.strptime(model.ins.start, "%Y-%m-%d %H:%M:%S")
+
+        self.series = {name: RingBuffer(model.data[name][:self.length]) for name in SERIES_FILL.keys()}
+        self.stations = self.station_buffers(model.data["point_rainfall"])
+
+        self.params = xaj_batch.args_to_params(model.ins)
+        self.stack = xaj_batch.stack_params([self.params])
+        self.UH = np.asarray(self.params["UH"], dtype=float)
+
+        # 窗口之前的状态及地表径流
+        self.state = {key: float(self.params[key]) for key in xaj_batch.STATE_KEYS}
+        self.RS_history = np.zeros(max(len(self.UH) - 1, 0))
+
+        self.steps = {key: RingBuffer(np.zeros(self.length)) for key in STEP_KEYS}
+
+        # 第一个需要重新计算的时段
+        self.dirty = 0
+        # 已写入的预报行, 时刻 -> 写入的数值
+        self.written = {}
+
+    def station_buffers(self, point_rainfall):
+        buffers = {}
+        for station, values in point_rainfall.items():
+            values = list(values[:self.length])
+            buffers[station] = RingBuffer(values + [0] * (self.length - len(values)))
+        return buffers
+
+    # 时刻对应窗口中的下标
+    def index_of(self, time_str):
+        time_index = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+        return int((time_index - self.start_time).total_seconds() // 3600) + self.now
+
+    # 窗口向后移动一个小时，窗口第一个时段末的状态成为新的初始状态
+    def advance(self):
+        if self.dirty == 0:
+            self.simulate_xaj()
+
+        for key in ["WU", "WL", "WD", "S0", "FR0"]:
+            self.state[key] = self.steps[key][0]
+        self.state["QI0"] = self.steps["QI"][0]
+        self.state["QG0"] = self.steps["QG"][0]
+        if len(self.RS_history) > 0:
+            self.RS_history = np.append(self.RS_history[1:], self.steps["RS"][0])
+
+        for name, fill in SERIES_FILL.items():
+            buffer = self.series[name]
+            buffer.push(buffer[self.length - 1] if fill is None else fill)
+        for buffer in self.stations.values():
+            buffer.push(0)
+        for buffer in self.steps.values():
+            buffer.push(0)
+
+        self.start_time += datetime.timedelta(hours=1)
+        self.dirty = min(self.dirty - 1, self.length - 1)
+
+    # 更新某一时刻的观测, hour 为 XAJ_PR_REAL.load_hour_from_db 的返回值，有数据变化时返回True
+    def update(self, time_str, hour):
+        index = self.index_of(time_str)
+        if index < 0 or index > self.now:
+            return False
+
+        changed = False
+        for name in ["rainfull", "evaporation", "inflow", "inflow_x", "outflow_x"]:
+            if name in hour.keys() and self.series[name][index] != hour[name]:
+                self.series[name][index] = hour[name]
+                changed = True
+
+                # 降雨、蒸发变化时XAJ从该时段起重新计算
+                if name in ["rainfull", "evaporation"]:
+                    self.dirty = min(self.dirty, index)
+
+                # 入库、出库流量在当前时刻之后取当前时刻的值
+                if name in ["inflow_x", "outflow_x"] and index == self.now:
+                    self.series[name].write(index, np.full(self.length - index, hour[name]))
+
+        for station, value in hour.get("point_rainfall", {}).items():
+            if station not in self.stations.keys():
+                self.stations[station] = RingBuffer(np.zeros(self.length))
+            if self.stations[station][index] != value:
+                self.stations[station][index] = value
+                changed = True
+
+        return changed
+
+    # XAJ产流从第一个变化的时段起重新计算，返回窗口的流量过程
+    def simulate_xaj(self):
+        j = self.dirty
+        if j < self.length:
+            if j == 0:
+                state = dict(self.state)
+            else:
+                state = {key: self.steps[key][j - 1] for key in ["WU", "WL", "WD", "S0", "FR0"]}
+                state["QI0"] = self.steps["QI"][j - 1]
+                state["QG0"] = self.steps["QG"][j - 1]
+
+            P = self.series["rainfull"].array()[j:]
+            E = self.series["evaporation"].array()[j:]
+            RS, RI, RG, _, trace = xaj_batch.runoff_generation(P, E, self.stack, state, trace=True)
+
+            for key in ["WU", "WL", "WD", "S0", "FR0"]:
+                self.steps[key].write(j, trace[key][0])
+            self.steps["RS"].write(j, RS[0])
+            self.steps["QI"].write(j, confluence.linear_reservoir(
+                RI[0], self.params["area"], self.params["CI"], state["QI0"]))
+            self.steps["QG"].write(j, confluence.linear_reservoir(
+                RG[0], self.params["area"], self.params["CG"], state["QG0"]))
+
+            self.dirty = self.length
+
+        RS_all = np.concatenate((self.RS_history, self.steps["RS"].array()))
+        QS = confluence.surface_routing(RS_all, self.UH)[len(self.RS_history):]
+
+        return QS + self.steps["QI"].array() + self.steps["QG"].array()
+
+    # 重新计算预报，返回结果变化的行下标
+    def refresh(self):
+        model = self.model
+
+        model.ins.start = self.start_time.strftime("%Y-%m-%d %H:%M:%S")
+        for name, buffer in self.series.items():
+            model.data[name] = buffer.array().tolist()
+        model.data["point_rainfall"] = defaultdict(
+            list, {station: buffer.array().tolist() for station, buffer in self.stations.items()})
+        model.length = self.length
+
+        model.result_xaj = []
+        model.result_pr = []
+        model.XAJ_calculate(self.simulate_xaj())
+        model.PR_calculate()
+
+        changed = []
+        for i in range(self.length):
+            row = (round(float(model.result_xaj[i][1]), 4), round(float(model.result_pr[i][1]), 4),
+                   round(float(model.result_pr_r[i]), 3), round(float(model.result_xaj[i][3]), 3),
+                   round(float(model.result_pr[i][3]), 3))
+            if self.written.get(model.result_xaj[i][0]) != row:
+                self.written[model.result_xaj[i][0]] = row
+                changed.append(i)
+
+        # 已移出窗口的时刻不再保留
+        first_time = model.result_xaj[0][0]
+        self.written = {key: value for key, value in self.written.items() if key >= first_time}
+
+        return changed
+
+    # 重新计算并写入变化的行
+    def publish(self):
+        changed = self.refresh()
+        if len(changed) > 0:
+            self.model.write_data_to_db(changed)
+
+        print("rolling forecast {}: {} rows changed".format(self.model.ins.start, len(changed)))
+        logging.info("rolling forecast {}: {} rows changed".format(self.model.ins.start, len(changed)))
+
+        return changed
+
+    # 是否已到达 end_time
+    def reached(self, end_time):
+        return end_time is not None and self.start_time >= datetime.datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
+
+    # 读取一次当前时刻(数据可能补报)及下一时刻的观测，下一时刻有数据时窗口向后移动
+    # 返回 (数据是否变化, 窗口是否移动)
+    def poll_once(self):
+        now_str = self.start_time.strftime("%Y-%m-%d %H:%M:%S")
+        next_str = (self.start_time + datetime.timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+
+        changed = False
+
+        hour = self.model.load_hour_from_db(now_str)
+        if hour is not None:
+            changed = self.update(now_str, hour)
+
+        hour = self.model.load_hour_from_db(next_str)
+        if hour is None:
+            return changed, False
+
+        self.advance()
+        self.update(next_str, hour)
+
+        # 前期影响雨量按日(9点)统计，每天重新读取一次
+        if self.start_time.hour == 9:
+            self.model.ins.start = next_str
+            self.model.load_data_from_monitor_db()
+            self.stations = self.station_buffers(self.model.data["point_rainfall"])
+
+        return True, True
+
+    # 读取已有的观测，窗口移动到最新有数据的时刻(不超过 end_time)，不等待; 有变化时重新计算并写入一次
+    def catch_up(self, end_time=None):
+        changed = False
+        while not self.reached(end_time):
+            updated, moved = self.poll_once()
+            changed = changed or updated
+            if not moved:
+                break
+
+        if changed:
+            self.publish()
+        return changed
+
+    # 滚动运行: 每隔 poll 秒读取当前时刻(数据可能补报)及下一时刻的观测，
+    # 下一时刻有数据时窗口向后移动；到达 end_time 后停止
+    def follow(self, poll=60, end_time=None):
+        self.publish()
+
+        while not self.reached(end_time):
+            changed, _ = self.poll_once()
+            if changed:
+                self.publish()
+            else:
+                time.sleep(poll)
@@ -0,0 +1,118 @@
+# 新安江模型热启动状态库: 在本地SQLite中按水库、参数和时刻保存各时段末的状态量，
+# 下一次计算从已保存的时段之后继续，不必重新计算整个预热期
+import json
+import hashlib
+import sqlite3
+import numpy as np
+
+import confluence
+import xaj_batch
+
+
+# 每个时段保存的量: 土壤含水量、自由水蓄量、壤中流和地下径流流量、地表径流深及总流量
+STATE_COLUMNS = ["WU", "WL", "WD", "S0", "FR0", "QI", "QG", "RS", "Q"]
+
+
+# 参数标识: 除初始状态外的模型参数相同时，保存的状态才可以继续使用
+def params_key(params):
+    values = {}
+    for key in xaj_batch.RUNOFF_PARAM_KEYS + xaj_batch.CONFLUENCE_PARAM_KEYS:
+        values[key] = float(params[key])
+    values["UH"] = [float(x) for x in params["UH"]]
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class StateStore():
+    def __init__(self, path, table="xaj_state") -> None:
+        self.table = table
+        self.conn = sqlite3.connect(path)
+
+        columns = ", ".join(["{} REAL".format(column) for column in STATE_COLUMNS])
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS {} (TYPE TEXT, PARAMS TEXT, TIME TEXT, {}, PRIMARY KEY (TYPE, PARAMS, TIME))".format(
+                table, columns))
+        self.conn.commit()
+
+    # 读取时刻列表 times 中已保存的时段, 返回 {时刻: {量: 值}}
+    def load(self, water_type, key, times):
+        if len(times) == 0:
+            return {}
+
+        sql = "SELECT TIME, {} FROM {} WHERE TYPE = ? AND PARAMS = ? AND TIME BETWEEN ? AND ?".format(
+            ", ".join(STATE_COLUMNS), self.table)
+        rows = self.conn.execute(sql, (str(water_type), key, min(times), max(times))).fetchall()
+
+        wanted = set(times)
+        return {row[0]: dict(zip(STATE_COLUMNS, row[1:])) for row in rows if row[0] in wanted}
+
+    # 保存各时段的状态, values 为 {量: 与 times 等长的数组}
+    def save(self, water_type, key, times, values):
+        rows = []
+        for i, time in enumerate(times):
+            rows.append([str(water_type), key, time] + [float(values[column][i]) for column in STATE_COLUMNS])
+
+        sql = "INSERT OR REPLACE INTO {} (TYPE, PARAMS, TIME, {}) VALUES ({})".format(
+            self.table, ", ".join(STATE_COLUMNS), ", ".join(["?"] * (len(STATE_COLUMNS) + 3)))
+        self.conn.executemany(sql, rows)
+        self.conn.commit()
+
+    # 删除 before 之前的状态
+    def prune(self, before):
+        self.conn.execute("DELETE FROM {} WHERE TIME < ?".format(self.table), (before,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# 从状态库继续计算, P、E 为 (T,)，times 为各时段的时刻(字符串, 与库中格式一致)
+# 从 times[0] 起连续已保存的时段(最多 observed 个)直接取保存的流量，其后的时段从最后一个已保存时段末的状态开始计算;
+# 地表径流汇流需要之前 len(UH)-1 个时段的地表径流，同样从库中读取
+# 返回流量 Q (T,) 及新计算时段的状态(用于保存), 以及已保存的时段数 k
+def resume(store, water_type, key, params, P, E, times, history_times, observed=None):
+    T = len(times) if observed is None else min(observed, len(times))
+    UH = np.asarray(params["UH"], dtype=float)
+
+    saved = store.load(water_type, key, list(history_times) + list(times))
+
+    k = 0
+    while k < T and times[k] in saved:
+        k += 1
+
+    # 最后一个已保存时段末的状态, 没有时使用参数中的初始状态
+    all_times = list(history_times) + list(times)
+    last = len(history_times) + k - 1
+    state = dict(params)
+    if last >= 0 and all_times[last] in saved:
+        row = saved[all_times[last]]
+        for column in ["WU", "WL", "WD", "S0", "FR0"]:
+            state[column] = row[column]
+        state["QI0"] = row["QI"]
+        state["QG0"] = row["QG"]
+
+    # 之前 len(UH)-1 个时段的地表径流, 缺失时为0
+    RS_prev = np.zeros(max(len(UH) - 1, 0))
+    for i in range(len(RS_prev)):
+        index = last - len(RS_prev) + 1 + i
+        if index >= 0 and all_times[index] in saved:
+            RS_prev[i] = saved[all_times[index]]["RS"]
+
+    Q_saved = np.array([saved[times[i]]["Q"] for i in range(k)], dtype=float)
+
+    p = xaj_batch.stack_params([params])
+    RS, RI, RG, _, trace = xaj_batch.runoff_generation(
+        np.asarray(P, dtype=float)[k:], np.asarray(E, dtype=float)[k:], p, state, trace=True)
+
+    QS = confluence.surface_routing(np.concatenate([RS_prev, RS[0]]), UH)[len(RS_prev):]
+    QI = confluence.linear_reservoir(RI[0], params["area"], params["CI"], state["QI0"])
+    QG = confluence.linear_reservoir(RG[0], params["area"], params["CG"], state["QG0"])
+
+    Q = np.concatenate([Q_saved, QS + QI + QG])
+
+    values = {column: trace[column][0] for column in ["WU", "WL", "WD", "S0", "FR0"]}
+    values["QI"] = QI
+    values["QG"] = QG
+    values["RS"] = RS[0]
+    values["Q"] = QS + QI + QG
+
+    return Q, values, k
@@ -0,0 +1,194 @@
+# 新安江模型批量计算：在参数组维度(M)上向量化，逐时段递推状态，输出 M×T 径流矩阵
+import numpy as np
+
+import confluence
+
+
+# 产流计算所需的参数名
+RUNOFF_PARAM_KEYS = ["kc", "c", "B", "WUM", "WLM", "WM", "SM", "EX", "KI", "KG"]
+# 汇流计算所需的参数名
+CONFLUENCE_PARAM_KEYS = ["area", "CI", "CG"]
+# 初始状态量
+STATE_KEYS = ["WU", "WL", "WD", "S0", "FR0", "QI0", "QG0"]
+
+
+# 将多组参数(字典列表，格式与配置文件中 XAJ.values.dongpu 一致)整理为数组, 单位线不等长时末尾补0
+def stack_params(param_list):
+    if isinstance(param_list, dict):
+        param_list = [param_list]
+
+    params = {}
+    for key in RUNOFF_PARAM_KEYS + CONFLUENCE_PARAM_KEYS + STATE_KEYS:
+        params[key] = np.array([float(p[key]) for p in param_list], dtype=float)
+
+    uh_len = max(len(p["UH"]) for p in param_list)
+    UH = np.zeros((len(param_list), uh_len))
+    for i, p in enumerate(param_list):
+        UH[i, :len(p["UH"])] = p["UH"]
+    params["UH"] = UH
+
+    return params
+
+
+# 从命令行参数中读取一组参数(如 x_WU, x_UH)
+def args_to_params(ins, prefix="x_"):
+    params = {}
+    for key in RUNOFF_PARAM_KEYS + CONFLUENCE_PARAM_KEYS + STATE_KEYS + ["UH"]:
+        params[key] = getattr(ins, prefix + key)
+    return params
+
+
+# 参数组数
+def param_count(params):
+    return len(params["WM"])
+
+
+# 将降雨、蒸发整理为 (M, T)
+def _broadcast_series(x, M):
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = np.broadcast_to(x, (M, x.shape[0]))
+    return x
+
+
+# 时段蒸发量计算
+def ep_calculate(P, E, WU, WL, params):
+    kc, c, WLM = params["kc"], params["c"], params["WLM"]
+    EP = kc * E
+
+    enough = WU + P >= EP
+    # 与 XAJ_Ep_calculate 一致，第三个条件中 EU 取默认值 0
+    cond2 = ~enough & (WL >= c * WLM)
+    cond3 = ~enough & ~cond2 & (c * EP <= WL) & (WL < c * WLM)
+    cond4 = ~enough & ~cond2 & ~cond3
+
+    EU = np.where(enough, EP, WU + P)
+    EL = np.where(cond2, (EP - EU) * WL / WLM, 0.0)
+    EL = np.where(cond3, c * (EP - EU), EL)
+    EL = np.where(cond4, WL, EL)
+    ED = np.where(cond4, c * (EP - EU) - WL, 0.0)
+
+    PE = np.maximum(P - EU - EL - ED, 0)
+
+    return PE, EU, EL, ED
+
+
+# 蓄满产流计算
+def w0_calculate(PE, WU, WL, WD, params):
+    WM, B = params["WM"], params["B"]
+    WMM = WM * (B + 1)
+    W0 = WU + WL + WD
+    A = WMM * (1 - np.maximum(1 - W0 / WM, 0) ** (1 / (1 + B)))
+
+    partial = PE + A < WMM
+    R = np.where(
+        partial,
+        PE - WM * ((1 - A / WMM) ** (1 + B) -
+                   np.maximum(1 - (PE + A) / WMM, 0) ** (1 + B)),
+        PE - (WM - W0))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        FR = np.where(PE == 0, 0.0, R / np.where(PE == 0, 1, PE))
+
+    return R, FR
+
+
+# 三水源划分
+# 自由水蓄量超过SM时AU的底数为负，按自由水蓄满处理(AU取MS，进入蓄满分支)
+def three_source(FR, R, PE, S0, FR0, params):
+    SM, EX, KI, KG = params["SM"], params["EX"], params["KI"], params["KG"]
+    MS = SM * (EX + 1)
+
+    wet = FR != 0
+    FR_safe = np.where(wet, FR, 1)
+    S_prev = S0 * FR0 / FR_safe
+
+    base = 1 - S_prev / SM
+    AU = MS * (1 - np.maximum(base, 0) ** (1 / (1 + EX)))
+
+    partial = PE + AU < MS
+    RS = np.where(
+        partial,
+        FR * (PE + S_prev - SM + SM * np.maximum(1 - (PE + AU) / MS, 0) ** (EX + 1)),
+        FR * (PE + S_prev - SM))
+    S = S_prev + (R - RS) / FR_safe
+
+    RS = np.where(wet, RS, 0.0)
+    S = np.where(wet, S, 0.0)
+    RI = KI * S * FR
+    RG = KG * S * FR
+
+    S0 = S * (1 - KI * KG)
+    FR0 = FR
+
+    return RS, RI, RG, S0, FR0
+
+
+# 更新土壤含水量
+def update_soil_water(P, EU, EL, ED, R, WU, WL, WD, params):
+    WUM, WLM, WM = params["WUM"], params["WLM"], params["WM"]
+
+    WU = np.minimum(WU + P - EU - R, WUM)
+    WL = np.minimum(WL - EL, WLM)
+    WD = np.minimum(WD - ED, WM - WUM - WLM)
+
+    return WU, WL, WD
+
+
+# 产流计算，P、E 为 (T,) 或 (M, T)，返回 RS、RI、RG (M, T) 及时段末状态
+# trace 为 True 时另外返回各时段末的状态 (M, T)，用于保存热启动状态
+def runoff_generation(P, E, params, state=None, trace=False):
+    M = param_count(params)
+    P = _broadcast_series(P, M)
+    E = _broadcast_series(E, M)
+    T = P.shape[1]
+
+    if state is None:
+        state = params
+    WU = np.array(state["WU"], dtype=float)
+    WL = np.array(state["WL"], dtype=float)
+    WD = np.array(state["WD"], dtype=float)
+    S0 = np.array(state["S0"], dtype=float)
+    FR0 = np.array(state["FR0"], dtype=float)
+
+    RS = np.zeros((M, T))
+    RI = np.zeros((M, T))
+    RG = np.zeros((M, T))
+
+    if trace:
+        states = {key: np.zeros((M, T)) for key in ["WU", "WL", "WD", "S0", "FR0"]}
+
+    for t in range(T):
+        Pt = P[:, t]
+        Et = E[:, t]
+
+        PE, EU, EL, ED = ep_calculate(Pt, Et, WU, WL, params)
+        R, FR = w0_calculate(PE, WU, WL, WD, params)
+        RS[:, t], RI[:, t], RG[:, t], S0, FR0 = three_source(
+            FR, R, PE, S0, FR0, params)
+        WU, WL, WD = update_soil_water(Pt, EU, EL, ED, R, WU, WL, WD, params)
+
+        if trace:
+            for key, value in zip(["WU", "WL", "WD", "S0", "FR0"], [WU, WL, WD, S0, FR0]):
+                states[key][:, t] = value
+
+    end_state = {"WU": WU, "WL": WL, "WD": WD, "S0": S0, "FR0": FR0}
+
+    if trace:
+        return RS, RI, RG, end_state, states
+
+    return RS, RI, RG, end_state
+
+
+# 汇流计算，地表径流与单位线卷积，壤中流、地下径流为线性水库
+def confluence_batch(RS, RI, RG, params, state=None):
+    if state is None:
+        state = params
+    return confluence.route(RS, RI, RG, params["UH"], params["area"], params["CI"],
+                            params["CG"], state["QI0"], state["QG0"])
+
+
+# 批量计算，返回 M×T 的流量矩阵
+def simulate(P, E, params):
+    RS, RI, RG, _ = runoff_generation(P, E, params)
+    return confluence_batch(RS, RI, RG, params)
@@ -0,0 +1,167 @@
+# 数据库读写: 进程内共用的连接池; 同一张表需要的多列一次查询读出;
+# 写入为参数化批量写入，按块 executemany(pymysql 会合并为多行 VALUES)，整体在一个事务中提交
+import time
+import atexit
+import logging
+import threading
+import contextlib
+
+
+# 每个数据库保留的空闲连接数, 可在配置 db.values.pool_size 中修改
+DEFAULT_POOL_SIZE = 4
+
+# 空闲连接, (地址, 端口, 用户, 数据库) -> [连接]
+_idle = {}
+_lock = threading.Lock()
+
+
+def _pool_key(db_config, database_key):
+    return (db_config["address"], int(db_config["port"]), db_config["user"], db_config[database_key])
+
+
+# 取得连接, db_config 为配置中的 db.values，database_key 为其中的数据库字段(database、database_monitor)
+# 有空闲连接时复用(ping 检查，断开时重连)，否则新建连接
+def connect(db_config, database_key="database"):
+    key = _pool_key(db_config, database_key)
+
+    while True:
+        with _lock:
+            conn = _idle[key].pop() if _idle.get(key) else None
+        if conn is None:
+            break
+
+        try:
+            conn.ping(reconnect=True)
+            return conn
+        except BaseException as e:
+            logging.error("drop pooled mysql connection: {}".format(e))
+            _close(conn)
+
+    # pymysql 只在需要连接 MySQL 时导入
+    import pymysql as mysql
+    conn = mysql.connect(host=db_config["address"], port=int(db_config["port"]), user=db_config["user"],
+                         password=db_config["password"], database=db_config[database_key])
+    conn.pool_key = key
+    conn.pool_size = int(db_config.get("pool_size", DEFAULT_POOL_SIZE))
+
+    return conn
+
+
+# 归还连接: 结束未提交的事务(读取时打开的一致性快照)后放回连接池，池已满时关闭
+def release(conn):
+    try:
+        conn.rollback()
+    except BaseException:
+        _close(conn)
+        return
+
+    with _lock:
+        idle = _idle.setdefault(conn.pool_key, [])
+        if len(idle) < conn.pool_size:
+            idle.append(conn)
+            return
+
+    _close(conn)
+
+
+@contextlib.contextmanager
+def connection(db_config, database_key="database"):
+    conn = connect(db_config, database_key)
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except BaseException:
+        pass
+
+
+# 关闭全部空闲连接, 进程退出时调用
+def close_all():
+    with _lock:
+        conns = [conn for idle in _idle.values() for conn in idle]
+        _idle.clear()
+
+    for conn in conns:
+        _close(conn)
+
+
+atexit.register(close_all)
+
+
+# 默认每块写入的行数
+DEFAULT_CHUNK_SIZE = 500
+
+
+# 配置文件 db.write 中的分块大小
+def write_chunk_size(config):
+    if "write" in config["db"].keys():
+        return int(config["db"]["write"]["values"].get("chunk_size", DEFAULT_CHUNK_SIZE))
+    return DEFAULT_CHUNK_SIZE
+
+
+# INSERT 语句, update_columns 不为空时为更新式插入(ON DUPLICATE KEY UPDATE)
+def insert_sql(table, columns, update_columns=None):
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        table, ", ".join(columns), ", ".join(["%s"] * len(columns)))
+    if update_columns:
+        sql += " ON DUPLICATE KEY UPDATE {}".format(
+            ", ".join(["{} = VALUES({})".format(column, column) for column in update_columns]))
+    return sql
+
+
+# 批量写入, rows 为与 columns 对应的行列表，失败时回滚并抛出异常
+# 返回写入的行数和耗时(秒)
+def bulk_upsert(conn, table, columns, rows, update_columns=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    start = time.perf_counter()
+    sql = insert_sql(table, columns, update_columns)
+
+    cursor = conn.cursor()
+    try:
+        for i in range(0, len(rows), chunk_size):
+            cursor.executemany(sql, rows[i:i + chunk_size])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    seconds = time.perf_counter() - start
+
+    print("write {} rows to {} in {:.3f}s".format(len(rows), table, seconds))
+    logging.info("write {} rows to {} in {:.3f}s".format(len(rows), table, seconds))
+
+    return len(rows), seconds
+
+
+# 一次查询读取多列, where、order_by 为 SQL 片段，返回 {列名: 按行顺序的值列表}
+def select_columns(cursor, table, columns, where=None, order_by=None):
+    sql = "SELECT {} FROM {}".format(", ".join(columns), table)
+    if where:
+        sql += " WHERE {}".format(where)
+    if order_by:
+        sql += " ORDER BY {}".format(order_by)
+
+    cursor.execute(sql)
+    rows = cursor.fetchall()
+
+    return {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+
+
+# 一次查询读取多个水库的特征值(汛限水位、死水位等), 返回 {水库类型: {列名: 值}}，同一水库取第一行
+def select_by_water_type(cursor, table, columns, water_types):
+    sql = "SELECT WATER_TYPE, {} FROM {} WHERE WATER_TYPE IN ({})".format(
+        ", ".join(columns), table, ", ".join(["'{}'".format(water_type) for water_type in water_types]))
+
+    cursor.execute(sql)
+
+    result = {}
+    for row in cursor.fetchall():
+        result.setdefault(str(row[0]), dict(zip(columns, row[1:])))
+
+    return result
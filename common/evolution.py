@@ -0,0 +1,169 @@
+# 差分进化(DE/rand/1/bin)优化器: 按种群批量评价目标函数，可多进程并行，可从检查点续算
+import os
+import json
+import logging
+import multiprocessing
+import numpy as np
+
+
+# 子进程中的目标函数，由进程池初始化时设置，避免每批候选解都重新序列化
+_worker_func = None
+
+
+def _init_worker(func):
+    global _worker_func
+    _worker_func = func
+
+
+def _eval_chunk(X):
+    return _worker_func(X)
+
+
+class DifferentialEvolution():
+    # func(X) 对 (n, d) 的候选解矩阵返回 (n,) 的目标值(越小越好)
+    # bounds 为 [(low, high), ...]; workers > 1 时候选解分块在进程池中评价
+    # checkpoint 为检查点文件(.npz)，每代结束时保存，存在时从中续算
+    # key 标识优化问题(目标函数的数据和固定参数)，与检查点中保存的不一致时不续算
+    def __init__(self, func, bounds, pop_size=None, F=0.7, CR=0.9, max_iter=100, tol=1e-8,
+                 seed=None, workers=1, checkpoint=None, key="") -> None:
+        self.func = func
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.dim = len(self.bounds)
+        self.pop_size = pop_size if pop_size else max(10 * self.dim, 20)
+        self.F = F
+        self.CR = CR
+        self.max_iter = max_iter
+        self.tol = tol
+        self.seed = seed
+        self.workers = workers if workers and workers > 0 else multiprocessing.cpu_count()
+        self.checkpoint = checkpoint
+        self.key = key
+
+        self.rng = np.random.default_rng(seed)
+        self.population = None
+        self.scores = None
+        self.iteration = 0
+        self.history = []
+
+        self.pool = None
+
+    # 评价候选解
+    def evaluate(self, X):
+        if self.pool is None or len(X) < 2:
+            scores = np.asarray(self.func(X), dtype=float)
+        else:
+            chunks = np.array_split(X, min(self.workers, len(X)))
+            results = self.pool.map(_eval_chunk, chunks)
+            scores = np.concatenate([np.asarray(r, dtype=float) for r in results])
+
+        # 计算失败(nan)的候选解视为最差
+        return np.where(np.isnan(scores), np.inf, scores)
+
+    # 初始种群, 拉丁超立方抽样
+    def init_population(self):
+        low, high = self.bounds[:, 0], self.bounds[:, 1]
+        samples = (self.rng.permuted(np.tile(np.arange(self.pop_size), (self.dim, 1)), axis=1).T +
+                   self.rng.random((self.pop_size, self.dim))) / self.pop_size
+        self.population = low + samples * (high - low)
+        self.scores = self.evaluate(self.population)
+        self.iteration = 0
+        self.history = []
+
+    # 变异和交叉，生成试验种群
+    def make_trials(self):
+        n, d = self.population.shape
+        low, high = self.bounds[:, 0], self.bounds[:, 1]
+
+        # 为每个个体选取三个互不相同且不等于自身的个体
+        idx = np.empty((n, 3), dtype=int)
+        for i in range(n):
+            candidates = np.delete(np.arange(n), i)
+            idx[i] = self.rng.choice(candidates, 3, replace=False)
+
+        mutant = self.population[idx[:, 0]] + self.F * (self.population[idx[:, 1]] - self.population[idx[:, 2]])
+
+        # 越界时在边界与父代之间随机取值
+        below = mutant < low
+        above = mutant > high
+        r = self.rng.random((n, d))
+        mutant = np.where(below, low + r * (self.population - low), mutant)
+        mutant = np.where(above, high - r * (high - self.population), mutant)
+
+        cross = self.rng.random((n, d)) < self.CR
+        cross[np.arange(n), self.rng.integers(0, d, n)] = True
+
+        return np.where(cross, mutant, self.population)
+
+    # 保存检查点
+    def save_checkpoint(self):
+        if not self.checkpoint:
+            return
+
+        tmp_path = self.checkpoint + ".tmp.npz"
+        np.savez(tmp_path, population=self.population, scores=self.scores, iteration=self.iteration,
+                 history=np.asarray(self.history, dtype=float), bounds=self.bounds, key=self.key,
+                 rng_state=json.dumps(self.rng.bit_generator.state))
+        os.replace(tmp_path, self.checkpoint)
+
+    # 读取检查点，优化问题或参数范围不一致时不续算; 续算的种群按当前目标函数重新评价
+    def load_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return False
+
+        with np.load(self.checkpoint) as data:
+            if "key" not in data.files or str(data["key"]) != self.key:
+                print("checkpoint key mismatch, restart: {}".format(self.checkpoint))
+                logging.warning("checkpoint key mismatch, restart: {}".format(self.checkpoint))
+                return False
+
+            if data["bounds"].shape != self.bounds.shape or not np.allclose(data["bounds"], self.bounds):
+                print("checkpoint bounds mismatch, restart: {}".format(self.checkpoint))
+                logging.warning("checkpoint bounds mismatch, restart: {}".format(self.checkpoint))
+                return False
+
+            self.population = data["population"]
+            self.iteration = int(data["iteration"])
+            self.history = data["history"].tolist()
+            self.rng.bit_generator.state = json.loads(str(data["rng_state"]))
+
+        self.scores = self.evaluate(self.population)
+
+        print("resume from checkpoint {}, iteration {}".format(self.checkpoint, self.iteration))
+        logging.info("resume from checkpoint {}, iteration {}".format(self.checkpoint, self.iteration))
+        return True
+
+    def run(self):
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.func,))
+
+        try:
+            if not self.load_checkpoint():
+                self.init_population()
+                self.save_checkpoint()
+
+            while self.iteration < self.max_iter:
+                trials = self.make_trials()
+                trial_scores = self.evaluate(trials)
+
+                better = trial_scores <= self.scores
+                self.population[better] = trials[better]
+                self.scores[better] = trial_scores[better]
+
+                self.iteration += 1
+                best = float(np.min(self.scores))
+                self.history.append(best)
+
+                logging.info("DE iteration {}: best {}".format(self.iteration, best))
+                self.save_checkpoint()
+
+                # 种群目标值收敛
+                if np.std(self.scores) <= self.tol * max(abs(np.mean(self.scores)), 1):
+                    break
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+        best_index = int(np.argmin(self.scores))
+        return self.population[best_index].copy(), float(self.scores[best_index])
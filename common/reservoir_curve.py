@@ -0,0 +1,123 @@
+# 水库水位-库容拟合曲线: Z(V) 为库容的多项式(配置 a..g)，V(Z) 为水位的多项式(配置 aa..gg)，库容单位为万立方米
+# 标量、数组均按 Horner 法计算; 反算按同一条多项式求根(密集查询表插值给出初值)，正反算互相一致
+import numpy as np
+
+from common import zv_table
+
+# 水库 -> 配置(setting.params)中的参数前缀
+PREFIXES = {"0": "dp", "1": "dfy", "dongpu": "dp", "dafangying": "dfy"}
+
+# 查询表的点数
+DEFAULT_POINTS = 2001
+
+# 反算的牛顿迭代次数
+NEWTON_STEPS = 4
+
+
+# Horner 法计算多项式, coeffs 按最高次项在前
+def horner(coeffs, x):
+    # 标量直接计算，避免逐时段调用时的数组开销
+    if isinstance(x, (int, float)):
+        y = float(coeffs[0])
+        for c in coeffs[1:]:
+            y = y * x + c
+        return y
+
+    y = np.full(np.shape(x), float(coeffs[0]))
+    for c in coeffs[1:]:
+        y = y * x + c
+    return y
+
+
+# 多项式的导数系数, 按最高次项在前
+def derivative(coeffs):
+    n = len(coeffs) - 1
+    return [c * (n - i) for i, c in enumerate(coeffs[:-1])]
+
+
+class ReservoirCurve():
+    # z_coeffs 为 Z(V) 系数(a..g)，v_coeffs 为 V(Z) 系数(aa..ee 或 aa..gg)，均按最高次项在前
+    # v_range 为曲线适用的库容范围，用于查询表和反算
+    def __init__(self, z_coeffs, v_coeffs, v_range) -> None:
+        self.z_coeffs = [float(x) for x in z_coeffs]
+        self.v_coeffs = [float(x) for x in v_coeffs]
+        self._dz_coeffs = derivative(self.z_coeffs)
+        self._dv_coeffs = derivative(self.v_coeffs)
+
+        self.v_min, self.v_max = float(v_range[0]), float(v_range[1])
+        self.z_min, self.z_max = self.z_of_v(self.v_min), self.z_of_v(self.v_max)
+
+        self._table = None
+
+    # 根据库容计算水位
+    def z_of_v(self, v):
+        return horner(self.z_coeffs, v)
+
+    # 根据水位计算库容(V(Z) 拟合曲线)
+    def v_of_z(self, z):
+        return horner(self.v_coeffs, z)
+
+    # 按 Z(V) 曲线取密集点生成的查询表(外延)，插值结果作为反算的初值
+    def table(self, points=DEFAULT_POINTS):
+        if self._table is None or len(self._table.v) != points:
+            v = np.linspace(self.v_min, self.v_max, points)
+            z = self.z_of_v(v)
+            if np.any(np.diff(z) <= 0):
+                raise ValueError("z(v) curve is not increasing in [{}, {}]".format(self.v_min, self.v_max))
+            self._table = zv_table.ZVTable(z, v, extrapolate=True)
+        return self._table
+
+    # 牛顿迭代求根, 初值由查询表给出
+    def _newton(self, coeffs, dcoeffs, target, x):
+        scalar = isinstance(target, (int, float))
+        for i in range(NEWTON_STEPS):
+            slope = horner(dcoeffs, x)
+            if scalar:
+                if slope == 0:
+                    break
+                x = x - (horner(coeffs, x) - target) / slope
+            else:
+                x = x - np.where(slope != 0, (horner(coeffs, x) - target) / np.where(slope != 0, slope, 1), 0)
+        return x
+
+    # 反算: 求库容使 z_of_v(库容) = z，与 z_of_v 互为反函数
+    def v_of_z_inverse(self, z):
+        z = z if isinstance(z, (int, float)) else np.asarray(z, dtype=float)
+        return self._newton(self.z_coeffs, self._dz_coeffs, z, self.table().v_of_z(z))
+
+    # 反算: 求水位使 v_of_z(水位) = v，与 v_of_z 互为反函数
+    def z_of_v_inverse(self, v):
+        v = v if isinstance(v, (int, float)) else np.asarray(v, dtype=float)
+        return self._newton(self.v_coeffs, self._dv_coeffs, v, self.table().z_of_v(v))
+
+    # 与水位库容表(ST_ZVARL_B，库容单位为万立方米)的偏差, 返回水位、库容的最大绝对偏差
+    # v_scale 为表中库容与万立方米的比值，表中库容为其他单位时给出
+    def compare(self, z_table, v_table, v_scale=1):
+        z = np.asarray(z_table, dtype=float)
+        v = np.asarray(v_table, dtype=float) / v_scale
+        inside = (v >= self.v_min) & (v <= self.v_max)
+
+        return {
+            "z": float(np.max(np.abs(self.z_of_v(v[inside]) - z[inside]))) if np.any(inside) else 0.0,
+            "v": float(np.max(np.abs(self.v_of_z(z[inside]) - v[inside]))) if np.any(inside) else 0.0,
+            "points": int(np.sum(inside)),
+        }
+
+
+# 由配置(setting.params.values 或 setting.values)建立曲线, reservoir 为 "0"/"1" 或 "dongpu"/"dafangying"
+# 库容范围默认为 0 至汛限库容的 2 倍
+def from_config(values, reservoir, v_range=None):
+    prefix = PREFIXES[str(reservoir)]
+
+    z_coeffs = [values["{}_{}".format(prefix, x)] for x in "abcdefg"]
+    v_coeffs = []
+    for x in "abcdefg":
+        key = "{}_{}".format(prefix, x * 2)
+        if key not in values.keys():
+            break
+        v_coeffs.append(values[key])
+
+    if v_range is None:
+        v_range = (0, 2 * max(values["Vxunxian_{}".format(prefix)]))
+
+    return ReservoirCurve(z_coeffs, v_coeffs, v_range)
@@ -0,0 +1,92 @@
+# 水位-库容(ZV)查询表：按 (WATER_TYPE, ZV_TYPE) 缓存，数组预先排序，整条序列一次插值
+import numpy as np
+
+
+class ZVTable():
+    def __init__(self, z_table, v_table, extrapolate=False) -> None:
+        self.z = np.asarray(z_table, dtype=float)
+        self.v = np.asarray(v_table, dtype=float)
+        self.extrapolate = extrapolate
+
+        if len(self.z) != len(self.v) or len(self.z) < 2:
+            raise ValueError("zv table size error: z {}, v {}".format(len(self.z), len(self.v)))
+
+        # 分别按水位、库容排序，供两个方向插值使用
+        order = np.argsort(self.z, kind="mergesort")
+        self._z_by_z, self._v_by_z = self.z[order], self.v[order]
+        order = np.argsort(self.v, kind="mergesort")
+        self._v_by_v, self._z_by_v = self.v[order], self.z[order]
+
+        self.z_max = float(self.z.max())
+        self.z_min = float(self.z.min())
+        self.v_max = float(self.v.max())
+        self.v_min = float(self.v.min())
+
+    # 一维线性插值, 超出范围时外延或报错(与 interp1d 的默认行为一致)
+    def _interp(self, x_new, xp, fp):
+        # 标量直接计算，避免逐时段调用时的数组开销
+        if np.isscalar(x_new):
+            x = float(x_new)
+            if xp[0] <= x <= xp[-1]:
+                return float(np.interp(x, xp, fp))
+            if not self.extrapolate:
+                if x < xp[0]:
+                    raise ValueError("A value in x_new is below the interpolation range.")
+                raise ValueError("A value in x_new is above the interpolation range.")
+            if x < xp[0]:
+                return float(fp[0] + (x - xp[0]) * ((fp[1] - fp[0]) / (xp[1] - xp[0])))
+            return float(fp[-1] + (x - xp[-1]) * ((fp[-1] - fp[-2]) / (xp[-1] - xp[-2])))
+
+        x = np.asarray(x_new, dtype=float)
+        y = np.interp(x, xp, fp)
+
+        if self.extrapolate:
+            low = x < xp[0]
+            high = x > xp[-1]
+            if np.any(low):
+                slope = (fp[1] - fp[0]) / (xp[1] - xp[0])
+                y = np.where(low, fp[0] + (x - xp[0]) * slope, y)
+            if np.any(high):
+                slope = (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+                y = np.where(high, fp[-1] + (x - xp[-1]) * slope, y)
+        else:
+            if np.any(x < xp[0]):
+                raise ValueError("A value in x_new is below the interpolation range.")
+            if np.any(x > xp[-1]):
+                raise ValueError("A value in x_new is above the interpolation range.")
+
+        if y.ndim == 0:
+            return float(y)
+        return y
+
+    # 根据水位插值库容
+    def v_of_z(self, z):
+        return self._interp(z, self._z_by_z, self._v_by_z)
+
+    # 根据库容插值水位
+    def z_of_v(self, v):
+        return self._interp(v, self._v_by_v, self._z_by_v)
+
+    # 根据库容插值水位, 超过最大库容时取最大水位
+    def z_of_v_capped(self, v):
+        v = np.asarray(v, dtype=float)
+        z = self.z_of_v(np.minimum(v, self.v_max))
+        return np.where(v > self.v_max, self.z_max, z)
+
+
+# 进程内缓存, 键为 (WATER_TYPE, ZV_TYPE)
+_zv_tables = {}
+
+
+def get_zv_table(water_type, zv_type):
+    return _zv_tables.get((str(water_type), str(zv_type)))
+
+
+def set_zv_table(water_type, zv_type, z_table, v_table):
+    table = ZVTable(z_table, v_table)
+    _zv_tables[(str(water_type), str(zv_type))] = table
+    return table
+
+
+def clear_zv_tables():
+    _zv_tables.clear()
@@ -0,0 +1,356 @@
+# 常驻计算服务: 在一个进程中提供预报、防洪调度、供水和时间序列预测的计算入口，
+# 通过本地HTTP接口调用，模块导入、水位库容表、数据库连接和推理模型在各次请求之间保持加载
+#
+# POST /run/<name>  请求体为参数(与命令行参数同名)的JSON对象，返回 {"complete": true, "seconds": 耗时, "result": 结果}
+# GET  /models      可调用的计算入口
+# GET  /health      服务状态
+#
+# xaj_rolling 为实时预报滚动计算(XAJ/rolling.py): 每次请求读取已有的观测(不等待新数据)，窗口移动到最新有数据的时刻
+# (给出 until 时不超过 until)，有变化时写入后返回; 同一 type、batch、start 的后续请求在常驻内存的窗口上继续滚动
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import importlib
+import datetime
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+sys.path.append(ROOT)
+for directory in ["XAJ", "FloodControl", "Supply", "Arima", "VMD_APSO_LSTM"]:
+    sys.path.append(os.path.join(ROOT, directory))
+
+log_file_path = 'forecast_service.log'
+# 日志配置
+logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+# 请求参数错误, 返回400
+class RequestError(ValueError):
+    pass
+
+
+def run_xaj(module, args):
+    model = module.XAJ_PR(args)
+    model.load_data_from_monitor_db()
+    model.load_data_from_db()
+    model.XAJ_calculate()
+    model.PR_calculate()
+    model.write_data_to_db()
+    return {"length": model.length}
+
+
+# 集合预报: ensemble_batches 为各成员的情景降雨批次(列表或逗号分隔)，未给出时按配置扰动预报降雨
+def run_xaj_ensemble(module, args):
+    batches = getattr(args, "ensemble_batches", None)
+    if isinstance(batches, str):
+        batches = [batch.strip() for batch in batches.split(",") if batch.strip()]
+
+    model = module.XAJ_PR(args)
+    model.load_data_from_monitor_db()
+    model.load_data_from_db()
+    if batches:
+        model.load_ensemble_from_db(batches)
+    model.ensemble_calculate()
+    model.write_ensemble_to_db()
+    return {"length": model.length, "columns": model.ensemble_columns}
+
+
+# 实时预报滚动计算的窗口, (type, batch, start) -> RollingForecast
+ROLLING = {}
+
+
+def run_xaj_rolling(module, args):
+    for name in ["type", "batch", "start"]:
+        if getattr(args, name, None) is None:
+            raise RequestError("xaj_rolling need {}".format(name))
+
+    until = getattr(args, "until", None)
+    if until is not None:
+        try:
+            datetime.datetime.strptime(until, "%Y-%m-%d %H:%M:%S")
+        except (TypeError, ValueError):
+            raise RequestError("until should be %Y-%m-%d %H:%M:%S, got {}".format(until))
+
+    key = (args.type, args.batch, args.start)
+    if key not in ROLLING.keys():
+        rolling = importlib.import_module("rolling")
+
+        model = module.XAJ_PR(args)
+        model.load_data_from_monitor_db()
+        model.load_data_from_db()
+        ROLLING[key] = rolling.RollingForecast(model)
+        ROLLING[key].publish()
+
+    forecast = ROLLING[key]
+    changed = forecast.catch_up(end_time=until)
+    return {"start": forecast.model.ins.start, "changed": changed, "rows": len(forecast.written)}
+
+
+def run_flood_static(module, args):
+    flood = module.FloodControlStatic(args)
+    flood.update(args)
+    flood.load_data_from_monitor_db()
+    flood.read_data_from_db()
+    flood.run()
+    flood.write_data_to_db()
+    return flood.result
+
+
+def run_flood_dynamic(module, args):
+    flood = module.FloodControlStatic(args)
+    flood.load_data_from_monitor_db()
+    flood.read_data_from_db()
+    flood.run()
+    flood.write_data_to_db()
+    return flood.result
+
+
+def run_optimize_supply(module, args):
+    ts = module.TypicalSupply(args)
+    ts.load_data_from_monitor_db()
+    ts.load_data_from_db()
+    ts.run()
+    ts.write_data_to_db()
+    return ts.result
+
+
+def run_typical_supply(module, args):
+    ts = module.TypicalSupply(args)
+    ts.load_data_from_db()
+    ts.run()
+    ts.write_data_to_db()
+    return ts.result
+
+
+def run_supply(module, args):
+    jsw = module.Supply(args=args)
+    jsw.run()
+    jsw.write_data_to_db()
+    return jsw.result
+
+
+def run_regular_supply(module, args):
+    supply = module.Supply(args)
+    supply.load_data_from_monitor_db()
+    result = supply.run()
+    supply.write_data_to_db()
+    return result
+
+
+# 多日逐日计算, horizon_days 为计算天数(默认取配置)，返回两库的逐日过程、可用天数和预警标志
+def run_regular_supply_horizon(module, args):
+    days = getattr(args, "horizon_days", None)
+    if days is not None and (not isinstance(days, int) or days < 1):
+        raise RequestError("horizon_days should be a positive integer, got {}".format(days))
+
+    supply = module.Supply(args)
+    dp, dfy = supply.run_horizon(days)
+    return {name: {key: value.tolist() if hasattr(value, "tolist") else value for key, value in result.items()}
+            for name, result in [("dp", dp), ("dfy", dfy)]}
+
+
+def run_arima(module, args):
+    arima = module.ARIMA(args)
+    arima.read_data_from_db()
+    arima.arima_predict(arima.data)
+    arima.write_data_to_db()
+    return arima.result
+
+
+def run_vmd(module, args):
+    vmd = module.VMD_APSO_LSTM(args)
+    vmd.read_data_from_db()
+    vmd.inference()
+    vmd.write_data_to_db()
+    return vmd.result
+
+
+# 计算入口: 名称 -> (模块, 计算流程)
+ENTRIES = {
+    "xaj": ("XAJ_PR", run_xaj),
+    "xaj_real": ("XAJ_PR_REAL", run_xaj),
+    "xaj_ensemble": ("XAJ_PR", run_xaj_ensemble),
+    "xaj_rolling": ("XAJ_PR_REAL", run_xaj_rolling),
+    "flood_static": ("water_control_static", run_flood_static),
+    "flood_dynamic": ("water_control_dynamic", run_flood_dynamic),
+    "optimize_supply": ("optimize_supply", run_optimize_supply),
+    "typical_supply": ("typical_year_supply_water", run_typical_supply),
+    "supply": ("supply_water", run_supply),
+    "regular_supply": ("regular_supply", run_regular_supply),
+    "regular_supply_horizon": ("regular_supply", run_regular_supply_horizon),
+    "arima": ("arima", run_arima),
+    "vmd": ("vmd_apso_lstm", run_vmd),
+}
+
+
+class ForecastService():
+    def __init__(self, args) -> None:
+        self.args = args
+        self.config = None
+        self.defaults = {}
+        self.modules = {}
+        # 各入口共用全局状态(数据库连接池、水位库容表等)，计算逐个进行
+        self.lock = threading.Lock()
+        self.count = 0
+        self.start_time = time.time()
+
+        self.load_config()
+
+    def load_config(self):
+        # 从配置文件中读取配置
+        with open(self.args.config, 'r', encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        if "models" not in self.config.keys():
+            print("config models is error")
+            logging.error("config models is error")
+            exit(1)
+
+        # 默认参数中的配置文件路径相对于服务配置文件
+        base = os.path.dirname(os.path.abspath(self.args.config))
+        for name, values in self.config["models"]["values"].items():
+            if name not in ENTRIES.keys():
+                print("unknown model {} in config".format(name))
+                logging.error("unknown model {} in config".format(name))
+                continue
+
+            values = dict(values)
+            if "config" in values.keys():
+                values["config"] = os.path.normpath(os.path.join(base, values["config"]))
+            self.defaults[name] = values
+
+    # 导入计算模块, 已导入的直接返回
+    def module(self, name):
+        if name not in self.modules.keys():
+            start = time.perf_counter()
+            self.modules[name] = importlib.import_module(ENTRIES[name][0])
+
+            print("import {} in {:.3f}s".format(ENTRIES[name][0], time.perf_counter() - start))
+            logging.info("import {} in {:.3f}s".format(ENTRIES[name][0], time.perf_counter() - start))
+        return self.modules[name]
+
+    # 启动时预先导入的模块
+    def preload(self):
+        for name in self.config["server"]["values"].get("preload", []):
+            try:
+                self.module(name)
+            except Exception as e:
+                print("preload {} error: {}".format(name, e))
+                logging.error("preload {} error: {}".format(name, e))
+
+    # 执行一次计算, params 为请求参数，返回 (是否完成, 结果或错误信息, 耗时)
+    def run(self, name, params):
+        args = argparse.Namespace(**dict(self.defaults.get(name, {}), **params))
+
+        print(args.__dict__)
+        logging.info("run {}: {}".format(name, args.__dict__))
+
+        with self.lock:
+            start = time.perf_counter()
+            try:
+                result = ENTRIES[name][1](self.module(name), args)
+                complete = True
+            except RequestError:
+                raise
+            except SystemExit as e:
+                # 计算模块中数据缺失等情况调用 exit() 结束
+                result = "exit {}".format(e.code)
+                complete = False
+            except Exception as e:
+                result = str(e)
+                complete = False
+            seconds = time.perf_counter() - start
+            self.count += 1
+
+        if complete:
+            logging.info("run {} complete in {:.3f}s".format(name, seconds))
+        else:
+            logging.error("run {} error: {}".format(name, result))
+
+        return complete, result, seconds
+
+    def status(self):
+        return {"uptime": time.time() - self.start_time, "count": self.count, "loaded": list(self.modules.keys())}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, self.service.status())
+        elif self.path == "/models":
+            self.send_json(200, {name: ENTRIES[name][0] for name in ENTRIES.keys()})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        name = self.path[len("/run/"):] if self.path.startswith("/run/") else None
+        if name not in ENTRIES.keys():
+            self.send_json(404, {"error": "unknown model {}".format(name)})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length).decode("utf-8")) if length > 0 else {}
+        except ValueError as e:
+            self.send_json(400, {"error": "bad request: {}".format(e)})
+            return
+
+        try:
+            complete, result, seconds = self.service.run(name, params)
+        except RequestError as e:
+            logging.error("run {} bad request: {}".format(name, e))
+            self.send_json(400, {"error": "bad request: {}".format(e)})
+            return
+
+        if complete:
+            self.send_json(200, {"complete": True, "seconds": seconds, "result": result})
+        else:
+            self.send_json(500, {"complete": False, "seconds": seconds, "error": result})
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s" % (self.address_string(), format % args))
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser("Forecast service")
+        parser.add_argument('--config', type=str, default='./service_config.json', help='config file')
+        parser.add_argument("--host", type=str, default=None, help="listen address")
+        parser.add_argument("--port", type=int, default=None, help="listen port")
+
+        args = parser.parse_args()
+
+        print(args.__dict__)
+        logging.info(args.__dict__)
+
+        service = ForecastService(args)
+        service.preload()
+
+        host = args.host if args.host else service.config["server"]["values"]["host"]
+        port = args.port if args.port else service.config["server"]["values"]["port"]
+
+        ServiceHandler.service = service
+        server = HTTPServer((host, port), ServiceHandler)
+
+        print("listen on {}:{}".format(host, port))
+        logging.info("listen on {}:{}".format(host, port))
+
+        server.serve_forever()
+    except Exception as e:
+        print(e)
+        logging.error(e)
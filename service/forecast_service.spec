@@ -0,0 +1,48 @@
+# -*- mode: python ; coding: utf-8 -*-
+import os
+
+
+block_cipher = None
+
+
+a = Analysis(
+    ['forecast_service.py'],
+    pathex=[os.path.abspath(os.path.join(SPECPATH, '..'))] + [
+        os.path.abspath(os.path.join(SPECPATH, '..', directory))
+        for directory in ['XAJ', 'FloodControl', 'Supply', 'Arima', 'VMD_APSO_LSTM']],
+    binaries=[],
+    datas=[],
+    hiddenimports=['XAJ_PR', 'XAJ_PR_REAL', 'water_control_static', 'water_control_dynamic', 'optimize_supply',
+                   'typical_year_supply_water', 'supply_water', 'regular_supply', 'arima', 'vmd_apso_lstm', 'rolling'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[],
+    win_no_prefer_redirects=False,
+    win_private_assemblies=False,
+    cipher=block_cipher,
+    noarchive=False,
+)
+pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    [],
+    name='forecast_service',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=True,
+    upx_exclude=[],
+    runtime_tmpdir=None,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
@@ -0,0 +1,120 @@
+# 各计算入口的启动耗时: 每个入口模块在新的解释器中导入 repeat 次，报告最小值和中位数;
+# --detail 列出导入最慢的依赖包，--budget 设置耗时上限(秒)，有入口超出时返回码为1
+import os
+import sys
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# 计算入口: 名称 -> (目录, 模块)
+ENTRIES = {
+    "xaj": ("XAJ", "XAJ_PR"),
+    "xaj_real": ("XAJ", "XAJ_PR_REAL"),
+    "calibration": ("XAJ", "calibration"),
+    "flood_static": ("FloodControl", "water_control_static"),
+    "flood_dynamic": ("FloodControl", "water_control_dynamic"),
+    "optimize_supply": ("Supply", "optimize_supply"),
+    "typical_supply": ("Supply", "typical_year_supply_water"),
+    "supply": ("Supply", "supply_water"),
+    "regular_supply": ("Supply", "regular_supply"),
+    "arima": ("Arima", "arima"),
+    "vmd": ("VMD_APSO_LSTM", "vmd_apso_lstm"),
+}
+
+CODE = """import sys, time
+sys.path.insert(0, {directory!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+# 在临时目录中运行(模块导入时创建的日志文件不写入仓库), 返回 (返回码, 标准输出, 标准错误)
+def run_python(args, cwd):
+    process = subprocess.run([sys.executable] + args, cwd=cwd, capture_output=True, text=True)
+    return process.returncode, process.stdout, process.stderr
+
+
+# 导入耗时(秒)列表, 导入失败时返回 (None, 错误信息)
+def import_time(directory, module, repeat, cwd):
+    code = CODE.format(directory=os.path.abspath(os.path.join(ROOT, directory)), module=module)
+
+    times = []
+    for i in range(repeat):
+        returncode, stdout, stderr = run_python(["-c", code], cwd)
+        if returncode != 0:
+            lines = stderr.strip().splitlines()
+            return None, lines[-1] if lines else "exit {}".format(returncode)
+        times.append(float(stdout.strip().splitlines()[-1]))
+
+    return times, None
+
+
+# 入口模块直接导入的依赖包中最慢的 top 个, 返回 [(包, 累计耗时秒)]
+# -X importtime 按导入完成的顺序输出，缩进表示层级，子模块在其上层模块之前输出
+def heaviest(directory, module, top, cwd):
+    code = "import sys\nsys.path.insert(0, {!r})\nimport {}".format(
+        os.path.abspath(os.path.join(ROOT, directory)), module)
+    _, _, stderr = run_python(["-X", "importtime", "-c", code], cwd)
+
+    rows = []
+    for line in stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        rows.append((len(name) - len(name.lstrip()), name.strip(), int(fields[1]) / 1e6))
+
+    packages = []
+    for i in range(len(rows) - 1, -1, -1):
+        if rows[i][0] == 1 and rows[i][1] == module:
+            j = i - 1
+            while j >= 0 and rows[j][0] > 1:
+                if rows[j][0] == 3:
+                    packages.append((rows[j][1], rows[j][2]))
+                j -= 1
+            break
+
+    packages.sort(key=lambda x: -x[1])
+    return packages[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Import time of model entry points")
+    parser.add_argument("--entry", type=str, action="append", default=None,
+                        help="entry name, repeatable, default all: {}".format(", ".join(ENTRIES.keys())))
+    parser.add_argument("--repeat", type=int, default=5, help="imports per entry, each in a new interpreter")
+    parser.add_argument("--detail", type=int, default=0, help="list the N slowest imported packages")
+    parser.add_argument("--budget", type=float, default=None, help="max import time in seconds")
+
+    args = parser.parse_args()
+
+    names = args.entry if args.entry else list(ENTRIES.keys())
+    over_budget = []
+
+    with tempfile.TemporaryDirectory() as cwd:
+        print("{:<16}{:<28}{:>10}{:>10}".format("entry", "module", "min(s)", "median(s)"))
+
+        for name in names:
+            directory, module = ENTRIES[name]
+            times, error = import_time(directory, module, args.repeat, cwd)
+
+            if times is None:
+                print("{:<16}{:<28}  {}".format(name, module, error))
+                continue
+
+            print("{:<16}{:<28}{:>10.3f}{:>10.3f}".format(name, module, min(times), statistics.median(times)))
+
+            if args.detail > 0:
+                for package, seconds in heaviest(directory, module, args.detail, cwd):
+                    print("{:<16}  {:<26}{:>10.3f}".format("", package, seconds))
+
+            if args.budget is not None and min(times) > args.budget:
+                over_budget.append(name)
+
+    if len(over_budget) > 0:
+        print("over budget {}s: {}".format(args.budget, ", ".join(over_budget)))
+        exit(1)
@@ -0,0 +1,51 @@
+# 水位库容拟合曲线的检查: 把 Supply 配置中的 Z(V)、V(Z) 多项式与监测库中当前版本的水位库容表(ST_ZVARL_B)对比，
+# 报告两个方向的最大偏差，以及正反算(z_of_v 与 v_of_z_inverse)的一致性
+import os
+import sys
+import argparse
+import json
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "FloodControl"))
+
+from common import reservoir_curve
+
+import water_control_static
+
+# 水库类型 -> 名称
+RESERVOIRS = {"0": "dongpu", "1": "dafangying"}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Reservoir curve check")
+    parser.add_argument('--config', type=str, default=os.path.join(ROOT, "Supply", "optimize_supply.json"),
+                        help='config file of Supply')
+    parser.add_argument('--flood_config', type=str, default=os.path.join(ROOT, "FloodControl", "water_control_config.json"),
+                        help='config file of FloodControl, for the zv table')
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding="utf-8") as f:
+        config = json.load(f)
+    setting = config["setting"]
+    values = setting["params"]["values"] if "params" in setting.keys() else setting["values"]
+
+    print("{:<6}{:<12}{:>8}{:>12}{:>14}{:>14}".format("type", "zv type", "points", "max dz", "max dv", "inverse dz"))
+
+    for _type in RESERVOIRS.keys():
+        curve = reservoir_curve.from_config(values, _type)
+
+        # 当前版本的水位库容表, 库容单位为万立方米(与曲线相同)
+        flood = water_control_static.FloodControlStatic(argparse.Namespace(config=args.flood_config, type=_type))
+        flood.load_data_from_monitor_db()
+
+        deviation = curve.compare(flood.zv.z, flood.zv.v, v_scale=1)
+
+        z = np.linspace(curve.z_min, curve.z_max, 101)
+        inverse = float(np.max(np.abs(curve.z_of_v(curve.v_of_z_inverse(z)) - z)))
+
+        print("{:<6}{:<12}{:>8}{:>12.4f}{:>14.3f}{:>14.2e}".format(
+            _type, str(flood.zv_type), deviation["points"], deviation["z"], deviation["v"], inverse))
@@ -0,0 +1,128 @@
+# 调洪演算求解的对比: 对数据库中的全部设计洪水场次，分别用原0.01步长试算和 routing.solve_outflow 计算，
+# 报告两种方法的耗时和下泄流量、水位的最大差值; --method、--step、--tolerance 覆盖配置文件中 setting.routing 的求解参数
+import os
+import sys
+import time
+import argparse
+import json
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "FloodControl"))
+
+from common import db
+
+import routing
+import water_control_static
+
+# 水库类型 -> 配置中的起调参数
+RESERVOIRS = {"0": "dongpu", "1": "dafangying"}
+
+
+# 原试算方法: 从起点每次增加0.01，直到水量平衡残差不大于0.01
+def trial_outflow(Q1, Q2, v1, q1, t, v_of_q, q_start, q_max=None, tol=routing.DEFAULT_TOLERANCE,
+                  step=routing.DEFAULT_STEP, breaks=()):
+    q2 = q_start
+    v2 = v_of_q(q2)
+    while (Q1 + Q2) + 2 * 100000000 * (v1 - v2) / (t * 3600) - q1 - q2 > 0.01 and \
+            (Q1 + Q2) + 2 * 100000000 * (v1 - v2) / (t * 3600) - q1 >= q2:
+        q2 += 0.01
+        v2 = v_of_q(q2)
+    return q2
+
+
+# 用给定的求解方法计算一次调洪过程, solver 不为空时代替 routing.solve_outflow; 返回 (z, q, 耗时)
+def route(flood, args, method, solver=None):
+    flood.config["setting"]["routing"]["values"]["method"] = method
+    solve_outflow = routing.solve_outflow
+    if solver is not None:
+        routing.solve_outflow = solver
+    try:
+        flood.update(args)
+        start = time.perf_counter()
+        if args.type == "0":
+            z, v, q = flood.cal_flood_dongpu(
+                flood.z_table, flood.v_table, flood.z, flood.v, flood.q, flood.flood_value, flood.flood_time)
+        else:
+            z, v, q = flood.cal_flood_dafangying(
+                flood.z_table, flood.v_table, flood.z, flood.v, flood.q, flood.flood_value, flood.flood_time)
+        seconds = time.perf_counter() - start
+    finally:
+        routing.solve_outflow = solve_outflow
+    return z, q, seconds
+
+
+# 对比一个场次, 返回 (试算耗时, 求解耗时, 下泄流量最大差值, 水位最大差值)
+def compare(flood, args, method):
+    z_trial, q_trial, t_trial = route(flood, args, "grid", trial_outflow)
+    z_solver, q_solver, t_solver = route(flood, args, method)
+
+    dq = max(abs(a - b) for a, b in zip(q_trial, q_solver))
+    dz = max(abs(a - b) for a, b in zip(z_trial, z_solver))
+    return t_trial, t_solver, dq, dz
+
+
+# 设计洪水表中某水库的全部场次
+def load_scenes(config, _type):
+    conn = db.connect(config["db"]["values"], "database")
+    cursor = conn.cursor()
+
+    sql = "SELECT DISTINCT SCENE FROM {} WHERE TYPE = '{}'".format(config["db"]["in"]["values"]["rdfh"], _type)
+    cursor.execute(sql)
+    scenes = [str(row[0]) for row in cursor.fetchall()]
+
+    cursor.close()
+    db.release(conn)
+    return scenes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Flood routing solver benchmark")
+    parser.add_argument('--config', type=str, default=os.path.join(ROOT, "FloodControl", "water_control_config.json"),
+                        help='config file of FloodControl')
+    parser.add_argument("--type", type=str, action="append", default=None, help="reservoir type, 0 or 1, default both")
+    parser.add_argument("--scene", type=str, action="append", default=None, help="scene, default all in the database")
+    parser.add_argument("--max_out_users", type=float, default=100000, help="max outflow")
+    parser.add_argument("--method", type=str, default=None, help="solver method, grid, brent or table")
+    parser.add_argument("--step", type=float, default=None, help="trial step of grid method")
+    parser.add_argument("--tolerance", type=float, default=None, help="tolerance of brent method")
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding="utf-8") as f:
+        config = json.load(f)
+
+    print("{:<6}{:<16}{:>12}{:>12}{:>10}{:>12}{:>12}".format(
+        "type", "scene", "trial(s)", "solver(s)", "speedup", "max dq", "max dz"))
+
+    total_trial = 0
+    total_solver = 0
+    for _type in (args.type if args.type else list(RESERVOIRS.keys())):
+        setting = config["setting"][RESERVOIRS[_type]]["values"]
+        scenes = args.scene if args.scene else load_scenes(config, _type)
+
+        for scene in scenes:
+            scene_args = argparse.Namespace(config=args.config, type=_type, scene=scene, z=setting["z"], v=setting["v"],
+                                            q=setting["q"], max_out_users=args.max_out_users,
+                                            max_out_culvert=setting["max_out_culvert"])
+
+            flood = water_control_static.FloodControlStatic(scene_args)
+            method, step, tol = routing.settings(flood.config)
+            method = method if args.method is None else args.method
+            flood.config["setting"]["routing"] = {"values": {
+                "step": step if args.step is None else args.step,
+                "tolerance": tol if args.tolerance is None else args.tolerance}}
+            flood.load_data_from_monitor_db()
+            flood.read_data_from_db()
+
+            t_trial, t_solver, dq, dz = compare(flood, scene_args, method)
+            total_trial += t_trial
+            total_solver += t_solver
+
+            print("{:<6}{:<16}{:>12.4f}{:>12.4f}{:>10.1f}{:>12.4f}{:>12.4f}".format(
+                _type, scene, t_trial, t_solver, t_trial / t_solver, dq, dz))
+
+    if total_solver > 0:
+        print("total: trial {:.3f}s, solver {:.3f}s, speedup {:.1f}".format(
+            total_trial, total_solver, total_trial / total_solver))